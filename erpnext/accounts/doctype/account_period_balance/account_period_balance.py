@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import now
+from frappe.model.document import Document
+
+class AccountPeriodBalance(Document):
+	pass
+
+def add_gl_entries(gl_entries):
+	'''Add the amounts of newly inserted GL Entries to the monthly balances'''
+	names = [d.name for d in gl_entries]
+	if names:
+		update_period_balance("gle.name in ({0})".format(", ".join(["%s"] * len(names))), names)
+
+def remove_vouchers(vouchers):
+	'''Deduct the GL Entries of the given (voucher_type, voucher_no) from the monthly
+	balances, must be called before the GL Entries are deleted'''
+	if vouchers:
+		update_period_balance("(gle.voucher_type, gle.voucher_no) in ({0})".format(
+			", ".join(["(%s, %s)"] * len(vouchers))), [v for d in vouchers for v in d], factor=-1)
+
+def rebuild_account_period_balance():
+	'''Rebuild the monthly balances from all GL Entries'''
+	frappe.db.sql("delete from `tabAccount Period Balance`")
+	update_period_balance("1=1")
+
+def update_period_balance(condition, values=None, factor=1):
+	'''Add (or deduct if factor is -1) the totals of the GL Entries matching `condition`
+	per account, cost center, party and month.
+
+	Rows are named by a hash of their key, so the totals are added to the existing
+	row of the key if any.'''
+	frappe.db.sql("""insert into `tabAccount Period Balance`
+			(name, creation, modified, modified_by, owner, docstatus, account, cost_center, party_type,
+			party, company, period_start_date, is_period_closing_voucher,
+			debit, credit, debit_in_account_currency, credit_in_account_currency)
+		select md5(concat_ws('|', gle.account, ifnull(gle.cost_center, ''), ifnull(gle.party_type, ''),
+				ifnull(gle.party, ''), gle.company, date_format(gle.posting_date, '%%Y-%%m-01'),
+				if(gle.voucher_type = 'Period Closing Voucher', 1, 0))),
+			%s, %s, 'Administrator', 'Administrator', 0, gle.account, gle.cost_center,
+			gle.party_type, gle.party, gle.company, date_format(gle.posting_date, '%%Y-%%m-01'),
+			if(gle.voucher_type = 'Period Closing Voucher', 1, 0),
+			%s * sum(gle.debit), %s * sum(gle.credit),
+			%s * sum(gle.debit_in_account_currency), %s * sum(gle.credit_in_account_currency)
+		from `tabGL Entry` gle
+		where {condition}
+		group by gle.account, gle.cost_center, gle.party_type, gle.party, gle.company,
+			date_format(gle.posting_date, '%%Y-%%m-01'), if(gle.voucher_type = 'Period Closing Voucher', 1, 0)
+		on duplicate key update
+			modified = values(modified),
+			debit = debit + values(debit),
+			credit = credit + values(credit),
+			debit_in_account_currency = debit_in_account_currency + values(debit_in_account_currency),
+			credit_in_account_currency = credit_in_account_currency + values(credit_in_account_currency)
+		""".format(condition=condition), [now(), now()] + [factor] * 4 + list(values or []))
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import frappe
+import unittest
+from frappe.utils import flt
+from erpnext.accounts.utils import get_balance_on
+from erpnext.accounts.doctype.journal_entry.test_journal_entry import make_journal_entry
+from erpnext.accounts.doctype.account_period_balance.account_period_balance import rebuild_account_period_balance
+
+class TestAccountPeriodBalance(unittest.TestCase):
+	def test_balance_from_period_balance(self):
+		jv_list = []
+		for posting_date, amount in (("2013-01-20", 100), ("2013-02-05", 200),
+			("2013-02-25", 400), ("2013-03-10", 800)):
+			jv_list.append(make_journal_entry("_Test Account Cost for Goods Sold - _TC",
+				"_Test Bank - _TC", amount, posting_date=posting_date, submit=True))
+
+		self.check_balances()
+
+		jv_list[1].cancel()
+		self.check_balances()
+
+		rebuild_account_period_balance()
+		self.check_balances()
+
+	def check_balances(self):
+		for date in ("2013-01-31", "2013-02-15", "2013-02-28", "2013-03-31"):
+			self.assertEqual(get_balance_on("_Test Bank - _TC", date),
+				get_gl_balance("_Test Bank - _TC", date))
+			self.assertEqual(get_balance_on("Bank Accounts - _TC", date, in_account_currency=False),
+				get_gl_balance("Bank Accounts - _TC", date))
+			self.assertEqual(get_balance_on("_Test Account Cost for Goods Sold - _TC", date),
+				get_gl_balance("_Test Account Cost for Goods Sold - _TC", date, "2013-01-01"))
+
+def get_gl_balance(account, date, from_date=None):
+	lft, rgt = frappe.db.get_value("Account", account, ["lft", "rgt"])
+	return flt(frappe.db.sql("""select sum(gle.debit) - sum(gle.credit)
+		from `tabGL Entry` gle, `tabAccount` ac
+		where ac.name = gle.account and ac.lft >= %s and ac.rgt <= %s
+		and gle.posting_date <= %s and gle.posting_date >= %s
+		and (%s is null or gle.voucher_type != 'Period Closing Voucher')""",
+		(lft, rgt, date, from_date or "1900-01-01", from_date))[0][0])
@@ -1,9 +1,11 @@
 # Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
 # License: GNU General Public License v3. See license.txt
 
-from __future__ import unicode_literals
+from __future__ import unicode_literals, print_function
 
-import frappe, unittest
+import frappe, unittest, time
+from frappe.utils import cint
+from erpnext.accounts.utils import get_fiscal_year, get_fiscal_year_index
 
 test_records = frappe.get_test_records('Fiscal Year')
 test_ignore = ["Company"]
@@ -21,3 +23,65 @@ class TestFiscalYear(unittest.TestCase):
 		fy.insert()
 		self.assertEqual(fy.year_end_date, '2001-03-31')
 
+
+	def test_fiscal_year_lookup(self):
+		fiscal_year = frappe.get_doc("Fiscal Year", "_Test Fiscal Year 2013")
+
+		self.assertEqual(get_fiscal_year("2013-01-01", company="_Test Company")[0], fiscal_year.name)
+		self.assertEqual(get_fiscal_year("2013-12-31", company="_Test Company")[0], fiscal_year.name)
+		self.assertEqual(get_fiscal_year(fiscal_year="_Test Fiscal Year 2013")[1], fiscal_year.year_start_date)
+
+		# index is rebuilt when a fiscal year is disabled
+		fiscal_year.disabled = 1
+		fiscal_year.save()
+		self.assertRaises(frappe.ValidationError, get_fiscal_year, "2013-06-01", verbose=0)
+
+		fiscal_year.disabled = 0
+		fiscal_year.save()
+		self.assertEqual(get_fiscal_year("2013-06-01")[0], fiscal_year.name)
+
+	def test_fiscal_year_lookup_by_index(self):
+		# lookups in the index find the same years as a walk over the years
+		dates = get_dates(1000)
+		fiscal_years = get_fiscal_years()
+
+		get_fiscal_year_index("_Test Company")
+		for date in dates:
+			self.assertEqual(get_fiscal_year(date, company="_Test Company")[0],
+				find_fiscal_year(date, fiscal_years))
+
+def get_dates(count):
+	from frappe.utils import add_days
+	return [add_days("2013-01-01", i % 1000) for i in range(count)]
+
+def get_fiscal_years():
+	return frappe.db.sql("""select name, year_start_date, year_end_date
+		from `tabFiscal Year` where disabled = 0 order by year_start_date desc""", as_dict=1)
+
+def find_fiscal_year(date, fiscal_years):
+	"""Lookup as done before the index, a walk over the years"""
+	from frappe.utils import getdate
+
+	date = getdate(date)
+	for fy in fiscal_years:
+		if getdate(fy.year_start_date) <= date <= getdate(fy.year_end_date):
+			return fy.name
+
+def benchmark(count=20000):
+	'''Print the time taken to look up the fiscal years of `count` dates, with the index
+	and with a walk over the years.
+
+	bench execute erpnext.accounts.doctype.fiscal_year.test_fiscal_year.benchmark --args "[100000]"'''
+	dates = get_dates(cint(count))
+	fiscal_years = get_fiscal_years()
+
+	start = time.time()
+	for date in dates:
+		find_fiscal_year(date, fiscal_years)
+	print("linear walk: {0} lookups in {1:.3f}s".format(len(dates), time.time() - start))
+
+	get_fiscal_year_index("_Test Company")
+	start = time.time()
+	for date in dates:
+		get_fiscal_year(date, company="_Test Company")
+	print("get_fiscal_year: {0} lookups in {1:.3f}s".format(len(dates), time.time() - start))
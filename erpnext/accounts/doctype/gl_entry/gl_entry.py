@@ -26,28 +26,13 @@ class GLEntry(Document):
 			self.validate_party()
 			self.validate_currency()
 
-
-	def on_update_with_args(self, adv_adj, update_outstanding = 'Yes', from_repost=False):
-		if not from_repost:
-			self.validate_account_details(adv_adj)
-			check_freezing_date(self.posting_date, adv_adj)
-
-		validate_frozen_account(self.account, adv_adj)
-		validate_balance_type(self.account, adv_adj)
-
-		# Update outstanding amt on against voucher
-		if self.against_voucher_type in ['Journal Entry', 'Sales Invoice', 'Purchase Invoice', 'Fees'] \
-			and self.against_voucher and update_outstanding == 'Yes' and not from_repost:
-				update_outstanding_amt(self.account, self.party_type, self.party, self.against_voucher_type,
-					self.against_voucher)
-
 	def check_mandatory(self):
 		mandatory = ['account','voucher_type','voucher_no','company']
 		for k in mandatory:
 			if not self.get(k):
 				frappe.throw(_("{0} is required").format(_(self.meta.get_label(k))))
 
-		account_type = frappe.db.get_value("Account", self.account, "account_type")
+		account_type = self.get_account_details().account_type
 		if not (self.party_type and self.party):
 			if account_type == "Receivable":
 				frappe.throw(_("{0} {1}: Customer is required against Receivable account {2}")
@@ -62,7 +47,7 @@ class GLEntry(Document):
 				.format(self.voucher_type, self.voucher_no, self.account))
 
 	def pl_must_have_cost_center(self):
-		if frappe.db.get_value("Account", self.account, "report_type") == "Profit and Loss":
+		if self.get_account_details().report_type == "Profit and Loss":
 			if not self.cost_center and self.voucher_type != 'Period Closing Voucher':
 				frappe.throw(_("{0} {1}: Cost Center is required for 'Profit and Loss' account {2}. Please set up a default Cost Center for the Company.")
 					.format(self.voucher_type, self.voucher_no, self.account))
@@ -75,15 +60,17 @@ class GLEntry(Document):
 
 	def check_pl_account(self):
 		if self.is_opening=='Yes' and \
-				frappe.db.get_value("Account", self.account, "report_type")=="Profit and Loss":
+				self.get_account_details().report_type=="Profit and Loss":
 			frappe.throw(_("{0} {1}: 'Profit and Loss' type account {2} not allowed in Opening Entry")
 				.format(self.voucher_type, self.voucher_no, self.account))
 
 	def validate_account_details(self, adv_adj):
 		"""Account must be ledger, active and not freezed"""
 
-		ret = frappe.db.sql("""select is_group, docstatus, company
-			from tabAccount where name=%s""", self.account, as_dict=1)[0]
+		ret = self.get_account_details()
+		if not ret:
+			frappe.throw(_("{0} {1}: Account {2} does not exist")
+				.format(self.voucher_type, self.voucher_no, self.account))
 
 		if ret.is_group==1:
 			frappe.throw(_("{0} {1}: Account {2} cannot be a Group")
@@ -99,7 +86,7 @@ class GLEntry(Document):
 
 	def validate_cost_center(self):
 		if not hasattr(self, "cost_center_company"):
-			self.cost_center_company = {}
+			self.cost_center_company = self.flags.cost_center_company or {}
 
 		def _get_cost_center_company():
 			if not self.cost_center_company.get(self.cost_center):
@@ -135,6 +122,32 @@ class GLEntry(Document):
 		if not self.fiscal_year:
 			self.fiscal_year = get_fiscal_year(self.posting_date, company=self.company)[0]
 
+	def get_account_details(self):
+		"""Account properties used in validations, from the snapshot shared by all
+		entries of a voucher (set in `flags.account_details`) if available"""
+		if self.flags.account_details is None:
+			self.flags.account_details = get_account_details([self.account])
+
+		return self.flags.account_details.get(self.account) or frappe._dict()
+
+def get_account_details(accounts):
+	"""Returns a dict of account and the properties validated in GL Entry"""
+	if not accounts:
+		return {}
+
+	return dict((d.name, d) for d in frappe.db.sql("""select name, account_type, report_type,
+			root_type, is_group, docstatus, company, freeze_account, balance_must_be
+		from tabAccount where name in ({0})""".format(", ".join(["%s"] * len(accounts))),
+		tuple(accounts), as_dict=1))
+
+def get_cost_center_company(cost_centers):
+	"""Returns a dict of cost center and its company"""
+	if not cost_centers:
+		return {}
+
+	return dict(frappe.db.sql("""select name, company from `tabCost Center`
+		where name in ({0})""".format(", ".join(["%s"] * len(cost_centers))), tuple(cost_centers)))
+
 
 def validate_balance_type(account, adv_adj=False):
 	if not adv_adj and account:
@@ -231,3 +244,9 @@ def update_against_account(voucher_type, voucher_no):
 
 		if d.against != new_against:
 			frappe.db.set_value("GL Entry", d.name, "against", new_against)
+
+def on_doctype_update():
+	# orders of the General Ledger report, which pages through the entries by them
+	frappe.db.add_index("GL Entry", ["company", "posting_date", "voucher_type", "voucher_no"])
+	frappe.db.add_index("GL Entry", ["company", "account", "posting_date"])
+	frappe.db.add_index("GL Entry", ["company", "party", "posting_date"])
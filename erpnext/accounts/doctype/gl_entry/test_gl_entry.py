@@ -23,3 +23,45 @@ class TestGLEntry(unittest.TestCase):
 			and debit = 0 and credit = '.01'""", jv.name)
 
 		self.assertTrue(round_off_entry)
+
+	def test_outstanding_against_multiple_entries(self):
+		from erpnext.accounts.doctype.sales_invoice.test_sales_invoice import create_sales_invoice
+
+		si = create_sales_invoice(rate=1000)
+
+		jv = make_journal_entry("_Test Bank - _TC", "Debtors - _TC", 600, submit=False)
+		jv.get("accounts")[1].update({
+			"party_type": "Customer",
+			"party": "_Test Customer",
+			"credit_in_account_currency": 250,
+			"reference_type": "Sales Invoice",
+			"reference_name": si.name
+		})
+		jv.append("accounts", {
+			"account": "_Test Write Off - _TC",
+			"cost_center": "_Test Cost Center - _TC",
+			"credit_in_account_currency": 250
+		})
+		jv.append("accounts", {
+			"account": "Debtors - _TC",
+			"party_type": "Customer",
+			"party": "_Test Customer",
+			"credit_in_account_currency": 100,
+			"reference_type": "Sales Invoice",
+			"reference_name": si.name
+		})
+		jv.insert()
+		jv.submit()
+
+		gl_entries = frappe.db.sql("""select name, account, debit, credit, fiscal_year
+			from `tabGL Entry` where voucher_type='Journal Entry' and voucher_no=%s
+			order by account""", jv.name, as_dict=1)
+
+		self.assertEqual([(d.account, d.debit, d.credit) for d in gl_entries], [
+			("_Test Bank - _TC", 600, 0),
+			("_Test Write Off - _TC", 0, 250),
+			("Debtors - _TC", 0, 350)
+		])
+		self.assertTrue(all(d.name and d.fiscal_year for d in gl_entries))
+
+		self.assertEqual(frappe.db.get_value("Sales Invoice", si.name, "outstanding_amount"), 650)
@@ -7,6 +7,7 @@ from frappe.utils import flt
 from frappe import _
 from erpnext.accounts.utils import get_account_currency
 from erpnext.controllers.accounts_controller import AccountsController
+from erpnext.accounts.doctype.account_period_balance.account_period_balance import remove_vouchers
 
 class PeriodClosingVoucher(AccountsController):
 	def validate(self):
@@ -17,6 +18,7 @@ class PeriodClosingVoucher(AccountsController):
 		self.make_gl_entries()
 
 	def on_cancel(self):
+		remove_vouchers([(self.doctype, self.name)])
 		frappe.db.sql("""delete from `tabGL Entry`
 			where voucher_type = 'Period Closing Voucher' and voucher_no=%s""", self.name)
 
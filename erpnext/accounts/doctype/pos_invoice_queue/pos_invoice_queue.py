@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import json
+import frappe
+from frappe.utils import cint
+from frappe.model.document import Document
+from six import string_types, iteritems
+from erpnext.utilities.bulk_insert import bulk_insert
+from erpnext.utilities.lock import acquire_lock, release_lock
+
+# failed invoices are queued again until they have failed this many times
+max_retries = 3
+
+class POSInvoiceQueue(Document):
+	def process(self):
+		'''Create the Sales Invoice of the offline invoice and submit it, or save it
+		as draft if it cannot be submitted. If that fails, it is queued again for the
+		next run, up to `max_retries` times'''
+		from erpnext.accounts.doctype.sales_invoice.pos import submit_invoice
+
+		self.db_set("status", "In Progress")
+		frappe.db.commit()
+
+		if frappe.session.user != self.owner:
+			frappe.set_user(self.owner)
+
+		try:
+			si_doc = submit_invoice(self.name, json.loads(self.data))
+		except Exception:
+			frappe.db.rollback()
+			self.db_set("error_log", frappe.get_traceback())
+			self.db_set("retry_count", cint(self.retry_count) + 1)
+			self.db_set("status", "Queued" if self.retry_count < max_retries else "Failed")
+		else:
+			self.db_set("sales_invoice", si_doc.name)
+			self.db_set("status", "Completed" if si_doc.docstatus == 1 else "Saved as Draft")
+			if si_doc.docstatus == 0:
+				self.db_set("error_log", si_doc.flags.error_log)
+
+		frappe.db.commit()
+
+def queue_invoices(invoices):
+	'''Queue the given offline invoices ({offline_pos_name: doc}) for submission and
+	return the names of the accepted ones, including the ones already received'''
+	names = list(invoices)
+	if not names:
+		return []
+
+	placeholders = ", ".join(["%s"] * len(names))
+	existing = set(frappe.db.sql_list("""select offline_pos_name from `tabSales Invoice`
+		where offline_pos_name in ({0})
+		union select name from `tabPOS Invoice Queue` where name in ({0})""".format(placeholders),
+		tuple(names) * 2))
+
+	queue = []
+	for name, doc in iteritems(invoices):
+		if name in existing:
+			continue
+
+		queue.append(frappe.get_doc({
+			"doctype": "POS Invoice Queue",
+			"name": name,
+			"offline_pos_name": name,
+			"company": doc.get("company"),
+			"warehouse": get_invoice_warehouse(doc),
+			"posting_date": doc.get("posting_date"),
+			"status": "Queued",
+			"data": frappe.as_json(doc)
+		}))
+
+	bulk_insert(queue)
+	frappe.db.commit()
+
+	for warehouse in set([d.warehouse for d in queue]):
+		enqueue_warehouse(warehouse)
+
+	return names
+
+def get_invoice_warehouse(doc):
+	for item in doc.get("items") or []:
+		if item.get("warehouse"):
+			return item.get("warehouse")
+
+	return doc.get("set_warehouse")
+
+def enqueue_warehouse(warehouse):
+	'''Start a worker for the queued invoices of the warehouse. Invoices of different
+	warehouses are submitted in parallel, the ones of a warehouse in order'''
+	frappe.enqueue("erpnext.accounts.doctype.pos_invoice_queue.pos_invoice_queue.process_queue",
+		queue="long", warehouse=warehouse, now=frappe.flags.in_test)
+
+def process_queue(warehouse):
+	'''Submit the queued invoices of the warehouse by posting time. Invoices left In
+	Progress by an interrupted run are picked up again'''
+	lock = "pos_invoice_queue_running:{0}".format(warehouse)
+	token = acquire_lock(lock)
+	if not token:
+		return
+
+	try:
+		for name in frappe.db.sql_list("""select name from `tabPOS Invoice Queue`
+			where ifnull(warehouse, '') = %s and status in ('Queued', 'In Progress')
+			order by posting_date asc, creation asc, name asc""", warehouse or ""):
+			frappe.get_doc("POS Invoice Queue", name).process()
+	finally:
+		release_lock(lock, token)
+
+def process_all_queues():
+	'''Start workers for the warehouses with queued invoices, called by the scheduler'''
+	for warehouse in frappe.db.sql_list("""select distinct warehouse from `tabPOS Invoice Queue`
+		where status in ('Queued', 'In Progress')"""):
+		enqueue_warehouse(warehouse)
+
+@frappe.whitelist()
+def get_invoice_status(offline_pos_names):
+	'''Returns the status and Sales Invoice of the given offline invoices'''
+	if isinstance(offline_pos_names, string_types):
+		offline_pos_names = json.loads(offline_pos_names)
+
+	if not offline_pos_names:
+		return {}
+
+	return dict((d.name, d) for d in frappe.db.sql("""select name, status, sales_invoice, retry_count
+		from `tabPOS Invoice Queue` where name in ({0})""".format(", ".join(["%s"] * len(offline_pos_names))),
+		tuple(offline_pos_names), as_dict=1))
@@ -5,7 +5,7 @@ from __future__ import unicode_literals
 import frappe
 from frappe import msgprint, _
 from frappe.utils import cint, now
-from erpnext.accounts.doctype.sales_invoice.pos import get_child_nodes
+from erpnext.accounts.doctype.sales_invoice.pos import get_child_nodes, clear_pos_master_data_cache
 from erpnext.accounts.doctype.sales_invoice.sales_invoice import set_account_for_mode_of_payment
 from six import iteritems
 from frappe.model.document import Document
@@ -79,9 +79,11 @@ class POSProfile(Document):
 
 	def on_update(self):
 		self.set_defaults()
+		clear_pos_master_data_cache(self.name)
 
 	def on_trash(self):
 		self.set_defaults(include_current_pos=False)
+		clear_pos_master_data_cache(self.name)
 
 	def set_defaults(self, include_current_pos=True):
 		frappe.defaults.clear_default("is_pos")
@@ -6,7 +6,9 @@ from __future__ import unicode_literals
 import frappe
 import unittest
 from erpnext.stock.get_item_details import get_pos_profile
-from erpnext.accounts.doctype.sales_invoice.pos import get_items_list, get_customers_list
+from frappe.utils import now
+from erpnext.accounts.doctype.sales_invoice.pos import (get_items_list, get_customers_list,
+	get_pos_master_data, get_deleted_pos_records)
 
 class TestPOSProfile(unittest.TestCase):
 	def test_pos_profile(self):
@@ -29,6 +31,30 @@ class TestPOSProfile(unittest.TestCase):
 
 		frappe.db.sql("delete from `tabPOS Profile`")
 
+	def test_pos_master_data_sync(self):
+		pos_profile = make_pos_profile()
+		doc = frappe._dict({'company': '_Test Company', 'selling_price_list': '_Test Price List',
+			'ignore_pricing_rule': 1})
+
+		sync_from = now()
+		item = frappe.get_doc("Item", "_Test Item")
+		item.save()
+
+		data = get_pos_master_data(doc, pos_profile, sync_from)
+		self.assertEqual([d.name for d in data['items']], ["_Test Item"])
+		self.assertFalse(data['customers'])
+
+		item.disabled = 1
+		item.save()
+		try:
+			self.assertFalse(get_pos_master_data(doc, pos_profile, sync_from)['items'])
+			self.assertTrue("_Test Item" in get_deleted_pos_records(doc, pos_profile, sync_from)['items'])
+		finally:
+			item.disabled = 0
+			item.save()
+
+		frappe.db.sql("delete from `tabPOS Profile`")
+
 def make_pos_profile():
 	frappe.db.sql("delete from `tabPOS Profile`")
 
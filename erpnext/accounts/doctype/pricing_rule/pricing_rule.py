@@ -8,7 +8,7 @@ import frappe
 import json
 import copy
 from frappe import throw, _
-from frappe.utils import flt, cint
+from frappe.utils import flt, cint, cstr, getdate
 from frappe.model.document import Document
 
 from six import string_types
@@ -27,6 +27,12 @@ class PricingRule(Document):
 
 		if not self.margin_type: self.margin_rate_or_amount = 0.0
 
+	def on_update(self):
+		clear_pricing_rule_cache()
+
+	def on_trash(self):
+		clear_pricing_rule_cache()
+
 	def validate_mandatory(self):
 		for field in ["apply_on", "applicable_for"]:
 			tocheck = frappe.scrub(self.get(field) or "")
@@ -235,80 +241,93 @@ def remove_pricing_rules(item_list):
 	return out
 
 def get_pricing_rules(args):
-	def _get_tree_conditions(parenttype, allow_blank=True):
-		field = frappe.scrub(parenttype)
-		condition = ""
-		if args.get(field):
-			if not frappe.flags.tree_conditions:
-				frappe.flags.tree_conditions = {}
-			key = (parenttype, args[field], )
-			if key in frappe.flags.tree_conditions:
-				return frappe.flags.tree_conditions[key]
-
-			try:
-				lft, rgt = frappe.db.get_value(parenttype, args[field], ["lft", "rgt"])
-			except TypeError:
-				frappe.throw(_("Invalid {0}").format(args[field]))
+	"""Returns the Pricing Rules applicable for the item and party in args, ordered by
+	priority, from the index of the company's rules"""
+	index = get_pricing_rule_index(args.company, args.transaction_type)
 
-			parent_groups = frappe.db.sql_list("""select name from `tab%s`
-				where lft<=%s and rgt>=%s""" % (parenttype, '%s', '%s'), (lft, rgt))
+	ancestors = dict((frappe.scrub(parenttype), get_ancestors(parenttype, args.get(frappe.scrub(parenttype))))
+		for parenttype in ("Customer Group", "Territory", "Item Group"))
 
-			if parent_groups:
-				if allow_blank: parent_groups.append('')
-				condition = "ifnull({field}, '') in ({parent_groups})".format(
-					field=field,
-					parent_groups=", ".join([frappe.db.escape(d) for d in parent_groups])
-				)
+	# load variant of if not defined
+	if "variant_of" not in args:
+		args.variant_of = frappe.get_cached_value("Item", args.item_code, "variant_of")
 
-				frappe.flags.tree_conditions[key] = condition
-		return condition
+	candidates = {}
+	for field, values in (("item_code", [args.item_code, args.variant_of]),
+		("item_group", ancestors["item_group"]), ("brand", [args.brand])):
+		for value in values or []:
+			for rule in index[field].get(value, []) if value else []:
+				candidates[rule.name] = rule
 
+	if not args.price_list: args.price_list = None
 
-	conditions = item_variant_condition = ""
-	values =  {"item_code": args.get("item_code"), "brand": args.get("brand")}
+	return [frappe._dict(d) for d in sorted(candidates.values(),
+		key=lambda d: (cstr(d.priority), d.name), reverse=True) if is_applicable(d, args, ancestors)]
 
-	for field in ["company", "customer", "supplier", "supplier_group", "campaign", "sales_partner"]:
-		if args.get(field):
-			conditions += " and ifnull("+field+", '') in (%("+field+")s, '')"
-			values[field] = args.get(field)
-		else:
-			conditions += " and ifnull("+field+", '') = ''"
+def is_applicable(rule, args, ancestors):
+	"""Check the party, price list and validity conditions of a Pricing Rule"""
+	for field in ("customer", "supplier", "supplier_group", "campaign", "sales_partner"):
+		if rule.get(field) and rule.get(field) != args.get(field):
+			return False
 
-	for parenttype in ["Customer Group", "Territory"]:
-		group_condition = _get_tree_conditions(parenttype)
-		if group_condition:
-			conditions += " and " + group_condition
+	for field in ("customer_group", "territory"):
+		if args.get(field) and rule.get(field) and rule.get(field) not in ancestors[field]:
+			return False
 
-	if not args.price_list: args.price_list = None
-	conditions += " and ifnull(for_price_list, '') in (%(price_list)s, '')"
-	values["price_list"] = args.get("price_list")
+	if rule.for_price_list and rule.for_price_list != args.price_list:
+		return False
 
 	if args.get("transaction_date"):
-		conditions += """ and %(transaction_date)s between ifnull(valid_from, '2000-01-01')
-			and ifnull(valid_upto, '2500-12-31')"""
-		values['transaction_date'] = args.get('transaction_date')
+		transaction_date = getdate(args.transaction_date)
+		if not (getdate(rule.valid_from or "2000-01-01") <= transaction_date
+			<= getdate(rule.valid_upto or "2500-12-31")):
+			return False
+
+	return True
+
+def get_pricing_rule_index(company, transaction_type):
+	"""Returns the enabled Pricing Rules of the company (or of no company) for selling
+	or buying, by the item code, item group and brand they apply on"""
+	def generator():
+		pricing_rules = frappe.cache().hget("pricing_rules", transaction_type)
+		if pricing_rules is None:
+			pricing_rules = frappe.db.sql("""select * from `tabPricing Rule`
+				where docstatus < 2 and disable = 0 and {0} = 1""".format(transaction_type), as_dict=1)
+			frappe.cache().hset("pricing_rules", transaction_type, pricing_rules)
+
+		index = {"item_code": {}, "item_group": {}, "brand": {}}
+		for d in pricing_rules:
+			if d.company and d.company != company:
+				continue
+
+			for field in index:
+				if d.get(field):
+					index[field].setdefault(d.get(field), []).append(d)
+
+		return index
+
+	return frappe.local_cache("pricing_rule_index", (company, transaction_type), generator)
+
+def get_ancestors(doctype, name):
+	"""Returns the name of the group and its ancestors"""
+	if not name:
+		return []
+
+	def generator():
+		try:
+			lft, rgt = frappe.db.get_value(doctype, name, ["lft", "rgt"])
+		except TypeError:
+			frappe.throw(_("Invalid {0}").format(name))
 
-	item_group_condition = _get_tree_conditions("Item Group", False)
-	if item_group_condition:
-		item_group_condition = " or " + item_group_condition
+		return frappe.db.sql_list("""select name from `tab%s`
+			where lft<=%s and rgt>=%s""" % (doctype, '%s', '%s'), (lft, rgt))
 
-	# load variant of if not defined
-	if "variant_of" not in args:
-		args.variant_of = frappe.get_cached_value("Item", args.item_code, "variant_of")
+	return frappe.local_cache("pricing_rule_ancestors", (doctype, name), generator)
 
-	if args.variant_of:
-		item_variant_condition = ' or item_code=%(variant_of)s '
-		values['variant_of'] = args.variant_of
-
-	return frappe.db.sql("""select * from `tabPricing Rule`
-		where (item_code=%(item_code)s {item_variant_condition} {item_group_condition} or brand=%(brand)s)
-			and docstatus < 2 and disable = 0
-			and {transaction_type} = 1 {conditions}
-		order by priority desc, name desc""".format(
-			item_group_condition = item_group_condition,
-			item_variant_condition = item_variant_condition,
-			transaction_type = args.transaction_type,
-			conditions = conditions), values, as_dict=1)
+def clear_pricing_rule_cache():
+	frappe.cache().delete_value("pricing_rules")
+	if getattr(frappe.local, "cache", None) is not None:
+		frappe.local.cache.pop("pricing_rule_index", None)
 
 def filter_pricing_rules(args, pricing_rules):
 	# filter for qty
@@ -9,13 +9,16 @@ from erpnext.selling.doctype.sales_order.test_sales_order import make_sales_orde
 from erpnext.accounts.doctype.sales_invoice.test_sales_invoice import create_sales_invoice
 from erpnext.stock.get_item_details import get_item_details
 from frappe import MandatoryError
+from erpnext.accounts.doctype.pricing_rule.pricing_rule import clear_pricing_rule_cache
 
 class TestPricingRule(unittest.TestCase):
 	def setUp(self):
 		frappe.db.sql("delete from `tabPricing Rule`")
+		clear_pricing_rule_cache()
 
 	def tearDown(self):
 		frappe.db.sql("delete from `tabPricing Rule`")
+		clear_pricing_rule_cache()
 
 	def test_pricing_rule_for_discount(self):
 		from erpnext.stock.get_item_details import get_item_details
@@ -86,6 +89,7 @@ class TestPricingRule(unittest.TestCase):
 		self.assertEqual(details.get("discount_percentage"), 5)
 
 		frappe.db.sql("update `tabPricing Rule` set priority=NULL where campaign='_Test Campaign'")
+		clear_pricing_rule_cache()
 		from erpnext.accounts.doctype.pricing_rule.pricing_rule	import MultiplePricingRuleConflict
 		self.assertRaises(MultiplePricingRuleConflict, get_item_details, args)
 
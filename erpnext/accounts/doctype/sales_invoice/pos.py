@@ -4,21 +4,42 @@
 
 
 import json
+from collections import OrderedDict
 
 import frappe
 from erpnext.accounts.party import get_party_account_currency
+from erpnext.accounts.doctype.pos_invoice_queue.pos_invoice_queue import queue_invoices, get_invoice_status
 from erpnext.controllers.accounts_controller import get_taxes_and_charges
 from erpnext.setup.utils import get_exchange_rate
 from erpnext.stock.get_item_details import get_pos_profile
 from frappe import _
 from frappe.core.doctype.communication.email import make
-from frappe.utils import nowdate, cint
+from frappe.utils import nowdate, now, cint, add_to_date
 
 from six import string_types, iteritems
 
 
+# master data of the offline POS, cached per POS Profile and synced by modified timestamp
+pos_datasets = ('items', 'item_groups', 'customers', 'address', 'contacts', 'serial_no_data',
+	'batch_no_data', 'barcode_data', 'tax_data', 'price_list_data', 'bin_data', 'pricing_rules')
+
+# records committed after the read may have been modified before it, so syncs overlap by this
+sync_watermark_overlap = 300
+
 @frappe.whitelist()
-def get_pos_data():
+def get_pos_data(sync_from=None, start=0, page_length=None, snapshot=None):
+	"""Returns the defaults and the master data for the offline POS.
+
+	Without `sync_from`, the master data is returned from a snapshot cached per POS
+	Profile, in pages of `page_length` records of every dataset. Later pages must pass
+	the `sync_watermark` of the first page as `snapshot`.
+
+	With `sync_from` (the `sync_watermark` of an earlier call), only the records
+	modified after it are returned, and the keys of removed records in `deleted`.
+
+	The watermark is taken before the master data is read, less `sync_watermark_overlap`
+	seconds, so records of transactions committed during the read are synced again."""
+	sync_watermark = add_to_date(now(), seconds=-sync_watermark_overlap, as_string=True, as_datetime=True)
 	doc = frappe.new_doc('Sales Invoice')
 	doc.is_pos = 1
 	pos_profile = get_pos_profile(doc.company) or {}
@@ -39,30 +60,137 @@ def get_pos_data():
 	update_multi_mode_option(doc, pos_profile)
 	default_print_format = pos_profile.get('print_format') or "Point of Sale"
 	print_template = frappe.db.get_value('Print Format', default_print_format, 'html')
-	items_list = get_items_list(pos_profile, doc.company)
-	customers = get_customers_list(pos_profile)
 
-	return {
+	if sync_from:
+		data = get_pos_master_data(doc, pos_profile, sync_from)
+		data['deleted'] = get_deleted_pos_records(doc, pos_profile, sync_from)
+	else:
+		cache_key = get_pos_master_data_cache_key(pos_profile.get('name'), doc)
+		cached = frappe.cache().get_value(cache_key)
+		if not cached:
+			cached = {'sync_watermark': sync_watermark, 'data': get_pos_master_data(doc, pos_profile)}
+			frappe.cache().set_value(cache_key, cached, expires_in_sec=3600)
+
+		if snapshot and snapshot != cached['sync_watermark']:
+			return {'snapshot_changed': 1}
+
+		sync_watermark = cached['sync_watermark']
+		data = get_page(cached['data'], cint(start), cint(page_length))
+
+	data.update({
 		'doc': doc,
 		'default_customer': pos_profile.get('customer'),
+		'print_template': print_template,
+		'pos_profile': pos_profile,
+		'meta': get_meta(),
+		'sync_watermark': sync_watermark
+	})
+
+	return data
+
+
+def get_pos_master_data(doc, pos_profile, sync_from=None):
+	items_list = get_items_list(pos_profile, doc.company, sync_from)
+	customers = get_customers_list(pos_profile, sync_from)
+
+	return {
 		'items': items_list,
 		'item_groups': get_item_groups(pos_profile),
 		'customers': customers,
 		'address': get_customers_address(customers),
 		'contacts': get_contacts(customers),
-		'serial_no_data': get_serial_no_data(pos_profile, doc.company),
-		'batch_no_data': get_batch_no_data(),
+		'serial_no_data': get_serial_no_data(pos_profile, doc.company, sync_from),
+		'batch_no_data': get_batch_no_data(sync_from),
 		'barcode_data': get_barcode_data(items_list),
-		'tax_data': get_item_tax_data(),
-		'price_list_data': get_price_list_data(doc.selling_price_list),
-		'bin_data': get_bin_data(pos_profile),
-		'pricing_rules': get_pricing_rule_data(doc),
-		'print_template': print_template,
-		'pos_profile': pos_profile,
-		'meta': get_meta()
+		'tax_data': get_item_tax_data(items_list if sync_from else None),
+		'price_list_data': get_price_list_data(doc.selling_price_list, sync_from),
+		'bin_data': get_bin_data(pos_profile, sync_from),
+		'pricing_rules': get_pricing_rule_data(doc, sync_from)
 	}
 
 
+def get_pos_master_data_cache_key(pos_profile, doc):
+	return "pos_master_data:{0}:{1}:{2}".format(pos_profile, doc.company, doc.selling_price_list)
+
+
+def clear_pos_master_data_cache(pos_profile):
+	frappe.cache().delete_keys("pos_master_data:{0}:".format(pos_profile))
+
+
+def get_page(data, start, page_length):
+	"""Returns `page_length` records of every dataset from `start`, lists are sliced
+	and dicts are sliced by their sorted keys"""
+	if not page_length:
+		return dict(data, has_more=0)
+
+	out = {'has_more': 0}
+	for dataset in pos_datasets:
+		records = data[dataset]
+		if isinstance(records, dict):
+			keys = sorted(records)[start:start + page_length]
+			out[dataset] = dict((key, records[key]) for key in keys)
+			total = len(records)
+		else:
+			out[dataset] = (records or [])[start:start + page_length]
+			total = len(records or [])
+
+		if total > start + page_length:
+			out['has_more'] = 1
+
+	return out
+
+
+def get_deleted_pos_records(doc, pos_profile, sync_from):
+	"""Returns keys of the records of every dataset removed since `sync_from`, because
+	they were deleted or no longer match the POS Profile"""
+	deleted = frappe._dict((dataset, []) for dataset in pos_datasets)
+
+	for d in frappe.db.sql("""select deleted_doctype, deleted_name, data from `tabDeleted Document`
+		where creation > %s and deleted_doctype in ('Item', 'Customer', 'Serial No', 'Batch',
+			'Item Price', 'Pricing Rule')""", sync_from, as_dict=1):
+		data = json.loads(d.data or "{}")
+		if d.deleted_doctype == 'Item':
+			deleted['items'].append(d.deleted_name)
+		elif d.deleted_doctype == 'Customer':
+			deleted['customers'].append(d.deleted_name)
+		elif d.deleted_doctype == 'Serial No':
+			deleted['serial_no_data'].append([data.get('item_code'), d.deleted_name])
+		elif d.deleted_doctype == 'Batch':
+			deleted['batch_no_data'].append([data.get('item'), d.deleted_name])
+		elif d.deleted_doctype == 'Item Price' and data.get('price_list') == doc.selling_price_list:
+			deleted['price_list_data'].append(data.get('item_code'))
+		elif d.deleted_doctype == 'Pricing Rule':
+			deleted['pricing_rules'].append(d.deleted_name)
+
+	modified_items = frappe.db.sql_list("""select name from `tabItem` where modified > %s""", sync_from)
+	if modified_items:
+		items = [d.name for d in get_items_list(pos_profile, doc.company, sync_from)]
+		deleted['items'].extend(list(set(modified_items) - set(items)))
+
+	modified_customers = frappe.db.sql_list("""select name from `tabCustomer` where modified > %s""", sync_from)
+	if modified_customers:
+		customers = [d.name for d in get_customers_list(pos_profile, sync_from)]
+		deleted['customers'].extend(list(set(modified_customers) - set(customers)))
+
+	serial_nos = get_serial_no_data(pos_profile, doc.company, sync_from)
+	for d in frappe.db.sql("""select name, item_code from `tabSerial No` where modified > %s""",
+		sync_from, as_dict=1):
+		if d.name not in serial_nos.get(d.item_code, {}):
+			deleted['serial_no_data'].append([d.item_code, d.name])
+
+	# batches that expired since the last sync
+	for d in frappe.db.sql("""select name, item from `tabBatch`
+		where expiry_date >= date(%s) and expiry_date < curdate()""", sync_from, as_dict=1):
+		deleted['batch_no_data'].append([d.item, d.name])
+
+	pricing_rules = [d.name for d in get_pricing_rule_data(doc, sync_from)]
+	deleted['pricing_rules'].extend(frappe.db.sql_list("""select name from `tabPricing Rule`
+		where (modified > %s or (valid_upto >= date(%s) and valid_upto < curdate())) and name not in ({0})""".format(
+			", ".join(["%s"] * len(pricing_rules)) or "''"), [sync_from, sync_from] + pricing_rules))
+
+	return deleted
+
+
 def get_meta():
 	doctype_meta = {
 		'customer': frappe.get_meta('Customer'),
@@ -151,7 +279,7 @@ def update_tax_table(doc):
 		doc.append('taxes', tax)
 
 
-def get_items_list(pos_profile, company):
+def get_items_list(pos_profile, company, sync_from=None):
 	cond = ""
 	args_list = []
 	if pos_profile.get('item_groups'):
@@ -161,6 +289,10 @@ def get_items_list(pos_profile, company):
 		if args_list:
 			cond = "and i.item_group in (%s)" % (', '.join(['%s'] * len(args_list)))
 
+	if sync_from:
+		cond += " and i.modified > %s"
+		args_list.append(sync_from)
+
 	return frappe.db.sql("""
 		select
 			i.name, i.item_code, i.item_name, i.description, i.item_group, i.has_batch_no,
@@ -187,7 +319,7 @@ def get_item_groups(pos_profile):
 	return item_group_dict
 
 
-def get_customers_list(pos_profile={}):
+def get_customers_list(pos_profile={}, sync_from=None):
 	cond = "1=1"
 	customer_groups = []
 	if pos_profile.get('customer_groups'):
@@ -196,6 +328,14 @@ def get_customers_list(pos_profile={}):
 			customer_groups.extend([d.name for d in get_child_nodes('Customer Group', d.customer_group)])
 		cond = "customer_group in (%s)" % (', '.join(['%s'] * len(customer_groups)))
 
+	if sync_from:
+		# customers modified, or whose address or contact was modified
+		cond += """ and (modified > %s or name in (select dl.link_name from `tabDynamic Link` dl
+			where dl.link_doctype = 'Customer' and ((dl.parenttype = 'Address' and dl.parent in
+				(select name from `tabAddress` where modified > %s)) or (dl.parenttype = 'Contact'
+				and dl.parent in (select name from `tabContact` where modified > %s)))))"""
+		customer_groups.extend([sync_from] * 3)
+
 	return frappe.db.sql(""" select name, customer_name, customer_group,
 		territory, customer_pos_id from tabCustomer where disabled = 0
 		and {cond}""".format(cond=cond), tuple(customer_groups), as_dict=1) or {}
@@ -206,15 +346,18 @@ def get_customers_address(customers):
 	if isinstance(customers, string_types):
 		customers = [frappe._dict({'name': customers})]
 
-	for data in customers:
-		address = frappe.db.sql(""" select name, address_line1, address_line2, city, state,
-			email_id, phone, fax, pincode from `tabAddress` where is_primary_address =1 and name in
-			(select parent from `tabDynamic Link` where link_doctype = 'Customer' and link_name = %s
-			and parenttype = 'Address')""", data.name, as_dict=1)
-		address_data = {}
-		if address:
-			address_data = address[0]
+	addresses = {}
+	if customers:
+		for d in frappe.db.sql(""" select dl.link_name as customer, a.name, a.address_line1,
+			a.address_line2, a.city, a.state, a.email_id, a.phone, a.fax, a.pincode
+			from `tabAddress` a, `tabDynamic Link` dl
+			where a.is_primary_address = 1 and dl.parent = a.name and dl.parenttype = 'Address'
+			and dl.link_doctype = 'Customer' and dl.link_name in ({0})""".format(
+				', '.join(['%s'] * len(customers))), tuple([d.name for d in customers]), as_dict=1):
+			addresses.setdefault(d.pop('customer'), d)
 
+	for data in customers:
+		address_data = addresses.get(data.name) or {}
 		address_data.update({'full_name': data.customer_name, 'customer_pos_id': data.customer_pos_id})
 		customer_address[data.name] = address_data
 
@@ -226,13 +369,15 @@ def get_contacts(customers):
 	if isinstance(customers, string_types):
 		customers = [frappe._dict({'name': customers})]
 
-	for data in customers:
-		contact = frappe.db.sql(""" select email_id, phone, mobile_no from `tabContact`
-			where is_primary_contact =1 and name in
-			(select parent from `tabDynamic Link` where link_doctype = 'Customer' and link_name = %s
-			and parenttype = 'Contact')""", data.name, as_dict=1)
-		if contact:
-			customer_contact[data.name] = contact[0]
+	if not customers:
+		return customer_contact
+
+	for d in frappe.db.sql(""" select dl.link_name as customer, c.email_id, c.phone, c.mobile_no
+		from `tabContact` c, `tabDynamic Link` dl
+		where c.is_primary_contact = 1 and dl.parent = c.name and dl.parenttype = 'Contact'
+		and dl.link_doctype = 'Customer' and dl.link_name in ({0})""".format(
+			', '.join(['%s'] * len(customers))), tuple([d.name for d in customers]), as_dict=1):
+		customer_contact.setdefault(d.pop('customer'), d)
 
 	return customer_contact
 
@@ -243,7 +388,7 @@ def get_child_nodes(group_type, root):
 			lft >= {lft} and rgt <= {rgt} order by lft""".format(tab=group_type, lft=lft, rgt=rgt), as_dict=1)
 
 
-def get_serial_no_data(pos_profile, company):
+def get_serial_no_data(pos_profile, company, sync_from=None):
 	# get itemwise serial no data
 	# example {'Nokia Lumia 1020': {'SN0001': 'Pune'}}
 	# where Nokia Lumia 1020 is item code, SN0001 is serial no and Pune is warehouse
@@ -252,8 +397,11 @@ def get_serial_no_data(pos_profile, company):
 	if pos_profile.get('update_stock') and pos_profile.get('warehouse'):
 		cond = "warehouse = '{0}'".format(pos_profile.get('warehouse'))
 
+	if sync_from:
+		cond += " and modified > %(sync_from)s"
+
 	serial_nos = frappe.db.sql("""select name, warehouse, item_code from `tabSerial No` where {0}
-				and company = %(company)s """.format(cond), {'company': company}, as_dict=1)
+				and company = %(company)s """.format(cond), {'company': company, 'sync_from': sync_from}, as_dict=1)
 
 	itemwise_serial_no = {}
 	for sn in serial_nos:
@@ -264,14 +412,15 @@ def get_serial_no_data(pos_profile, company):
 	return itemwise_serial_no
 
 
-def get_batch_no_data():
+def get_batch_no_data(sync_from=None):
 	# get itemwise batch no data
 	# exmaple: {'LED-GRE': [Batch001, Batch002]}
 	# where LED-GRE is item code, SN0001 is serial no and Pune is warehouse
 
 	itemwise_batch = {}
 	batches = frappe.db.sql("""select name, item from `tabBatch`
-		where ifnull(expiry_date, '4000-10-10') >= curdate()""", as_dict=1)
+		where ifnull(expiry_date, '4000-10-10') >= curdate()
+		and (%(sync_from)s is null or modified > %(sync_from)s)""", {'sync_from': sync_from}, as_dict=1)
 
 	for batch in batches:
 		if batch.item not in itemwise_batch:
@@ -287,25 +436,32 @@ def get_barcode_data(items_list):
 	# where LED-GRE is item code, SN0001 is serial no and Pune is warehouse
 
 	itemwise_barcode = {}
-	for item in items_list:
-		barcodes = frappe.db.sql("""
-			select barcode from `tabItem Barcode` where parent = %s
-		""", item.item_code, as_dict=1)
+	if not items_list:
+		return itemwise_barcode
 
-		for barcode in barcodes:
-			if item.item_code not in itemwise_barcode:
-				itemwise_barcode.setdefault(item.item_code, [])
-			itemwise_barcode[item.item_code].append(barcode.get("barcode"))
+	barcodes = frappe.db.sql("""
+		select parent, barcode from `tabItem Barcode` where parent in ({0})
+	""".format(', '.join(['%s'] * len(items_list))), tuple([d.item_code for d in items_list]), as_dict=1)
+
+	for barcode in barcodes:
+		itemwise_barcode.setdefault(barcode.parent, []).append(barcode.barcode)
 
 	return itemwise_barcode
 
 
-def get_item_tax_data():
+def get_item_tax_data(items_list=None):
 	# get default tax of an item
 	# example: {'Consulting Services': {'Excise 12 - TS': '12.000'}}
 
 	itemwise_tax = {}
-	taxes = frappe.db.sql(""" select parent, tax_type, tax_rate from `tabItem Tax`""", as_dict=1)
+	cond = ""
+	if items_list is not None:
+		if not items_list:
+			return itemwise_tax
+		cond = "where parent in ({0})".format(', '.join(['%s'] * len(items_list)))
+
+	taxes = frappe.db.sql(""" select parent, tax_type, tax_rate from `tabItem Tax` {0}""".format(cond),
+		tuple([d.item_code for d in items_list or []]), as_dict=1)
 
 	for tax in taxes:
 		if tax.parent not in itemwise_tax:
@@ -315,11 +471,12 @@ def get_item_tax_data():
 	return itemwise_tax
 
 
-def get_price_list_data(selling_price_list):
+def get_price_list_data(selling_price_list, sync_from=None):
 	itemwise_price_list = {}
 	price_lists = frappe.db.sql("""Select ifnull(price_list_rate, 0) as price_list_rate,
-		item_code from `tabItem Price` ip where price_list = %(price_list)s""",
-        {'price_list': selling_price_list}, as_dict=1)
+		item_code from `tabItem Price` ip where price_list = %(price_list)s
+		and (%(sync_from)s is null or modified > %(sync_from)s)""",
+		{'price_list': selling_price_list, 'sync_from': sync_from}, as_dict=1)
 
 	for item in price_lists:
 		itemwise_price_list[item.item_code] = item.price_list_rate
@@ -327,14 +484,22 @@ def get_price_list_data(selling_price_list):
 	return itemwise_price_list
 
 
-def get_bin_data(pos_profile):
+def get_bin_data(pos_profile, sync_from=None):
 	itemwise_bin_data = {}
 	cond = "1=1"
 	if pos_profile.get('warehouse'):
 		cond = "warehouse = '{0}'".format(pos_profile.get('warehouse'))
 
+	if sync_from:
+		# bins with stock movements since the last sync, including the ones now out of stock
+		cond += """ and exists(select name from `tabStock Ledger Entry` sle
+			where sle.item_code = `tabBin`.item_code and sle.warehouse = `tabBin`.warehouse
+			and sle.creation > %(sync_from)s)"""
+	else:
+		cond += " and actual_qty > 0"
+
 	bin_data = frappe.db.sql(""" select item_code, warehouse, actual_qty from `tabBin`
-		where actual_qty > 0 and {cond}""".format(cond=cond), as_dict=1)
+		where {cond}""".format(cond=cond), {'sync_from': sync_from}, as_dict=1)
 
 	for bins in bin_data:
 		if bins.item_code not in itemwise_bin_data:
@@ -344,15 +509,18 @@ def get_bin_data(pos_profile):
 	return itemwise_bin_data
 
 
-def get_pricing_rule_data(doc):
+def get_pricing_rule_data(doc, sync_from=None):
 	pricing_rules = ""
 	if doc.ignore_pricing_rule == 0:
+		# on sync, also the rules which became valid since the last sync
 		pricing_rules = frappe.db.sql(""" Select * from `tabPricing Rule` where docstatus < 2
 						and ifnull(for_price_list, '') in (%(price_list)s, '') and selling = 1
 						and ifnull(company, '') in (%(company)s, '') and disable = 0 and %(date)s
 						between ifnull(valid_from, '2000-01-01') and ifnull(valid_upto, '2500-12-31')
+						and (%(sync_from)s is null or modified > %(sync_from)s or valid_from > date(%(sync_from)s))
 						order by priority desc, name desc""",
-                        {'company': doc.company, 'price_list': doc.selling_price_list, 'date': nowdate()}, as_dict=1)
+						{'company': doc.company, 'price_list': doc.selling_price_list, 'date': nowdate(),
+							'sync_from': sync_from}, as_dict=1)
 	return pricing_rules
 
 
@@ -368,25 +536,19 @@ def make_invoice(doc_list={}, email_queue_list={}, customers_list={}):
 		customers_list = json.loads(customers_list)
 
 	customers_list = make_customer_and_address(customers_list)
-	name_list = []
+
+	# invoices are submitted by background workers, see POS Invoice Queue
+	invoices = OrderedDict()
 	for docs in doc_list:
-		for name, doc in iteritems(docs):
-			if not frappe.db.exists('Sales Invoice', {'offline_pos_name': name}):
-				validate_records(doc)
-				si_doc = frappe.new_doc('Sales Invoice')
-				si_doc.offline_pos_name = name
-				si_doc.update(doc)
-				si_doc.set_posting_time = 1
-				si_doc.customer = get_customer_id(doc)
-				si_doc.due_date = doc.get('posting_date')
-				name_list = submit_invoice(si_doc, name, doc, name_list)
-			else:
-				name_list.append(name)
+		invoices.update(docs)
+
+	name_list = queue_invoices(invoices)
 
 	email_queue = make_email_queue(email_queue_list)
 	customers = get_customers_list()
 	return {
 		'invoice': name_list,
+		'invoice_status': get_invoice_status(name_list),
 		'email_queue': email_queue,
 		'customers': customers_list,
 		'synced_customers_list': customers,
@@ -547,36 +709,54 @@ def validate_item(doc):
 			frappe.db.commit()
 
 
-def submit_invoice(si_doc, name, doc, name_list):
+def submit_invoice(name, doc):
+	"""Create the Sales Invoice of the offline invoice and submit it. If it cannot be
+	submitted, it is saved as draft with the error in `flags.error_log`.
+
+	offline_pos_name is unique, so if another worker created the invoice in the
+	meantime, the insert fails and that invoice is returned"""
+	existing = frappe.db.get_value('Sales Invoice', {'offline_pos_name': name})
+	if existing:
+		return frappe.get_doc('Sales Invoice', existing)
+
+	validate_records(doc)
+	si_doc = frappe.new_doc('Sales Invoice')
+	si_doc.offline_pos_name = name
+	si_doc.update(doc)
+	si_doc.set_posting_time = 1
+	si_doc.customer = get_customer_id(doc)
+	si_doc.due_date = doc.get('posting_date')
+
 	try:
 		si_doc.insert()
 		si_doc.submit()
 		frappe.db.commit()
-		name_list.append(name)
 	except Exception as e:
 		if frappe.message_log:
 			frappe.message_log.pop()
 		frappe.db.rollback()
-		frappe.log_error(frappe.get_traceback())
-		name_list = save_invoice(doc, name, name_list)
 
-	return name_list
+		existing = frappe.db.get_value('Sales Invoice', {'offline_pos_name': name})
+		if existing:
+			return frappe.get_doc('Sales Invoice', existing)
 
+		error_log = frappe.get_traceback()
+		frappe.log_error(error_log)
+		si_doc = save_invoice(doc, name)
+		si_doc.flags.error_log = error_log
 
-def save_invoice(doc, name, name_list):
-	try:
-		if not frappe.db.exists('Sales Invoice', {'offline_pos_name': name}):
-			si = frappe.new_doc('Sales Invoice')
-			si.update(doc)
-			si.set_posting_time = 1
-			si.customer = get_customer_id(doc)
-			si.due_date = doc.get('posting_date')
-			si.flags.ignore_mandatory = True
-			si.insert(ignore_permissions=True)
-			frappe.db.commit()
-			name_list.append(name)
-	except Exception:
-		frappe.db.rollback()
-		frappe.log_error(frappe.get_traceback())
+	return si_doc
 
-	return name_list
+
+def save_invoice(doc, name):
+	si = frappe.new_doc('Sales Invoice')
+	si.update(doc)
+	si.offline_pos_name = name
+	si.set_posting_time = 1
+	si.customer = get_customer_id(doc)
+	si.due_date = doc.get('posting_date')
+	si.flags.ignore_mandatory = True
+	si.insert(ignore_permissions=True)
+	frappe.db.commit()
+
+	return si
@@ -8,6 +8,7 @@ from frappe.utils import cint, flt, add_months, today, date_diff, getdate, add_d
 from frappe import _, msgprint, throw
 from erpnext.accounts.party import get_party_account, get_due_date
 from erpnext.controllers.stock_controller import update_gl_entries_after
+from erpnext.stock.doctype.repost_item_valuation.repost_item_valuation import is_reposting_deferred
 from frappe.model.mapper import get_mapped_doc
 from erpnext.accounts.doctype.sales_invoice.pos import update_multi_mode_option
 
@@ -681,7 +682,7 @@ class SalesInvoice(SellingController):
 					self.doctype, self.return_against if cint(self.is_return) and self.return_against else self.name)
 
 			if repost_future_gle and cint(self.update_stock) \
-				and cint(auto_accounting_for_stock):
+				and cint(auto_accounting_for_stock) and not is_reposting_deferred():
 					items, warehouses = self.get_items_and_warehouses()
 					update_gl_entries_after(self.posting_date, self.posting_time, warehouses, items)
 		elif self.docstatus == 2 and cint(self.update_stock) \
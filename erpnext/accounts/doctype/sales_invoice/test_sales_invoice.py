@@ -653,6 +653,8 @@ class TestSalesInvoice(unittest.TestCase):
 
 	def test_make_pos_invoice(self):
 		from erpnext.accounts.doctype.sales_invoice.pos import make_invoice
+		from erpnext.accounts.doctype.pos_invoice_queue.pos_invoice_queue import get_invoice_status
+		from erpnext.utilities.lock import acquire_lock, release_lock
 
 		set_perpetual_inventory()
 
@@ -675,6 +677,26 @@ class TestSalesInvoice(unittest.TestCase):
 
 		self.pos_gl_entry(si, pos, 330)
 
+		# invoices already received are not queued again
+		self.assertEqual(make_invoice(invoice_data).get('invoice'), ['09052016142'])
+		self.assertEqual(len(frappe.get_all('Sales Invoice', filters={'offline_pos_name': '09052016142'})), 1)
+		self.assertEqual(get_invoice_status(['09052016142'])['09052016142'].status, 'Completed')
+
+		# only one worker gets the lock of a warehouse queue
+		lock = "pos_invoice_queue_running:_Test Warehouse - _TC"
+		token = acquire_lock(lock)
+		self.assertTrue(token)
+		self.assertFalse(acquire_lock(lock))
+
+		# the lock is only released with the token of the worker holding it
+		release_lock(lock, "_Test Other Worker")
+		self.assertFalse(acquire_lock(lock))
+		release_lock(lock, token)
+
+		token = acquire_lock(lock)
+		self.assertTrue(token)
+		release_lock(lock, token)
+
 	def test_make_pos_invoice_in_draft(self):
 		from erpnext.accounts.doctype.sales_invoice.pos import make_invoice
 		from erpnext.stock.doctype.item.test_item import make_item
@@ -47,12 +47,18 @@ def process_gl_map(gl_map, merge_entries=True):
 
 	return gl_map
 
+# properties of GL Entries that are merged into one entry
+merge_properties = ['account', 'party_type', 'party', 'against_voucher', 'against_voucher_type',
+	'cost_center', 'project']
+
 def merge_similar_entries(gl_map):
 	merged_gl_map = []
+	merged_entries = {}
 	for entry in gl_map:
 		# if there is already an entry in this account then just add it
 		# to that entry
-		same_head = check_if_in_list(entry, merged_gl_map)
+		key = get_merge_key(entry)
+		same_head = merged_entries.get(key)
 		if same_head:
 			same_head.debit	= flt(same_head.debit) + flt(entry.debit)
 			same_head.debit_in_account_currency	= \
@@ -61,6 +67,7 @@ def merge_similar_entries(gl_map):
 			same_head.credit_in_account_currency = \
 				flt(same_head.credit_in_account_currency) + flt(entry.credit_in_account_currency)
 		else:
+			merged_entries[key] = entry
 			merged_gl_map.append(entry)
 
 	# filter zero debit and credit entries
@@ -69,16 +76,8 @@ def merge_similar_entries(gl_map):
 
 	return merged_gl_map
 
-def check_if_in_list(gle, gl_map):
-	for e in gl_map:
-		if e.account == gle.account \
-			and cstr(e.get('party_type'))==cstr(gle.get('party_type')) \
-			and cstr(e.get('party'))==cstr(gle.get('party')) \
-			and cstr(e.get('against_voucher'))==cstr(gle.get('against_voucher')) \
-			and cstr(e.get('against_voucher_type')) == cstr(gle.get('against_voucher_type')) \
-			and cstr(e.get('cost_center')) == cstr(gle.get('cost_center')) \
-			and cstr(e.get('project')) == cstr(gle.get('project')):
-				return e
+def get_merge_key(gle):
+	return tuple(cstr(gle.get(d)) for d in merge_properties)
 
 def save_entries(gl_map, adv_adj, update_outstanding, from_repost=False):
 	if not from_repost:
@@ -86,21 +85,83 @@ def save_entries(gl_map, adv_adj, update_outstanding, from_repost=False):
 
 	round_off_debit_credit(gl_map)
 
-	for entry in gl_map:
-		make_entry(entry, adv_adj, update_outstanding, from_repost)
+	account_details = make_entries(gl_map, adv_adj, update_outstanding, from_repost)
+
+	# check against budget
+	if not from_repost:
+		for entry in gl_map:
+			if entry.get("item_code") or account_details.get(entry.account, {}).get("root_type") == "Expense":
+				validate_expense_against_budget(entry)
+
+def make_entries(gl_map, adv_adj, update_outstanding, from_repost=False):
+	"""Validate the GL Entries of a voucher against one snapshot of their accounts
+	and cost centers, insert them together, then check account balances and update
+	outstanding once per account and against voucher.
+
+	The hooks of `insert` and `submit` are run, but the link and mandatory checks of
+	`insert` are not, as `validate` checks the accounts and cost centers against the
+	snapshot and the mandatory fields itself.
+
+	Returns the account snapshot."""
+	from frappe.model.naming import set_new_name
+	from erpnext.utilities.bulk_insert import bulk_insert
+	from erpnext.accounts.doctype.account_period_balance.account_period_balance import add_gl_entries
+	from erpnext.accounts.doctype.gl_entry.gl_entry import get_account_details, get_cost_center_company, \
+		check_freezing_date, validate_frozen_account, validate_balance_type, update_outstanding_amt
+
+	account_details = get_account_details(list(set(d.account for d in gl_map if d.account)))
+	cost_center_company = get_cost_center_company(list(set(d.cost_center for d in gl_map if d.cost_center)))
+
+	gl_entries = []
+	for args in gl_map:
+		args.update({"doctype": "GL Entry"})
+		gle = frappe.get_doc(args)
+		gle.flags.ignore_permissions = 1
+		gle.flags.from_repost = from_repost
+		gle.flags.account_details = account_details
+		gle.flags.cost_center_company = cost_center_company
+		gle.docstatus = 1
+		gle.run_method("before_insert")
+		gle.run_method("validate")
+		gle.run_method("before_submit")
 
-		# check against budget
 		if not from_repost:
-			validate_expense_against_budget(entry)
+			gle.validate_account_details(adv_adj)
+
+		set_new_name(gle)
+		gl_entries.append(gle)
+
+	if not from_repost:
+		for posting_date in set(d.posting_date for d in gl_entries):
+			check_freezing_date(posting_date, adv_adj)
+
+	bulk_insert(gl_entries)
+	add_gl_entries(gl_entries)
+
+	for account in set(d.account for d in gl_entries):
+		if account_details.get(account, {}).get("freeze_account") == "Yes":
+			validate_frozen_account(account, adv_adj)
+		if account_details.get(account, {}).get("balance_must_be"):
+			validate_balance_type(account, adv_adj)
+
+	# Update outstanding amt on against voucher
+	if update_outstanding == 'Yes' and not from_repost:
+		against_vouchers = []
+		for d in gl_entries:
+			key = (d.account, d.party_type, d.party, d.against_voucher_type, d.against_voucher)
+			if d.against_voucher_type in ['Journal Entry', 'Sales Invoice', 'Purchase Invoice', 'Fees'] \
+				and d.against_voucher and key not in against_vouchers:
+					against_vouchers.append(key)
 
-def make_entry(args, adv_adj, update_outstanding, from_repost=False):
-	args.update({"doctype": "GL Entry"})
-	gle = frappe.get_doc(args)
-	gle.flags.ignore_permissions = 1
-	gle.flags.from_repost = from_repost
-	gle.insert()
-	gle.run_method("on_update_with_args", adv_adj, update_outstanding, from_repost)
-	gle.submit()
+		for args in against_vouchers:
+			update_outstanding_amt(*args)
+
+	for gle in gl_entries:
+		gle.run_method("after_insert")
+		gle.run_method("on_update")
+		gle.run_method("on_submit")
+
+	return account_details
 
 def validate_account_for_perpetual_inventory(gl_map):
 	if cint(erpnext.is_perpetual_inventory_enabled(gl_map[0].company)) \
@@ -187,6 +248,7 @@ def delete_gl_entries(gl_entries=None, voucher_type=None, voucher_no=None,
 
 	from erpnext.accounts.doctype.gl_entry.gl_entry import validate_balance_type, \
 		check_freezing_date, update_outstanding_amt, validate_frozen_account
+	from erpnext.accounts.doctype.account_period_balance.account_period_balance import remove_vouchers
 
 	if not gl_entries:
 		gl_entries = frappe.db.sql("""
@@ -198,8 +260,11 @@ def delete_gl_entries(gl_entries=None, voucher_type=None, voucher_no=None,
 	if gl_entries:
 		check_freezing_date(gl_entries[0]["posting_date"], adv_adj)
 
+	voucher_type, voucher_no = voucher_type or gl_entries[0]["voucher_type"], voucher_no or gl_entries[0]["voucher_no"]
+	remove_vouchers([(voucher_type, voucher_no)])
+
 	frappe.db.sql("""delete from `tabGL Entry` where voucher_type=%s and voucher_no=%s""",
-		(voucher_type or gl_entries[0]["voucher_type"], voucher_no or gl_entries[0]["voucher_no"]))
+		(voucher_type, voucher_no))
 
 	for entry in gl_entries:
 		validate_frozen_account(entry["account"], adv_adj)
@@ -34,6 +34,9 @@ frappe.pages['pos'].refresh = function (wrapper) {
 erpnext.pos.PointOfSale = erpnext.taxes_and_totals.extend({
 	init: function (wrapper) {
 		this.page_len = 20;
+		this.master_data_page_length = 5000;
+		this.master_datasets = ['items', 'item_groups', 'customers', 'address', 'contacts', 'serial_no_data',
+			'batch_no_data', 'barcode_data', 'tax_data', 'price_list_data', 'bin_data', 'pricing_rules'];
 		this.freeze = false;
 		this.page = wrapper.page;
 		this.wrapper = $(wrapper).find('.page-content');
@@ -279,18 +282,50 @@ erpnext.pos.PointOfSale = erpnext.taxes_and_totals.extend({
 	},
 
 	get_data_from_server: function (callback) {
+		var me = this;
+		this.get_master_data_page(0, null, function (r) {
+			localStorage.setItem('doc', JSON.stringify(r.message.doc));
+			me.init_master_data(r)
+			me.set_interval_for_si_sync();
+			me.check_internet_connection();
+			if (callback) {
+				callback();
+			}
+		});
+	},
+
+	get_master_data_page: function (start, data, callback) {
+		// master data is loaded in pages of a snapshot on the server,
+		// restart if the snapshot is rebuilt in between
 		var me = this;
 		frappe.call({
 			method: "erpnext.accounts.doctype.sales_invoice.pos.get_pos_data",
+			args: {
+				start: start,
+				page_length: this.master_data_page_length,
+				snapshot: data ? data.sync_watermark : null
+			},
 			freeze: true,
 			freeze_message: __("Master data syncing, it might take some time"),
 			callback: function (r) {
-				localStorage.setItem('doc', JSON.stringify(r.message.doc));
-				me.init_master_data(r)
-				me.set_interval_for_si_sync();
-				me.check_internet_connection();
-				if (callback) {
-					callback();
+				if (r.message.snapshot_changed) {
+					me.get_master_data_page(0, null, callback);
+					return;
+				}
+
+				if (data) {
+					$.each(me.master_datasets, function (i, key) {
+						data[key] = Array.isArray(data[key]) ?
+							data[key].concat(r.message[key] || []) : Object.assign(data[key] || {}, r.message[key]);
+					});
+				} else {
+					data = r.message;
+				}
+
+				if (r.message.has_more) {
+					me.get_master_data_page(start + me.master_data_page_length, data, callback);
+				} else {
+					callback({message: data});
 				}
 			},
 			error: () => {
@@ -299,6 +334,105 @@ erpnext.pos.PointOfSale = erpnext.taxes_and_totals.extend({
 		})
 	},
 
+	sync_master_data: function () {
+		// fetch the records modified since the last sync and merge them in place
+		var me = this;
+		if (!this.sync_watermark || this.syncing_master_data) return;
+
+		this.syncing_master_data = true;
+		frappe.call({
+			method: "erpnext.accounts.doctype.sales_invoice.pos.get_pos_data",
+			args: {
+				sync_from: this.sync_watermark
+			},
+			callback: function (r) {
+				me.syncing_master_data = false;
+				if (r.message) {
+					me.merge_master_data(r.message);
+				}
+			},
+			error: function () {
+				me.syncing_master_data = false;
+			}
+		})
+	},
+
+	merge_master_data: function (data) {
+		var me = this;
+		var deleted = data.deleted || {};
+
+		// syncs overlap, so rows already loaded are replaced by name
+		var merge_list = function (list, rows, removed) {
+			var names = {};
+			$.each((rows || []).map(function (d) { return d.name; }).concat(removed || []), function (i, name) {
+				names[name] = true;
+			});
+			return $.grep(list || [], function (d) {
+				return !names[d.name];
+			}).concat(rows || []);
+		};
+
+		this.item_data = merge_list(this.item_data, data.items, deleted.items);
+		this.items = this.item_data;
+		this.customers = merge_list(this.customers, data.customers, deleted.customers);
+		this.pricing_rules = merge_list(this.pricing_rules, data.pricing_rules, deleted.pricing_rules);
+		this.item_groups = data.item_groups;
+
+		Object.assign(this.address, data.address);
+		Object.assign(this.contacts, data.contacts);
+		Object.assign(this.barcode_data, data.barcode_data);
+		Object.assign(this.tax_data, data.tax_data);
+		Object.assign(this.price_list_data, data.price_list_data);
+		$.each(deleted.items || [], function (i, item_code) {
+			delete me.barcode_data[item_code];
+			delete me.tax_data[item_code];
+		});
+		$.each(deleted.customers || [], function (i, customer) {
+			delete me.address[customer];
+			delete me.contacts[customer];
+		});
+		$.each(deleted.price_list_data || [], function (i, item_code) {
+			delete me.price_list_data[item_code];
+		});
+
+		$.each(data.serial_no_data || {}, function (item_code, serial_nos) {
+			me.serial_no_data[item_code] = Object.assign(me.serial_no_data[item_code] || {}, serial_nos);
+		});
+		$.each(deleted.serial_no_data || [], function (i, d) {
+			if (me.serial_no_data[d[0]]) delete me.serial_no_data[d[0]][d[1]];
+		});
+
+		$.each(data.batch_no_data || {}, function (item_code, batches) {
+			var existing = me.batch_no_data[item_code] || [];
+			var existing_batches = {};
+			$.each(existing, function (i, batch) { existing_batches[batch] = true; });
+			me.batch_no_data[item_code] = existing.concat($.grep(batches, function (batch) {
+				return !existing_batches[batch];
+			}));
+		});
+		$.each(deleted.batch_no_data || [], function (i, d) {
+			if (me.batch_no_data[d[0]]) {
+				me.batch_no_data[d[0]] = $.grep(me.batch_no_data[d[0]], function (batch) {
+					return batch != d[1];
+				});
+			}
+		});
+
+		$.each(data.bin_data || {}, function (item_code, warehouses) {
+			me.bin_data[item_code] = me.bin_data[item_code] || {};
+			$.each(warehouses, function (warehouse, qty) {
+				if (qty > 0) {
+					me.bin_data[item_code][warehouse] = qty;
+				} else {
+					delete me.bin_data[item_code][warehouse];
+				}
+			});
+		});
+
+		this.sync_watermark = data.sync_watermark;
+		this.prepare_customer_mapper();
+	},
+
 	init_master_data: function (r) {
 		var me = this;
 		this.doc = JSON.parse(localStorage.getItem('doc'));
@@ -315,6 +449,7 @@ erpnext.pos.PointOfSale = erpnext.taxes_and_totals.extend({
 		this.price_list_data = r.message.price_list_data;
 		this.bin_data = r.message.bin_data;
 		this.pricing_rules = r.message.pricing_rules;
+		this.sync_watermark = r.message.sync_watermark;
 		this.print_template = r.message.print_template;
 		this.pos_profile_data = r.message.pos_profile;
 		this.default_customer = r.message.default_customer || null;
@@ -1716,6 +1851,10 @@ erpnext.pos.PointOfSale = erpnext.taxes_and_totals.extend({
 			me.freeze_screen = false;
 			me.sync_sales_invoice()
 		}, 180000)
+
+		setInterval(function () {
+			me.sync_master_data();
+		}, 300000)
 	},
 
 	sync_sales_invoice: function () {
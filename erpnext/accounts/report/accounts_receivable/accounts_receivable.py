@@ -172,10 +172,12 @@ class ReceivablePayableReport(object):
 			dn_details = get_dn_details(args.get("party_type"), voucher_nos)
 			voucher_details = get_voucher_details(args.get("party_type"), voucher_nos, dn_details)
 
+		self.set_voucher_balances(gl_entries_data, dr_or_cr, return_entries, currency_precision)
+
 		for gle in gl_entries_data:
 			if self.is_receivable_or_payable(gle, dr_or_cr, future_vouchers):
 				outstanding_amount, credit_note_amount = self.get_outstanding_amount(gle,
-					self.filters.report_date, dr_or_cr, return_entries, currency_precision)
+					dr_or_cr, return_entries, currency_precision)
 				if abs(outstanding_amount) > 0.1/10**currency_precision:
 					row = [gle.posting_date, gle.party]
 
@@ -254,8 +256,8 @@ class ReceivablePayableReport(object):
 		return data
 
 	def get_entries_after(self, report_date, party_type):
-		# returns a distinct list
-		return list(set([(e.voucher_type, e.voucher_no) for e in self.get_gl_entries(party_type, report_date, for_future=True)]))
+		# returns a set of (voucher_type, voucher_no)
+		return set([(e.voucher_type, e.voucher_no) for e in self.get_gl_entries(party_type, report_date, for_future=True)])
 
 	def get_entries_till(self, report_date, party_type):
 		# returns a generator
@@ -278,19 +280,33 @@ class ReceivablePayableReport(object):
 
 	def get_return_entries(self, party_type):
 		doctype = "Sales Invoice" if party_type=="Customer" else "Purchase Invoice"
-		return [d.name for d in frappe.get_all(doctype, filters={"is_return": 1, "docstatus": 1})]
+		return set([d.name for d in frappe.get_all(doctype, filters={"is_return": 1, "docstatus": 1})])
+
+	def set_voucher_balances(self, gl_entries, dr_or_cr, return_entries, currency_precision):
+		"""Sum the payments and credit notes against each voucher in one pass, keyed by
+		(party, against_voucher_type, against_voucher)"""
+		self.voucher_balances = {}
+		for e in gl_entries:
+			if e.against_voucher_type and e.against_voucher:
+				balance = self.voucher_balances.setdefault((e.party, e.against_voucher_type, e.against_voucher), [0.0, 0.0])
+				balance[1 if e.voucher_no in return_entries else 0] += \
+					self.get_adjusted_amount(e, dr_or_cr, currency_precision)
+
+	def get_adjusted_amount(self, e, dr_or_cr, currency_precision):
+		reverse_dr_or_cr = "credit" if dr_or_cr=="debit" else "debit"
+		return flt(e.get(reverse_dr_or_cr), currency_precision) - flt(e.get(dr_or_cr), currency_precision)
 
-	def get_outstanding_amount(self, gle, report_date, dr_or_cr, return_entries, currency_precision):
-		payment_amount, credit_note_amount = 0.0, 0.0
+	def get_outstanding_amount(self, gle, dr_or_cr, return_entries, currency_precision):
 		reverse_dr_or_cr = "credit" if dr_or_cr=="debit" else "debit"
+		payment_amount, credit_note_amount = self.voucher_balances.get((gle.party, gle.voucher_type, gle.voucher_no),
+			[0.0, 0.0])
 
-		for e in self.get_gl_entries_for(gle.party, gle.party_type, gle.voucher_type, gle.voucher_no):
-			if getdate(e.posting_date) <= report_date and e.name!=gle.name:
-				amount = flt(e.get(reverse_dr_or_cr), currency_precision) - flt(e.get(dr_or_cr), currency_precision)
-				if e.voucher_no not in return_entries:
-					payment_amount += amount
-				else:
-					credit_note_amount += amount
+		# the entry itself is included in the balance if it is against its own voucher
+		if gle.against_voucher_type == gle.voucher_type and gle.against_voucher == gle.voucher_no:
+			if gle.voucher_no not in return_entries:
+				payment_amount -= self.get_adjusted_amount(gle, dr_or_cr, currency_precision)
+			else:
+				credit_note_amount -= self.get_adjusted_amount(gle, dr_or_cr, currency_precision)
 
 		outstanding_amount = (flt((flt(gle.get(dr_or_cr), currency_precision)
 			- flt(gle.get(reverse_dr_or_cr), currency_precision)
@@ -418,20 +434,6 @@ class ReceivablePayableReport(object):
 								
 		return " and ".join(conditions), values
 
-	def get_gl_entries_for(self, party, party_type, against_voucher_type, against_voucher):
-		if not hasattr(self, "gl_entries_map"):
-			self.gl_entries_map = {}
-			for gle in self.get_gl_entries(party_type):
-				if gle.against_voucher_type and gle.against_voucher:
-					self.gl_entries_map.setdefault(gle.party, {})\
-						.setdefault(gle.against_voucher_type, {})\
-						.setdefault(gle.against_voucher, [])\
-						.append(gle)
-
-		return self.gl_entries_map.get(party, {})\
-			.get(against_voucher_type, {})\
-			.get(against_voucher, [])
-
 	def get_chart_data(self, columns, data):
 		ageing_columns = columns[self.ageing_col_idx_start : self.ageing_col_idx_start+4]
 
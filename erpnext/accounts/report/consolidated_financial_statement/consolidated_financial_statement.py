@@ -4,9 +4,10 @@
 from __future__ import unicode_literals
 import frappe, erpnext
 from frappe import _
-from frappe.utils import flt, cint
+from frappe.utils import flt, cint, getdate
 from erpnext.accounts.report.utils import get_currency, convert_to_presentation_currency
-from erpnext.accounts.report.financial_statements import get_fiscal_year_data, sort_accounts
+from erpnext.accounts.report.financial_statements import (get_fiscal_year_data, sort_accounts,
+	get_gl_entries_group_by)
 from erpnext.accounts.report.balance_sheet.balance_sheet import (get_provisional_profit_loss,
 	check_opening_balance, get_chart_data)
 from erpnext.accounts.report.profit_and_loss_statement.profit_and_loss_statement import (get_net_profit_loss,
@@ -344,20 +345,28 @@ def set_gl_entries_by_account(from_date, to_date, root_lft, root_rgt, filters, g
 	})
 
 	for d in companies:
-		gl_entries = frappe.db.sql("""select gl.posting_date, gl.account, gl.debit, gl.credit, gl.is_opening, gl.company,
-			gl.fiscal_year, gl.debit_in_account_currency, gl.credit_in_account_currency, gl.account_currency,
+		values = {
+			"from_date": from_date,
+			"to_date": to_date,
+			"lft": root_lft,
+			"rgt": root_rgt,
+			"company": d.name
+		}
+
+		# sum up the entries before and after the start of the fiscal year per account
+		group_by = get_gl_entries_group_by([getdate(from_date)], values,
+			filters and filters.get('presentation_currency') != d.default_currency, prefix="gl.")
+
+		gl_entries = frappe.db.sql("""select max(gl.posting_date) as posting_date, gl.account,
+			sum(gl.debit) as debit, sum(gl.credit) as credit, gl.is_opening, gl.company, gl.fiscal_year,
+			sum(gl.debit_in_account_currency) as debit_in_account_currency,
+			sum(gl.credit_in_account_currency) as credit_in_account_currency, gl.account_currency,
 			acc.account_name, acc.account_number
 			from `tabGL Entry` gl, `tabAccount` acc where acc.name = gl.account and gl.company = %(company)s
 			{additional_conditions} and gl.posting_date <= %(to_date)s and acc.lft >= %(lft)s and acc.rgt <= %(rgt)s
-			order by gl.account, gl.posting_date""".format(additional_conditions=additional_conditions),
-			{
-				"from_date": from_date,
-				"to_date": to_date,
-				"lft": root_lft,
-				"rgt": root_rgt,
-				"company": d.name
-			},
-			as_dict=True)
+			group by {group_by}
+			order by gl.account, posting_date""".format(additional_conditions=additional_conditions,
+				group_by=group_by), values, as_dict=True)
 
 		if filters and filters.get('presentation_currency') != d.default_currency:
 			currency_info['company'] = d.name
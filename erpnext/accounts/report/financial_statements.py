@@ -145,7 +145,8 @@ def get_data(
 			period_list[0]["year_start_date"] if only_current_fiscal_year else None,
 			period_list[-1]["to_date"],
 			root.lft, root.rgt, filters,
-			gl_entries_by_account, ignore_closing_entries=ignore_closing_entries
+			gl_entries_by_account, ignore_closing_entries=ignore_closing_entries,
+			period_list=period_list
 		)
 
 	calculate_values(
@@ -336,29 +337,40 @@ def sort_accounts(accounts, is_root=False, key="name"):
 	accounts.sort(key = functools.cmp_to_key(compare_accounts))
 
 def set_gl_entries_by_account(
-		company, from_date, to_date, root_lft, root_rgt, filters, gl_entries_by_account, ignore_closing_entries=False):
-	"""Returns a dict like { "account": [gl entries], ... }"""
+		company, from_date, to_date, root_lft, root_rgt, filters, gl_entries_by_account,
+		ignore_closing_entries=False, period_list=None):
+	"""Returns a dict like { "account": [gl entries], ... }
+
+	GL Entries are summed up per account and period of `period_list`, so the
+	number of rows depends on the accounts and periods, not on the ledger size"""
 
 	additional_conditions = get_additional_conditions(from_date, ignore_closing_entries, filters)
 
-	accounts = frappe.db.sql_list("""select name from `tabAccount`
-		where lft >= %s and rgt <= %s""", (root_lft, root_rgt))
-	additional_conditions += " and account in ({})"\
-		.format(", ".join([frappe.db.escape(d) for d in accounts]))
+	values = {
+		"company": company,
+		"from_date": from_date,
+		"to_date": to_date,
+		"lft": root_lft,
+		"rgt": root_rgt,
+		"cost_center": filters.cost_center,
+		"project": filters.project
+	}
+
+	group_by = get_gl_entries_group_by(get_period_boundaries(period_list), values,
+		filters and filters.get('presentation_currency'))
 
-	gl_entries = frappe.db.sql("""select posting_date, account, debit, credit, is_opening, fiscal_year, debit_in_account_currency, credit_in_account_currency, account_currency from `tabGL Entry`
+	gl_entries = frappe.db.sql("""select max(posting_date) as posting_date, account,
+			sum(debit) as debit, sum(credit) as credit, is_opening, fiscal_year,
+			sum(debit_in_account_currency) as debit_in_account_currency,
+			sum(credit_in_account_currency) as credit_in_account_currency, account_currency
+		from `tabGL Entry`
 		where company=%(company)s
 		{additional_conditions}
 		and posting_date <= %(to_date)s
-		order by account, posting_date""".format(additional_conditions=additional_conditions),
-		{
-			"company": company,
-			"from_date": from_date,
-			"to_date": to_date,
-			"cost_center": filters.cost_center,
-			"project": filters.project
-		},
-		as_dict=True)
+		and account in (select name from `tabAccount` where lft >= %(lft)s and rgt <= %(rgt)s)
+		group by {group_by}
+		order by account, posting_date""".format(additional_conditions=additional_conditions,
+			group_by=group_by), values, as_dict=True)
 
 	if filters and filters.get('presentation_currency'):
 		convert_to_presentation_currency(gl_entries, get_currency(filters))
@@ -369,6 +381,41 @@ def set_gl_entries_by_account(
 	return gl_entries_by_account
 
 
+def get_period_boundaries(period_list):
+	"""Returns the sorted dates on which a period of `period_list` or its fiscal year starts"""
+	if not period_list:
+		return []
+
+	boundaries = set([getdate(period_list[0].year_start_date)])
+	for period in period_list:
+		boundaries.add(getdate(period.from_date))
+		boundaries.add(add_days(getdate(period.to_date), 1))
+
+	return sorted(boundaries)
+
+
+def get_gl_entries_group_by(boundaries, values, presentation_currency=None, prefix=""):
+	"""Returns the `group by` clause to sum up GL Entries per account and period between
+	`boundaries`. The latest posting date of a group compares to the boundaries like
+	all of its entries do.
+
+	Conversion to a presentation currency is done per posting date and side of the entry,
+	so entries are also grouped by those."""
+	group_by = [prefix + d for d in ("account", "fiscal_year", "is_opening", "account_currency")]
+
+	if boundaries:
+		period = []
+		for i, date in enumerate(boundaries):
+			values["period_boundary_{0}".format(i)] = date
+			period.append("({0}posting_date >= %(period_boundary_{1})s)".format(prefix, i))
+		group_by.append(" + ".join(period))
+
+	if presentation_currency:
+		group_by += [prefix + "posting_date", "{0}debit != 0".format(prefix)]
+
+	return ", ".join(group_by)
+
+
 def get_additional_conditions(from_date, ignore_closing_entries, filters):
 	additional_conditions = []
 
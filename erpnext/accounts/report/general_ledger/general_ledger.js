@@ -2,6 +2,32 @@
 // License: GNU General Public License v3. See license.txt
 
 frappe.query_reports["General Ledger"] = {
+	onload: function(report) {
+		// large ledgers are written to a file on the server row by row
+		report.page.add_inner_button(__("Export Ledger"), function() {
+			frappe.prompt({
+				fieldname: "file_format_type",
+				label: __("File Format"),
+				fieldtype: "Select",
+				options: ["CSV", "Excel"],
+				default: "CSV"
+			}, function(values) {
+				frappe.call({
+					method: "erpnext.accounts.report.general_ledger.general_ledger.export_ledger",
+					args: {
+						filters: report.get_values(),
+						file_format_type: values.file_format_type
+					},
+					freeze: true,
+					callback: function(r) {
+						if (r.message) {
+							window.open(r.message);
+						}
+					}
+				});
+			}, __("Export Ledger"), __("Export"));
+		});
+	},
 	"filters": [
 		{
 			"fieldname":"company",
@@ -3,18 +3,30 @@
 
 from __future__ import unicode_literals
 import frappe, erpnext
+import csv, hashlib, io, json, os
+import six
 from erpnext import get_company_currency, get_default_company
 from erpnext.accounts.report.utils import get_currency, convert_to_presentation_currency
-from frappe.utils import getdate, cstr, flt, fmt_money
+from frappe.utils import cstr, flt, fmt_money
 from frappe import _, _dict
 from erpnext.accounts.utils import get_account_currency
 from erpnext.accounts.report.financial_statements import get_cost_centers_with_children
-from six import iteritems
+from six import iteritems, string_types
 
 def execute(filters=None):
 	if not filters:
 		return [], []
 
+	filters = prepare_filters(filters)
+
+	columns = get_columns(filters)
+
+	res = list(get_ledger_rows(filters))
+
+	return columns, res
+
+
+def prepare_filters(filters):
 	account_details = {}
 
 	if filters and filters.get('print_in_account_currency') and \
@@ -32,13 +44,7 @@ def execute(filters=None):
 
 	validate_party(filters)
 
-	filters = set_account_currency(filters)
-
-	columns = get_columns(filters)
-
-	res = get_result(filters, account_details)
-
-	return columns, res
+	return set_account_currency(filters)
 
 
 def validate_filters(filters, account_details):
@@ -106,25 +112,222 @@ def set_account_currency(filters):
 
 	return filters
 
-def get_result(filters, account_details):
-	gl_entries = get_gl_entries(filters)
+def get_ledger_rows(filters, page_length=5000):
+	"""Yields the rows of the report with running balances.
+
+	Opening balances are read with aggregate queries, and GL Entries are fetched in
+	pages ordered by the group, so that only one page is held in memory"""
+	consolidated = filters.get("group_by") == _("Group by Voucher (Consolidated)")
+	group_by = group_by_field(filters.get("group_by"))
+	show_group_balances = filters.get("group_by") != _("Group by Voucher")
+
+	# openings of vouchers are not shown, so only the total opening is needed for them
+	totals = get_totals_dict()
+	opening, openings = get_opening_balances(filters,
+		group_by if filters.get("group_by") in [_('Group by Account'), _('Group by Party')] else None)
+	update_value_in_dict(totals, 'opening', opening)
+	update_value_in_dict(totals, 'closing', opening)
+
+	balance = BalanceCalculator(filters)
+	yield balance.update(totals.opening)
+
+	group, group_totals = None, None
+	for gle in get_gl_entries(filters, page_length):
+		update_value_in_dict(totals, 'total', gle)
+		update_value_in_dict(totals, 'closing', gle)
+
+		if not consolidated:
+			if group_totals is None or cstr(gle.get(group_by)) != group:
+				if group_totals:
+					for row in get_group_closing_rows(group_totals, show_group_balances):
+						yield balance.update(row)
+
+				group = cstr(gle.get(group_by))
+				group_totals = get_totals_dict()
+				if group in openings:
+					for key in ('opening', 'closing'):
+						update_value_in_dict(group_totals, key, openings[group])
+
+				yield balance.update({})
+				if show_group_balances:
+					yield balance.update(group_totals.opening)
+
+			update_value_in_dict(group_totals, 'total', gle)
+			update_value_in_dict(group_totals, 'closing', gle)
+
+		yield balance.update(gle)
+
+	if not consolidated:
+		if group_totals:
+			for row in get_group_closing_rows(group_totals, show_group_balances):
+				yield balance.update(row)
+
+		yield balance.update({})
+
+	yield balance.update(totals.total)
+	yield balance.update(totals.closing)
+
+
+@frappe.whitelist()
+def export_ledger(filters, file_format_type="CSV"):
+	"""Writes the report to a private CSV or Excel file row by row, and returns its url"""
+	if not frappe.get_doc("Report", "General Ledger").is_permitted():
+		frappe.throw(_("Not permitted"), frappe.PermissionError)
+
+	if isinstance(filters, string_types):
+		filters = json.loads(filters)
+
+	filters = prepare_filters(frappe._dict(filters))
+	columns = get_columns(filters)
+	fieldnames = [d.get("fieldname") for d in columns]
+
+	def get_rows():
+		yield [d.get("label") for d in columns]
+		for row in get_ledger_rows(filters):
+			yield [row.get(fieldname) for fieldname in fieldnames]
+
+	extension = "xlsx" if file_format_type == "Excel" else "csv"
+	file_name = "general_ledger_{0}.{1}".format(frappe.generate_hash(length=10), extension)
+	path = frappe.get_site_path("private", "files", file_name)
+
+	if extension == "xlsx":
+		write_xlsx(path, get_rows())
+	else:
+		write_csv(path, get_rows())
+
+	_file = frappe.get_doc({
+		"doctype": "File",
+		"file_name": file_name,
+		"file_url": "/private/files/" + file_name,
+		"is_private": 1,
+		"file_size": os.path.getsize(path),
+		"content_hash": get_file_hash(path)
+	})
+	_file.insert(ignore_permissions=True)
+
+	return _file.file_url
+
+
+def write_csv(path, rows):
+	if six.PY2:
+		with open(path, "wb") as f:
+			writer = csv.writer(f)
+			for row in rows:
+				writer.writerow([frappe.safe_encode(cstr(d)) for d in row])
+	else:
+		with io.open(path, "w", encoding="utf-8", newline="") as f:
+			writer = csv.writer(f)
+			for row in rows:
+				writer.writerow([cstr(d) for d in row])
+
+
+def write_xlsx(path, rows):
+	from openpyxl import Workbook
+
+	# write only workbooks do not keep the rows in memory
+	workbook = Workbook(write_only=True)
+	sheet = workbook.create_sheet(_("General Ledger"))
+	for row in rows:
+		sheet.append(row)
+
+	workbook.save(path)
+
+
+def get_file_hash(path):
+	content_hash = hashlib.md5()
+	with open(path, "rb") as f:
+		for chunk in iter(lambda: f.read(1024 * 1024), b""):
+			content_hash.update(chunk)
+
+	return content_hash.hexdigest()
+
+
+def get_group_closing_rows(group_totals, show_group_balances):
+	rows = [group_totals.total]
+	if show_group_balances:
+		rows.append(group_totals.closing)
+
+	return rows
+
+
+class BalanceCalculator(object):
+	"""Sets the running balance and supplier invoice no of the rows. The balance starts
+	again on rows without posting date, like the opening and total rows"""
+	def __init__(self, filters):
+		self.filters = filters
+		self.balance = 0
+
+	def update(self, row):
+		if not row.get('posting_date'):
+			self.balance = 0
+
+		self.balance = get_balance(row, self.balance, 'debit', 'credit')
+		row['balance'] = self.balance
+		row['account_currency'] = self.filters.account_currency
+		row.setdefault('bill_no', '')
+
+		return row
+
 
-	data = get_data_with_opening_closing(filters, account_details, gl_entries)
+def get_opening_balances(filters, group_by=None):
+	"""Returns the total opening debit and credit, and the openings per group if group_by
+	is set. Only the groups that have entries in the period are summed up by group"""
+	conditions = get_conditions(filters)
+	opening = get_opening_entries(filters, conditions)
 
-	result = get_result_as_list(data, filters)
+	openings = {}
+	if group_by:
+		conditions += """ and ifnull({group_by}, '') in (select distinct ifnull({group_by}, '')
+			from `tabGL Entry`
+			where company=%(company)s {conditions}
+				and posting_date >= %(from_date)s and posting_date <= %(to_date)s
+				and ifnull(is_opening, 'No') != 'Yes')""".format(group_by=group_by, conditions=conditions)
 
-	return result
+		for d in get_opening_entries(filters, conditions, group_by):
+			update_value_in_dict(openings.setdefault(cstr(d.get(group_by)), get_totals_dict()), 'opening', d)
 
-def get_gl_entries(filters):
+	total = get_totals_dict()
+	for d in opening:
+		update_value_in_dict(total, 'opening', d)
+
+	return total.opening, dict((key, d.opening) for key, d in iteritems(openings))
+
+
+def get_opening_entries(filters, conditions, group_by=None):
+	group_by_fields = [group_by] if group_by else []
+	if filters.get('presentation_currency'):
+		# entries are converted to the presentation currency by account, posting date and side
+		group_by_fields += ["account", "account_currency", "posting_date", "debit != 0"]
+
+	opening_entries = frappe.db.sql("""
+		select
+			{select_fields}
+			sum(debit) as debit, sum(credit) as credit,
+			sum(debit_in_account_currency) as debit_in_account_currency,
+			sum(credit_in_account_currency) as credit_in_account_currency
+		from `tabGL Entry`
+		where company=%(company)s {conditions}
+			and (posting_date < %(from_date)s or ifnull(is_opening, 'No') = 'Yes')
+		{group_by_statement}""".format(
+			select_fields="".join(["{0}, ".format(d) for d in group_by_fields if d != "debit != 0"]),
+			group_by_statement="group by {0}".format(", ".join(group_by_fields)) if group_by_fields else "",
+			conditions=conditions), filters, as_dict=1)
+
+	if filters.get('presentation_currency'):
+		convert_to_presentation_currency(opening_entries, get_currency(filters))
+
+	return opening_entries
+
+
+def get_gl_entries(filters, page_length=5000):
+	"""Yields the GL Entries from the from date to the to date in pages, using the
+	sort keys of the last entry of a page to fetch the next one"""
 	currency_map = get_currency(filters)
-	select_fields = """, debit, credit, debit_in_account_currency,
+	select_fields = """, name, debit, credit, debit_in_account_currency,
 		credit_in_account_currency """
 
 	group_by_statement = ''
-	order_by_statement = "order by posting_date, account"
-
-	if filters.get("group_by") == _("Group by Voucher"):
-		order_by_statement = "order by posting_date, voucher_type, voucher_no"
+	sort_keys = get_sort_keys(filters.get("group_by"))
 
 	if filters.get("group_by") == _("Group by Voucher (Consolidated)"):
 		group_by_statement = "group by voucher_type, voucher_no, account, cost_center"
@@ -132,27 +335,101 @@ def get_gl_entries(filters):
 			sum(debit_in_account_currency) as debit_in_account_currency,
 			sum(credit_in_account_currency) as  credit_in_account_currency"""
 
-	gl_entries = frappe.db.sql(
-		"""
-		select
-			posting_date, account, party_type, party,
-			voucher_type, voucher_no, cost_center, project,
-			against_voucher_type, against_voucher, account_currency,
-			remarks, against, is_opening {select_fields}
-		from `tabGL Entry`
-		where company=%(company)s {conditions} {group_by_statement}
-		{order_by_statement}
-		""".format(
-			select_fields=select_fields, conditions=get_conditions(filters),
-			group_by_statement=group_by_statement,
-			order_by_statement=order_by_statement
-		),
-		filters, as_dict=1)
-
-	if filters.get('presentation_currency'):
-		return convert_to_presentation_currency(gl_entries, currency_map)
+	conditions = get_conditions(filters)
+	values = frappe._dict(filters)
+	keyset_condition = ""
+
+	while True:
+		gl_entries = frappe.db.sql(
+			"""
+			select
+				posting_date, account, party_type, party,
+				voucher_type, voucher_no, cost_center, project,
+				against_voucher_type, against_voucher, account_currency,
+				remarks, against, is_opening {select_fields},
+				{sort_fields}
+			from `tabGL Entry`
+			where company=%(company)s {conditions}
+				and posting_date >= %(from_date)s and posting_date <= %(to_date)s
+				and ifnull(is_opening, 'No') != 'Yes'
+				{keyset_condition}
+			{group_by_statement}
+			order by {order_by}
+			limit %(page_length)s
+			""".format(
+				select_fields=select_fields, conditions=conditions,
+				sort_fields=", ".join(["{0} as sort_key_{1}".format(key, i) for i, key in enumerate(sort_keys)]),
+				keyset_condition=keyset_condition,
+				group_by_statement=group_by_statement,
+				order_by=", ".join(sort_keys)
+			),
+			dict(values, page_length=page_length), as_dict=1)
+
+		if not gl_entries:
+			break
+
+		last = gl_entries[-1]
+		for i in range(len(sort_keys)):
+			values["last_sort_key_{0}".format(i)] = last.pop("sort_key_{0}".format(i))
+
+		keyset_condition = get_keyset_condition(sort_keys)
+
+		for gle in gl_entries:
+			for i in range(len(sort_keys)):
+				gle.pop("sort_key_{0}".format(i), None)
+
+		if filters.get('presentation_currency'):
+			convert_to_presentation_currency(gl_entries, currency_map)
+
+		set_supplier_invoice_details(gl_entries)
+
+		for gle in gl_entries:
+			yield gle
+
+		if len(gl_entries) < page_length:
+			break
+
+
+def get_sort_keys(group_by):
+	"""Returns the unique order of the entries, with the entries of a group together.
+	The orders are covered by the indexes added in GL Entry's on_doctype_update, as
+	secondary indexes end with the name"""
+	if group_by == _("Group by Voucher (Consolidated)"):
+		return ["posting_date", "voucher_type", "voucher_no", "account", "ifnull(cost_center, '')"]
+	elif group_by == _("Group by Account"):
+		return ["account", "posting_date", "name"]
+	elif group_by == _("Group by Party"):
+		return ["party", "posting_date", "name"]
 	else:
-		return gl_entries
+		return ["posting_date", "voucher_type", "voucher_no", "name"]
+
+
+def get_keyset_condition(sort_keys):
+	"""Returns the condition for the entries after the last sort keys. The comparison is
+	expanded, as row value comparisons are not used for index range scans, and starts
+	with a range on the first key"""
+	condition = ""
+	for i in reversed(range(len(sort_keys))):
+		key, value = sort_keys[i], "%(last_sort_key_{0})s".format(i)
+		if condition:
+			condition = "{0} > {1} or ({0} = {1} and ({2}))".format(key, value, condition)
+		else:
+			condition = "{0} > {1}".format(key, value)
+
+	return "and {0} >= %(last_sort_key_0)s and ({1})".format(sort_keys[0], condition)
+
+
+def set_supplier_invoice_details(gl_entries):
+	against_vouchers = list(set([d.against_voucher for d in gl_entries if d.against_voucher]))
+	if not against_vouchers:
+		return
+
+	inv_details = dict(frappe.db.sql(""" select name, bill_no from `tabPurchase Invoice`
+		where docstatus = 1 and bill_no is not null and bill_no != '' and name in ({0})""".format(
+			", ".join(["%s"] * len(against_vouchers))), tuple(against_vouchers)))
+
+	for d in gl_entries:
+		d['bill_no'] = inv_details.get(d.against_voucher, '')
 
 
 def get_conditions(filters):
@@ -169,8 +446,11 @@ def get_conditions(filters):
 	if filters.get("voucher_no"):
 		conditions.append("voucher_no=%(voucher_no)s")
 
-	if filters.get("group_by") == "Group by Party" and not filters.get("party_type"):
-		conditions.append("party_type in ('Customer', 'Supplier')")
+	if filters.get("group_by") == _("Group by Party"):
+		# entries are paged by party, which can not be compared when null
+		conditions.append("party is not null")
+		if not filters.get("party_type"):
+			conditions.append("party_type in ('Customer', 'Supplier')")
 
 	if filters.get("party_type"):
 		conditions.append("party_type=%(party_type)s")
@@ -178,11 +458,6 @@ def get_conditions(filters):
 	if filters.get("party"):
 		conditions.append("party in %(party)s")
 
-	if not (filters.get("account") or filters.get("party") or
-		filters.get("group_by") in ["Group by Account", "Group by Party"]):
-		conditions.append("posting_date >=%(from_date)s")
-		conditions.append("posting_date <=%(to_date)s")
-
 	if filters.get("project"):
 		conditions.append("project in %(project)s")
 
@@ -202,45 +477,6 @@ def get_conditions(filters):
 	return "and {}".format(" and ".join(conditions)) if conditions else ""
 
 
-def get_data_with_opening_closing(filters, account_details, gl_entries):
-	data = []
-
-	gle_map = initialize_gle_map(gl_entries, filters)
-
-	totals, entries = get_accountwise_gle(filters, gl_entries, gle_map)
-
-	# Opening for filtered account
-	data.append(totals.opening)
-
-	if filters.get("group_by") != _('Group by Voucher (Consolidated)'):
-		for acc, acc_dict in iteritems(gle_map):
-			# acc
-			if acc_dict.entries:
-				# opening
-				data.append({})
-				if filters.get("group_by") != _("Group by Voucher"):
-					data.append(acc_dict.totals.opening)
-
-				data += acc_dict.entries
-
-				# totals
-				data.append(acc_dict.totals.total)
-
-				# closing
-				if filters.get("group_by") != _("Group by Voucher"):
-					data.append(acc_dict.totals.closing)
-		data.append({})
-	else:
-		data += entries
-
-	# totals
-	data.append(totals.total)
-
-	# closing
-	data.append(totals.closing)
-
-	return data
-
 def get_totals_dict():
 	def _get_debit_credit_dict(label):
 		return _dict(
@@ -264,72 +500,12 @@ def group_by_field(group_by):
 	else:
 		return 'voucher_no'
 
-def initialize_gle_map(gl_entries, filters):
-	gle_map = frappe._dict()
-	group_by = group_by_field(filters.get('group_by'))
-
-	for gle in gl_entries:
-		gle_map.setdefault(gle.get(group_by), _dict(totals=get_totals_dict(), entries=[]))
-	return gle_map
-
-
-def get_accountwise_gle(filters, gl_entries, gle_map):
-	totals = get_totals_dict()
-	entries = []
-	group_by = group_by_field(filters.get('group_by'))
-
-	def update_value_in_dict(data, key, gle):
-		data[key].debit += flt(gle.debit)
-		data[key].credit += flt(gle.credit)
-
-		data[key].debit_in_account_currency += flt(gle.debit_in_account_currency)
-		data[key].credit_in_account_currency += flt(gle.credit_in_account_currency)
-
-	from_date, to_date = getdate(filters.from_date), getdate(filters.to_date)
-	for gle in gl_entries:
-		if gle.posting_date < from_date or cstr(gle.is_opening) == "Yes":
-			update_value_in_dict(gle_map[gle.get(group_by)].totals, 'opening', gle)
-			update_value_in_dict(totals, 'opening', gle)
-
-			update_value_in_dict(gle_map[gle.get(group_by)].totals, 'closing', gle)
-			update_value_in_dict(totals, 'closing', gle)
-
-		elif gle.posting_date <= to_date:
-			update_value_in_dict(gle_map[gle.get(group_by)].totals, 'total', gle)
-			update_value_in_dict(totals, 'total', gle)
-			if filters.get("group_by") != _('Group by Voucher (Consolidated)'):
-				gle_map[gle.get(group_by)].entries.append(gle)
-			else:
-				entries.append(gle)
-
-			update_value_in_dict(gle_map[gle.get(group_by)].totals, 'closing', gle)
-			update_value_in_dict(totals, 'closing', gle)
-
-	return totals, entries
-
-def get_result_as_list(data, filters):
-	balance, balance_in_account_currency = 0, 0
-	inv_details = get_supplier_invoice_details()
-
-	for d in data:
-		if not d.get('posting_date'):
-			balance, balance_in_account_currency = 0, 0
-
-		balance = get_balance(d, balance, 'debit', 'credit')
-		d['balance'] = balance
-
-		d['account_currency'] = filters.account_currency
-		d['bill_no'] = inv_details.get(d.get('against_voucher'), '')
-
-	return data
-
-def get_supplier_invoice_details():
-	inv_details = {}
-	for d in frappe.db.sql(""" select name, bill_no from `tabPurchase Invoice`
-		where docstatus = 1 and bill_no is not null and bill_no != '' """, as_dict=1):
-		inv_details[d.name] = d.bill_no
+def update_value_in_dict(data, key, gle):
+	data[key].debit += flt(gle.get('debit'))
+	data[key].credit += flt(gle.get('credit'))
 
-	return inv_details
+	data[key].debit_in_account_currency += flt(gle.get('debit_in_account_currency'))
+	data[key].credit_in_account_currency += flt(gle.get('credit_in_account_currency'))
 
 def get_balance(row, balance, debit_field, credit_field):
 	balance += (row.get(debit_field, 0) -  row.get(credit_field, 0))
@@ -99,6 +99,7 @@ class GrossProfitGenerator(object):
 		self.load_stock_ledger_entries()
 		self.load_product_bundle()
 		self.load_non_stock_items()
+		self.load_purchase_rates()
 		self.get_returned_invoice_items()
 		self.process()
 
@@ -223,22 +224,18 @@ class GrossProfitGenerator(object):
 			return flt(row.qty) * item_rate
 
 		else:
-			my_sle = self.sle.get((item_code, row.warehouse))
-			if (row.update_stock or row.dn_detail) and my_sle:
+			if (row.update_stock or row.dn_detail) and (item_code, row.warehouse) in self.sle_warehouses:
 				parenttype, parent = row.parenttype, row.parent
 				if row.dn_detail:
 					parenttype, parent = "Delivery Note", row.delivery_note
 
-				for i, sle in enumerate(my_sle):
-					# find the stock valution rate from stock ledger entry
-					if sle.voucher_type == parenttype and parent == sle.voucher_no and \
-						sle.voucher_detail_no == row.item_row:
-							previous_stock_value = len(my_sle) > i+1 and \
-								flt(my_sle[i+1].stock_value) or 0.0
-							if previous_stock_value:
-								return (previous_stock_value - flt(sle.stock_value)) * flt(row.qty) / abs(flt(sle.qty))
-							else:
-								return flt(row.qty) * self.get_average_buying_rate(row, item_code)
+				# find the stock valution rate from stock ledger entry
+				sle = self.sle.get((parenttype, parent, row.item_row, item_code, row.warehouse))
+				if sle:
+					if sle.previous_stock_value:
+						return (sle.previous_stock_value - flt(sle.stock_value)) * flt(row.qty) / abs(flt(sle.qty))
+					else:
+						return flt(row.qty) * self.get_average_buying_rate(row, item_code)
 			else:
 				return flt(row.qty) * self.get_average_buying_rate(row, item_code)
 
@@ -248,10 +245,8 @@ class GrossProfitGenerator(object):
 		args = row
 		if not item_code in self.average_buying_rate:
 			if item_code in self.non_stock_items:
-				self.average_buying_rate[item_code] = flt(frappe.db.sql("""
-					select sum(base_net_amount) / sum(qty * conversion_factor)
-					from `tabPurchase Invoice Item`
-					where item_code = %s and docstatus=1""", item_code)[0][0])
+				# not purchased
+				self.average_buying_rate[item_code] = 0.0
 			else:
 				args.update({
 					'voucher_type': row.parenttype,
@@ -266,20 +261,46 @@ class GrossProfitGenerator(object):
 		return self.average_buying_rate[item_code]
 
 	def get_last_purchase_rate(self, item_code):
+		return flt(self.last_purchase_rate.get(item_code))
+
+	def load_purchase_rates(self):
+		"""Load the last and the average purchase rate of the non stock items of the invoices,
+		for all items at once"""
+		self.last_purchase_rate = {}
+
+		items = set([d.item_code for d in self.si_list])
+		for parents in self.product_bundles.values():
+			for product_bundle in parents.values():
+				for packed_items in product_bundle.values():
+					items.update([d.item_code for d in packed_items])
+
+		items = list(items.intersection(self.non_stock_items))
+		if not items:
+			return
+
+		conditions = ""
 		if self.filters.to_date:
-			last_purchase_rate = frappe.db.sql("""
-			select (a.base_rate / a.conversion_factor)
-			from `tabPurchase Invoice Item` a
-			where a.item_code = %s and a.docstatus=1
-			and modified <= %s
-			order by a.modified desc limit 1""", (item_code,self.filters.to_date))
-		else:
-			last_purchase_rate = frappe.db.sql("""
-			select (a.base_rate / a.conversion_factor)
-			from `tabPurchase Invoice Item` a
-			where a.item_code = %s and a.docstatus=1
-			order by a.modified desc limit 1""", item_code)
-		return flt(last_purchase_rate[0][0]) if last_purchase_rate else 0
+			conditions = " and modified <= %(to_date)s"
+
+		values = {"items": items, "to_date": self.filters.to_date}
+		for item_code, rate in frappe.db.sql("""
+			select a.item_code, (a.base_rate / a.conversion_factor)
+			from `tabPurchase Invoice Item` a, (
+				select item_code, max(modified) as modified
+				from `tabPurchase Invoice Item`
+				where item_code in %(items)s and docstatus=1 {conditions}
+				group by item_code
+			) last_purchase
+			where a.item_code = last_purchase.item_code and a.modified = last_purchase.modified
+				and a.docstatus=1""".format(conditions=conditions), values):
+			self.last_purchase_rate[item_code] = rate
+
+		for item_code, rate in frappe.db.sql("""
+			select item_code, sum(base_net_amount) / sum(qty * conversion_factor)
+			from `tabPurchase Invoice Item`
+			where item_code in %(items)s and docstatus=1
+			group by item_code""", values):
+			self.average_buying_rate[item_code] = flt(rate)
 
 	def load_invoice_items(self):
 		conditions = ""
@@ -323,6 +344,8 @@ class GrossProfitGenerator(object):
 				sales_team_table=sales_team_table, match_cond = get_match_cond('Sales Invoice')), self.filters, as_dict=1)
 
 	def load_stock_ledger_entries(self):
+		"""Index the stock ledger entries by voucher detail, item and warehouse, with the
+		stock value before the entry in the same item and warehouse"""
 		res = frappe.db.sql("""select item_code, voucher_type, voucher_no,
 				voucher_detail_no, stock_value, warehouse, actual_qty as qty
 			from `tabStock Ledger Entry`
@@ -331,11 +354,19 @@ class GrossProfitGenerator(object):
 				item_code desc, warehouse desc, posting_date desc,
 				posting_time desc, name desc""", self.filters, as_dict=True)
 		self.sle = {}
-		for r in res:
-			if (r.item_code, r.warehouse) not in self.sle:
-				self.sle[(r.item_code, r.warehouse)] = []
+		self.sle_warehouses = set()
+		for i, r in enumerate(res):
+			key = (r.item_code, r.warehouse)
+			self.sle_warehouses.add(key)
+
+			# entries are latest first, the next entry is the previous one
+			previous = res[i+1] if len(res) > i+1 else None
+			r.previous_stock_value = flt(previous.stock_value) \
+				if previous and (previous.item_code, previous.warehouse) == key else 0.0
 
-			self.sle[(r.item_code, r.warehouse)].append(r)
+			voucher_key = (r.voucher_type, r.voucher_no, r.voucher_detail_no) + key
+			if voucher_key not in self.sle:
+				self.sle[voucher_key] = r
 
 	def load_product_bundle(self):
 		self.product_bundles = {}
@@ -347,5 +378,5 @@ class GrossProfitGenerator(object):
 				frappe._dict()).setdefault(d.parent_item, []).append(d)
 
 	def load_non_stock_items(self):
-		self.non_stock_items = frappe.db.sql_list("""select name from tabItem
-			where is_stock_item=0""")
+		self.non_stock_items = set(frappe.db.sql_list("""select name from tabItem
+			where is_stock_item=0"""))
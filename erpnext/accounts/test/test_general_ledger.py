@@ -0,0 +1,59 @@
+# Copyright (c) 2018, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals, print_function
+import frappe, unittest, time
+from frappe.utils import cint
+from erpnext.accounts.general_ledger import merge_similar_entries
+
+class TestGeneralLedger(unittest.TestCase):
+	def test_merge_similar_entries(self):
+		gl_map = [
+			frappe._dict(account="Sales - _TC", cost_center="Main - _TC", debit=0, credit=100),
+			frappe._dict(account="Debtors - _TC", party_type="Customer", party="_Test Customer",
+				debit=300, credit=0),
+			frappe._dict(account="Sales - _TC", cost_center="Main - _TC", project="", debit=0, credit=200),
+			frappe._dict(account="Sales - _TC", cost_center="_Test Cost Center - _TC", debit=0, credit=50),
+			frappe._dict(account="Round Off - _TC", cost_center="Main - _TC", debit=0, credit=0)
+		]
+
+		merged = merge_similar_entries(gl_map)
+
+		self.assertEqual([(d.account, d.cost_center, d.debit, d.credit) for d in merged], [
+			("Sales - _TC", "Main - _TC", 0, 300),
+			("Debtors - _TC", None, 300, 0),
+			("Sales - _TC", "_Test Cost Center - _TC", 0, 50)
+		])
+
+	def test_merge_similar_entries_of_large_gl_map(self):
+		gl_map = make_gl_map(20000)
+		merged = merge_similar_entries(gl_map)
+
+		self.assertEqual(len(merged), 1000)
+		self.assertEqual(sum(d.credit for d in merged), 20000)
+		self.assertEqual(sum(d.credit_in_account_currency for d in merged), 20000)
+
+		# each account and cost center pair is merged into one row, in the order of first appearance
+		self.assertEqual([(d.account, d.cost_center) for d in merged],
+			[(d.account, d.cost_center) for d in gl_map[:1000]])
+		self.assertTrue(all(d.credit == 20 for d in merged))
+
+def benchmark(sizes=(5000, 10000, 20000)):
+	'''Print the time taken to merge GL maps of the given sizes.
+
+	bench execute erpnext.accounts.test.test_general_ledger.benchmark --args "[[100000]]"'''
+	for size in sizes:
+		gl_map = make_gl_map(cint(size))
+		start = time.time()
+		merge_similar_entries(gl_map)
+		print("merge_similar_entries: {0} rows in {1:.3f}s".format(size, time.time() - start))
+
+def make_gl_map(size, distinct_entries=1000):
+	return [frappe._dict({
+		"account": "_Test Account {0} - _TC".format(i % 100),
+		"cost_center": "_Test Cost Center {0} - _TC".format(i % distinct_entries // 100),
+		"debit": 0,
+		"credit": 1,
+		"debit_in_account_currency": 0,
+		"credit_in_account_currency": 1
+	}) for i in range(size)]
@@ -6,10 +6,11 @@ from __future__ import unicode_literals
 
 import frappe, erpnext
 import frappe.defaults
-from frappe.utils import nowdate, cstr, flt, cint, now, getdate
+from frappe.utils import nowdate, cstr, flt, cint, now, getdate, get_first_day
 from frappe import throw, _
 from frappe.utils import formatdate, get_number_format_info
 from six import iteritems
+from bisect import bisect_right
 # imported to enable erpnext.accounts.utils.get_account_currency
 from erpnext.accounts.doctype.account.account import get_account_currency
 
@@ -20,61 +21,90 @@ def get_fiscal_year(date=None, fiscal_year=None, label="Date", verbose=1, compan
 	return get_fiscal_years(date, fiscal_year, label, verbose, company, as_dict=as_dict)[0]
 
 def get_fiscal_years(transaction_date=None, fiscal_year=None, label="Date", verbose=1, company=None, as_dict=False):
-	fiscal_years = frappe.cache().hget("fiscal_years", company) or []
-
-	if not fiscal_years:
-		# if year start date is 2012-04-01, year end date should be 2013-03-31 (hence subdate)
-		cond = ""
-		if fiscal_year:
-			cond += " and fy.name = {0}".format(frappe.db.escape(fiscal_year))
-		if company:
-			cond += """
-				and (not exists (select name
-					from `tabFiscal Year Company` fyc
-					where fyc.parent = fy.name)
-				or exists(select company
-					from `tabFiscal Year Company` fyc
-					where fyc.parent = fy.name
-					and fyc.company=%(company)s)
-				)
-			"""
-
-		fiscal_years = frappe.db.sql("""
-			select
-				fy.name, fy.year_start_date, fy.year_end_date
-			from
-				`tabFiscal Year` fy
-			where
-				disabled = 0 {0}
-			order by
-				fy.year_start_date desc""".format(cond), {
-				"company": company
-			}, as_dict=True)
-
-		frappe.cache().hset("fiscal_years", company, fiscal_years)
+	index = get_fiscal_year_index(company)
 
 	if transaction_date:
 		transaction_date = getdate(transaction_date)
 
-	for fy in fiscal_years:
-		matched = False
-		if fiscal_year and fy.name == fiscal_year:
-			matched = True
-
-		if (transaction_date and getdate(fy.year_start_date) <= transaction_date
-			and getdate(fy.year_end_date) >= transaction_date):
-			matched = True
+	matched = []
+	if fiscal_year and fiscal_year in index.names:
+		matched.append(index.names[fiscal_year])
 
-		if matched:
-			if as_dict:
-				return (fy,)
-			else:
-				return ((fy.name, fy.year_start_date, fy.year_end_date),)
+	if transaction_date:
+		# latest year starting on or before the date, skipping the ones that end before it
+		i = bisect_right(index.start_dates, transaction_date) - 1
+		while i >= 0 and index.max_end_dates[i] >= transaction_date:
+			if index.end_dates[i] >= transaction_date:
+				matched.append(index.fiscal_years[i])
+				break
+			i -= 1
+
+	if matched:
+		fy = max(matched, key=lambda d: getdate(d.year_start_date))
+		if as_dict:
+			return (fy,)
+		else:
+			return ((fy.name, fy.year_start_date, fy.year_end_date),)
 
 	error_msg = _("""{0} {1} not in any active Fiscal Year.""").format(label, formatdate(transaction_date))
 	if verbose==1: frappe.msgprint(error_msg)
 	raise FiscalYearError(error_msg)
 
+def get_fiscal_year_index(company=None):
+	"""Returns the active fiscal years of the company sorted by start date, with their
+	start and end dates for lookup by bisection. Built once per request from the cache"""
+	def generator():
+		fiscal_years = frappe.cache().hget("fiscal_years", company) or []
+
+		if not fiscal_years:
+			# if year start date is 2012-04-01, year end date should be 2013-03-31 (hence subdate)
+			cond = ""
+			if company:
+				cond += """
+					and (not exists (select name
+						from `tabFiscal Year Company` fyc
+						where fyc.parent = fy.name)
+					or exists(select company
+						from `tabFiscal Year Company` fyc
+						where fyc.parent = fy.name
+						and fyc.company=%(company)s)
+					)
+				"""
+
+			fiscal_years = frappe.db.sql("""
+				select
+					fy.name, fy.year_start_date, fy.year_end_date
+				from
+					`tabFiscal Year` fy
+				where
+					disabled = 0 {0}
+				order by
+					fy.year_start_date desc""".format(cond), {
+					"company": company
+				}, as_dict=True)
+
+			frappe.cache().hset("fiscal_years", company, fiscal_years)
+
+		fiscal_years = sorted(fiscal_years, key=lambda d: getdate(d.year_start_date))
+		index = frappe._dict(fiscal_years=fiscal_years, names={},
+			start_dates=[], end_dates=[], max_end_dates=[])
+
+		for fy in fiscal_years:
+			index.names.setdefault(fy.name, fy)
+			index.start_dates.append(getdate(fy.year_start_date))
+			index.end_dates.append(getdate(fy.year_end_date))
+			index.max_end_dates.append(max(index.end_dates[-1], index.max_end_dates[-1])
+				if index.max_end_dates else index.end_dates[-1])
+
+		return index
+
+	return frappe.local_cache("fiscal_year_index", company, generator)
+
+def clear_fiscal_year_cache():
+	frappe.cache().delete_value("fiscal_years")
+	if getattr(frappe.local, "cache", None) is not None:
+		frappe.local.cache.pop("fiscal_year_index", None)
+
 def validate_fiscal_year(date, fiscal_year, company, label="Date", doc=None):
 	years = [f[0] for f in get_fiscal_years(date, label=_(label), company=company)]
 	if fiscal_year not in years:
@@ -97,9 +127,10 @@ def get_balance_on(account=None, date=None, party_type=None, party=None, company
 		cost_center = frappe.form_dict.get("cost_center")
 
 
-	cond = []
+	cond, joins = [], []
+	from_date, to_date, exclude_period_closing = None, None, False
 	if date:
-		cond.append("posting_date <= %s" % frappe.db.escape(cstr(date)))
+		to_date = date
 	else:
 		# get balance of all entries that exist
 		date = nowdate()
@@ -121,10 +152,8 @@ def get_balance_on(account=None, date=None, party_type=None, party=None, company
 	if cost_center and allow_cost_center_in_entry_of_bs_account:
 		cc = frappe.get_doc("Cost Center", cost_center)
 		if cc.is_group:
-			cond.append(""" exists (
-				select 1 from `tabCost Center` cc where cc.name = gle.cost_center
-				and cc.lft >= %s and cc.rgt <= %s
-			)""" % (cc.lft, cc.rgt))
+			joins.append("""inner join `tabCost Center` cc on cc.name = gle.cost_center
+				and cc.lft >= %s and cc.rgt <= %s""" % (cc.lft, cc.rgt))
 
 		else:
 			cond.append("""gle.cost_center = %s """ % (frappe.db.escape(cost_center, percent=False), ))
@@ -140,18 +169,14 @@ def get_balance_on(account=None, date=None, party_type=None, party=None, company
 
 		if not allow_cost_center_in_entry_of_bs_account and acc.report_type == 'Profit and Loss':
 			# for pl accounts, get balance within a fiscal year
-			cond.append("posting_date >= '%s' and voucher_type != 'Period Closing Voucher'" \
-				% year_start_date)
+			from_date, exclude_period_closing = year_start_date, True
 		elif allow_cost_center_in_entry_of_bs_account:
 			# for all accounts, get balance within a fiscal year if maintain cost center in balance account is checked
-			cond.append("posting_date >= '%s' and voucher_type != 'Period Closing Voucher'" \
-				% year_start_date)
+			from_date, exclude_period_closing = year_start_date, True
 		# different filter for group and ledger - improved performance
 		if acc.is_group:
-			cond.append("""exists (
-				select name from `tabAccount` ac where ac.name = gle.account
-				and ac.lft >= %s and ac.rgt <= %s
-			)""" % (acc.lft, acc.rgt))
+			joins.append("""inner join `tabAccount` ac on ac.name = gle.account
+				and ac.lft >= %s and ac.rgt <= %s""" % (acc.lft, acc.rgt))
 
 			# If group and currency same as company,
 			# always return balance based on debit and credit in company currency
@@ -172,14 +197,64 @@ def get_balance_on(account=None, date=None, party_type=None, party=None, company
 			select_field = "sum(debit_in_account_currency) - sum(credit_in_account_currency)"
 		else:
 			select_field = "sum(debit) - sum(credit)"
-		bal = frappe.db.sql("""
-			SELECT {0}
-			FROM `tabGL Entry` gle
-			WHERE {1}""".format(select_field, " and ".join(cond)))[0][0]
+
+		bal = get_balance_from_period_balance(select_field, joins, cond, from_date, to_date,
+			exclude_period_closing)
 
 		# if bal is None, return 0
 		return flt(bal)
 
+def get_balance_from_period_balance(select_field, joins, conditions, from_date=None, to_date=None,
+	exclude_period_closing=False):
+	"""Returns the balance from the monthly totals of Account Period Balance for the
+	whole months between `from_date` and `to_date`, and from GL Entry for the days
+	before the first and after the last whole month"""
+	period_conditions, gl_conditions = list(conditions), list(conditions)
+	if exclude_period_closing:
+		period_conditions.append("gle.is_period_closing_voucher = 0")
+		gl_conditions.append("gle.voucher_type != 'Period Closing Voucher'")
+
+	first_period = from_date and get_first_day(from_date)
+	if first_period and first_period != getdate(from_date):
+		first_period = get_first_day(from_date, d_months=1)
+
+	# entries of the month of to_date are always read from GL Entry
+	last_period = to_date and get_first_day(to_date)
+
+	if first_period and last_period and first_period >= last_period:
+		gl_ranges = ["gle.posting_date between %s and %s" % (frappe.db.escape(cstr(from_date)),
+			frappe.db.escape(cstr(to_date)))]
+		period_conditions = None
+	else:
+		gl_ranges = []
+		if first_period:
+			period_conditions.append("gle.period_start_date >= '%s'" % first_period)
+			if first_period != getdate(from_date):
+				gl_ranges.append("gle.posting_date >= %s and gle.posting_date < '%s'"
+					% (frappe.db.escape(cstr(from_date)), first_period))
+
+		if last_period:
+			period_conditions.append("gle.period_start_date < '%s'" % last_period)
+			gl_ranges.append("gle.posting_date >= '%s' and gle.posting_date <= %s"
+				% (last_period, frappe.db.escape(cstr(to_date))))
+
+	balance = 0.0
+	if period_conditions is not None:
+		balance += flt(frappe.db.sql("""
+			SELECT {0}
+			FROM `tabAccount Period Balance` gle {1}
+			WHERE {2}""".format(select_field, " ".join(joins),
+				" and ".join(period_conditions) or "1=1"))[0][0])
+
+	if gl_ranges:
+		gl_conditions.append("({0})".format(" or ".join("({0})".format(d) for d in gl_ranges)))
+		balance += flt(frappe.db.sql("""
+			SELECT {0}
+			FROM `tabGL Entry` gle {1}
+			WHERE {2}""".format(select_field, " ".join(joins), " and ".join(gl_conditions)))[0][0])
+
+	return balance
+
 def get_count_on(account, fieldname, date):
 	cond = []
 	if date:
@@ -544,6 +619,11 @@ def fix_total_debit_credit():
 				(dr_or_cr, dr_or_cr, '%s', '%s', '%s', dr_or_cr),
 				(d.diff, d.voucher_type, d.voucher_no))
 
+	if vouchers:
+		from erpnext.accounts.doctype.account_period_balance.account_period_balance \
+			import rebuild_account_period_balance
+		rebuild_account_period_balance()
+
 def get_stock_and_account_difference(account_list=None, posting_date=None):
 	from erpnext.stock.utils import get_stock_value_on
 	from erpnext.stock import get_warehouse_account_map
@@ -6,6 +6,7 @@ import frappe
 from frappe.desk.reportview import get_match_cond, get_filters_cond
 from frappe.utils import nowdate
 from collections import defaultdict
+from erpnext.stock.doctype.item_search_token.item_search_token import get_item_search_query, search_fields
 
 
  # searches for active employees
@@ -152,10 +153,20 @@ def tax_account_query(doctype, txt, searchfield, start, page_len, filters):
 def item_query(doctype, txt, searchfield, start, page_len, filters, as_dict=False):
 	conditions = []
 
-	description_cond = ''
-	if frappe.db.count('Item', cache=True) < 50000:
-		# scan description only if items are less than 50000
-		description_cond = 'or tabItem.description LIKE %(txt)s'
+	# items are searched by code, name, group, barcode and description in the item search index
+	search_query, search_values = get_item_search_query(txt)
+	search_join, search_cond, search_order = "", "", ""
+	if search_query:
+		if searchfield in ["name"] + [d[0] for d in search_fields]:
+			search_join = "inner join ({0}) search on search.item_code = tabItem.name".format(search_query)
+		else:
+			# the search field is not in the index, match it by prefix as well
+			search_join = "left join ({0}) search on search.item_code = tabItem.name".format(search_query)
+			search_cond = "and (search.item_code is not null or tabItem.`{0}` like %(searchfield_txt)s)".format(
+				searchfield)
+			search_values["searchfield_txt"] = txt + "%"
+
+		search_order = "search.score desc,"
 
 	return frappe.db.sql("""select tabItem.name,
 		if(length(tabItem.item_name) > 40,
@@ -163,35 +174,27 @@ def item_query(doctype, txt, searchfield, start, page_len, filters, as_dict=Fals
 		tabItem.item_group,
 		if(length(tabItem.description) > 40, \
 			concat(substr(tabItem.description, 1, 40), "..."), description) as decription
-		from tabItem
+		from tabItem {search_join}
 		where tabItem.docstatus < 2
 			and tabItem.has_variants=0
 			and tabItem.disabled=0
 			and (tabItem.end_of_life > %(today)s or ifnull(tabItem.end_of_life, '0000-00-00')='0000-00-00')
-			and (tabItem.`{key}` LIKE %(txt)s
-				or tabItem.item_code LIKE %(txt)s
-				or tabItem.item_group LIKE %(txt)s
-				or tabItem.item_name LIKE %(txt)s
-				or tabItem.item_code IN (select parent from `tabItem Barcode` where barcode LIKE %(txt)s
-				{description_cond}))
-			{fcond} {mcond}
+			{search_cond} {fcond} {mcond}
 		order by
-			if(locate(%(_txt)s, name), locate(%(_txt)s, name), 99999),
-			if(locate(%(_txt)s, item_name), locate(%(_txt)s, item_name), 99999),
+			{search_order}
 			idx desc,
 			name, item_name
 		limit %(start)s, %(page_len)s """.format(
-			key=searchfield,
+			search_join=search_join,
+			search_cond=search_cond,
+			search_order=search_order,
 			fcond=get_filters_cond(doctype, filters, conditions).replace('%', '%%'),
-			mcond=get_match_cond(doctype).replace('%', '%%'),
-			description_cond = description_cond),
-			{
+			mcond=get_match_cond(doctype).replace('%', '%%')),
+			dict(search_values, **{
 				"today": nowdate(),
-				"txt": "%%%s%%" % txt,
-				"_txt": txt.replace("%", ""),
 				"start": start,
 				"page_len": page_len
-			}, as_dict=as_dict)
+			}), as_dict=as_dict)
 
 def bom(doctype, txt, searchfield, start, page_len, filters):
 	conditions = []
@@ -11,6 +11,8 @@ from erpnext.accounts.general_ledger import make_gl_entries, delete_gl_entries,
 from erpnext.controllers.accounts_controller import AccountsController
 from erpnext.stock.stock_ledger import get_valuation_rate
 from erpnext.stock import get_warehouse_account_map
+from erpnext.stock.doctype.repost_item_valuation.repost_item_valuation import is_reposting_deferred
+from erpnext.accounts.doctype.account_period_balance.account_period_balance import remove_vouchers
 
 class StockController(AccountsController):
 	def validate(self):
@@ -29,7 +31,7 @@ class StockController(AccountsController):
 					gl_entries = self.get_gl_entries(warehouse_account)
 				make_gl_entries(gl_entries, from_repost=from_repost)
 
-			if repost_future_gle:
+			if repost_future_gle and not is_reposting_deferred():
 				items, warehouses = self.get_items_and_warehouses()
 				update_gl_entries_after(self.posting_date, self.posting_time, warehouses, items,
 					warehouse_account)
@@ -266,7 +268,8 @@ class StockController(AccountsController):
 	def make_sl_entries(self, sl_entries, is_amended=None, allow_negative_stock=False,
 			via_landed_cost_voucher=False):
 		from erpnext.stock.stock_ledger import make_sl_entries
-		make_sl_entries(sl_entries, is_amended, allow_negative_stock, via_landed_cost_voucher)
+		make_sl_entries(sl_entries, is_amended, allow_negative_stock, via_landed_cost_voucher,
+			bulk=cint(frappe.db.get_single_value("Stock Settings", "bulk_stock_ledger_posting")))
 
 	def make_gl_entries_on_cancel(self, repost_future_gle=True):
 		if frappe.db.sql("""select name from `tabGL Entry` where voucher_type=%s
@@ -348,44 +351,111 @@ class StockController(AccountsController):
 			frappe.get_doc("Blanket Order", blanket_order).update_ordered_qty()
 
 def update_gl_entries_after(posting_date, posting_time, for_warehouses=None, for_items=None,
-		warehouse_account=None):
-	def _delete_gl_entries(voucher_type, voucher_no):
-		frappe.db.sql("""delete from `tabGL Entry`
-			where voucher_type=%s and voucher_no=%s""", (voucher_type, voucher_no))
+		warehouse_account=None, chunk_size=None):
+	"""Repost GL Entries of future stock vouchers whose stock value has changed.
 
+	If `chunk_size` is set, the vouchers are reposted in background jobs of
+	`chunk_size` vouchers each, which can run in parallel as every voucher is in
+	one chunk only. The Stock Ledger must be committed before, as the jobs read it"""
 	if not warehouse_account:
 		warehouse_account = get_warehouse_account_map()
 
 	future_stock_vouchers = get_future_stock_vouchers(posting_date, posting_time, for_warehouses, for_items)
-	gle = get_voucherwise_gl_entries(future_stock_vouchers, posting_date)
+	vouchers = get_vouchers_with_changed_stock_value(future_stock_vouchers, warehouse_account)
 
-	for voucher_type, voucher_no in future_stock_vouchers:
+	if chunk_size and len(vouchers) > chunk_size:
+		for i in range(0, len(vouchers), chunk_size):
+			frappe.enqueue("erpnext.controllers.stock_controller.repost_gl_entries", queue="long",
+				vouchers=vouchers[i:i + chunk_size], posting_date=posting_date, now=frappe.flags.in_test)
+	else:
+		repost_gl_entries(vouchers, posting_date, warehouse_account)
+
+def repost_gl_entries(vouchers, posting_date, warehouse_account=None):
+	"""Rebuild the GL map of the given stock vouchers, and replace the GL Entries
+	of the ones where it differs from the existing entries"""
+	if not vouchers:
+		return
+
+	if not warehouse_account:
+		warehouse_account = get_warehouse_account_map()
+
+	gle = get_voucherwise_gl_entries(vouchers, posting_date)
+
+	vouchers_to_delete, gl_entries_to_make = [], []
+	for voucher_type, voucher_no in vouchers:
 		existing_gle = gle.get((voucher_type, voucher_no), [])
 		voucher_obj = frappe.get_doc(voucher_type, voucher_no)
 		expected_gle = voucher_obj.get_gl_entries(warehouse_account)
 		if expected_gle:
-			if not existing_gle or not compare_existing_and_expected_gle(existing_gle, expected_gle):
-				_delete_gl_entries(voucher_type, voucher_no)
-				voucher_obj.make_gl_entries(gl_entries=expected_gle, repost_future_gle=False, from_repost=True)
-		else:
-			_delete_gl_entries(voucher_type, voucher_no)
-
-def compare_existing_and_expected_gle(existing_gle, expected_gle):
-	matched = True
-	for entry in expected_gle:
-		account_existed = False
-		for e in existing_gle:
-			if entry.account == e.account:
-				account_existed = True
-			if entry.account == e.account and entry.against_account == e.against_account \
-					and (not entry.cost_center or not e.cost_center or entry.cost_center == e.cost_center) \
-					and (entry.debit != e.debit or entry.credit != e.credit):
-				matched = False
-				break
-		if not account_existed:
-			matched = False
-			break
-	return matched
+			round_off_account = frappe.get_cached_value('Company', voucher_obj.company, "round_off_account")
+			if not existing_gle or (get_gl_map_totals(existing_gle, ignore_account=round_off_account)
+				!= get_gl_map_totals(expected_gle)):
+				vouchers_to_delete.append((voucher_type, voucher_no))
+				gl_entries_to_make.append((voucher_obj, expected_gle))
+		elif existing_gle:
+			vouchers_to_delete.append((voucher_type, voucher_no))
+
+	if vouchers_to_delete:
+		remove_vouchers(vouchers_to_delete)
+		frappe.db.sql("""delete from `tabGL Entry` where (voucher_type, voucher_no) in ({0})""".format(
+			", ".join(["(%s, %s)"] * len(vouchers_to_delete))), [v for d in vouchers_to_delete for v in d])
+
+	for voucher_obj, expected_gle in gl_entries_to_make:
+		voucher_obj.make_gl_entries(gl_entries=expected_gle, repost_future_gle=False, from_repost=True)
+
+def get_gl_map_totals(gl_map, ignore_account=None):
+	"""Set of the net amounts of a GL map, aggregated by account and cost center"""
+	totals = {}
+	for d in gl_map:
+		if ignore_account and d.account == ignore_account:
+			continue
+
+		key = (d.account, d.cost_center or "")
+		totals[key] = flt(totals.get(key)) + flt(d.debit) - flt(d.credit)
+
+	return frozenset((key, flt(amount, 2)) for key, amount in totals.items() if flt(amount, 2))
+
+def get_vouchers_with_changed_stock_value(future_stock_vouchers, warehouse_account):
+	"""Filter vouchers whose GL Entries against warehouse accounts do not add up
+	to the stock value difference of their Stock Ledger Entries"""
+	if not future_stock_vouchers:
+		return []
+
+	voucher_nos = list(set([d[1] for d in future_stock_vouchers]))
+
+	stock_value = {}
+	for d in frappe.db.sql("""select voucher_type, voucher_no, warehouse,
+			sum(round(stock_value_difference, 2)) as stock_value_difference
+		from `tabStock Ledger Entry`
+		where voucher_no in ({0})
+		group by voucher_type, voucher_no, warehouse""".format(", ".join(["%s"] * len(voucher_nos))),
+		tuple(voucher_nos), as_dict=1):
+		if warehouse_account.get(d.warehouse):
+			account_balance = stock_value.setdefault((d.voucher_type, d.voucher_no), {})
+			account = warehouse_account[d.warehouse]["account"]
+			account_balance[account] = flt(account_balance.get(account)) + flt(d.stock_value_difference)
+
+	accounts = list(set([d["account"] for d in warehouse_account.values()]))
+	account_balance_in_gl = {}
+	if accounts:
+		for d in frappe.db.sql("""select voucher_type, voucher_no, account,
+				sum(debit) - sum(credit) as balance
+			from `tabGL Entry`
+			where voucher_no in ({0}) and account in ({1})
+			group by voucher_type, voucher_no, account""".format(", ".join(["%s"] * len(voucher_nos)),
+				", ".join(["%s"] * len(accounts))), tuple(voucher_nos + accounts), as_dict=1):
+			account_balance_in_gl.setdefault((d.voucher_type, d.voucher_no), {})[d.account] = flt(d.balance)
+
+	def _get_balances(balances):
+		return dict((account, flt(amount, 2)) for account, amount in balances.items() if flt(amount, 2))
+
+	vouchers = []
+	for voucher_type, voucher_no in future_stock_vouchers:
+		if (_get_balances(stock_value.get((voucher_type, voucher_no), {}))
+			!= _get_balances(account_balance_in_gl.get((voucher_type, voucher_no), {}))):
+			vouchers.append([voucher_type, voucher_no])
+
+	return vouchers
 
 def get_future_stock_vouchers(posting_date, posting_time, for_warehouses=None, for_items=None):
 	future_stock_vouchers = []
@@ -12,6 +12,7 @@ from erpnext.controllers.accounts_controller import validate_conversion_rate, \
 class calculate_taxes_and_totals(object):
 	def __init__(self, doc):
 		self.doc = doc
+		self.precisions = {}
 		self.calculate()
 
 	def calculate(self):
@@ -31,6 +32,7 @@ class calculate_taxes_and_totals(object):
 	def _calculate(self):
 		self.validate_conversion_rate()
 		self.calculate_item_values()
+		self.item_tax_maps = self.get_item_tax_maps()
 		self.initialize_taxes()
 		self.determine_exclusive_rate()
 		self.calculate_net_total()
@@ -54,26 +56,32 @@ class calculate_taxes_and_totals(object):
 
 	def calculate_item_values(self):
 		if not self.discount_amount_applied:
+			float_fields = None
 			for item in self.doc.get("items"):
-				self.doc.round_floats_in(item)
+				if float_fields is None:
+					float_fields = [df.fieldname for df in item.meta.get("fields",
+						{"fieldtype": ["in", ["Currency", "Float", "Percent"]]})]
+
+				self.doc.round_floats_in(item, float_fields)
 
 				if item.discount_percentage == 100:
 					item.rate = 0.0
 				elif not item.rate:
 					item.rate = flt(item.price_list_rate *
-						(1.0 - (item.discount_percentage / 100.0)), item.precision("rate"))
+						(1.0 - (item.discount_percentage / 100.0)), self.get_precision(item, "rate"))
 
 				if item.doctype in ['Quotation Item', 'Sales Order Item', 'Delivery Note Item', 'Sales Invoice Item']:
 					item.rate_with_margin, item.base_rate_with_margin = self.calculate_margin(item)
 
 					if flt(item.rate_with_margin) > 0:
-						item.rate = flt(item.rate_with_margin * (1.0 - (item.discount_percentage / 100.0)), item.precision("rate"))
+						item.rate = flt(item.rate_with_margin * (1.0 - (item.discount_percentage / 100.0)),
+							self.get_precision(item, "rate"))
 						item.discount_amount = item.rate_with_margin - item.rate
 				elif flt(item.price_list_rate) > 0:
 						item.discount_amount = item.price_list_rate - item.rate
 
 				item.net_rate = item.rate
-				item.amount = flt(item.rate * item.qty,	item.precision("amount"))
+				item.amount = flt(item.rate * item.qty,	self.get_precision(item, "amount"))
 				item.net_amount = item.amount
 
 				self._set_in_company_currency(item, ["price_list_rate", "rate", "net_rate", "amount", "net_amount"])
@@ -83,9 +91,18 @@ class calculate_taxes_and_totals(object):
 	def _set_in_company_currency(self, doc, fields):
 		"""set values in base currency"""
 		for f in fields:
-			val = flt(flt(doc.get(f), doc.precision(f)) * self.doc.conversion_rate, doc.precision("base_" + f))
+			val = flt(flt(doc.get(f), self.get_precision(doc, f)) * self.doc.conversion_rate,
+				self.get_precision(doc, "base_" + f))
 			doc.set("base_" + f, val)
 
+	def get_precision(self, doc, fieldname):
+		"""precision of the field, looked up once per doctype as it is the same for all rows"""
+		key = (doc.doctype, fieldname)
+		if key not in self.precisions:
+			self.precisions[key] = doc.precision(fieldname)
+
+		return self.precisions[key]
+
 	def initialize_taxes(self):
 		for tax in self.doc.get("taxes"):
 			if not self.discount_amount_applied:
@@ -107,65 +124,84 @@ class calculate_taxes_and_totals(object):
 			self.doc.round_floats_in(tax)
 
 	def determine_exclusive_rate(self):
-		if not any((cint(tax.included_in_print_rate) for tax in self.doc.get("taxes"))):
+		taxes = self.doc.get("taxes")
+		if not any((cint(tax.included_in_print_rate) for tax in taxes)):
 			return
 
-		for item in self.doc.get("items"):
-			item_tax_map = self._load_item_tax_rate(item.item_tax_rate)
-			cumulated_tax_fraction = 0
-			for i, tax in enumerate(self.doc.get("taxes")):
-				tax.tax_fraction_for_current_item = self.get_current_tax_fraction(tax, item_tax_map)
+		# fractions of each tax for all the items, one column per tax
+		items = self.doc.get("items")
+		tax_fractions, grand_total_fractions = [], []
+		cumulated_tax_fractions = [0] * len(items)
+		for i, tax in enumerate(taxes):
+			current_tax_fractions = self.get_current_tax_fractions(tax, self.get_tax_rates(tax),
+				tax_fractions, grand_total_fractions)
 
-				if i==0:
-					tax.grand_total_fraction_for_current_item = 1 + tax.tax_fraction_for_current_item
-				else:
-					tax.grand_total_fraction_for_current_item = \
-						self.doc.get("taxes")[i-1].grand_total_fraction_for_current_item \
-						+ tax.tax_fraction_for_current_item
+			if i==0:
+				grand_total_fractions.append([1 + d for d in current_tax_fractions])
+			else:
+				grand_total_fractions.append([prev + d
+					for prev, d in zip(grand_total_fractions[i-1], current_tax_fractions)])
+
+			tax_fractions.append(current_tax_fractions)
+			cumulated_tax_fractions = [cumulated + d
+				for cumulated, d in zip(cumulated_tax_fractions, current_tax_fractions)]
 
-				cumulated_tax_fraction += tax.tax_fraction_for_current_item
+			if items:
+				tax.tax_fraction_for_current_item = current_tax_fractions[-1]
+				tax.grand_total_fraction_for_current_item = grand_total_fractions[i][-1]
 
+		for item, cumulated_tax_fraction in zip(items, cumulated_tax_fractions):
 			if cumulated_tax_fraction and not self.discount_amount_applied and item.qty:
 				item.net_amount = flt(item.amount / (1 + cumulated_tax_fraction))
-				item.net_rate = flt(item.net_amount / item.qty, item.precision("net_rate"))
+				item.net_rate = flt(item.net_amount / item.qty, self.get_precision(item, "net_rate"))
 				item.discount_percentage = flt(item.discount_percentage,
-					item.precision("discount_percentage"))
+					self.get_precision(item, "discount_percentage"))
 
 				self._set_in_company_currency(item, ["net_rate", "net_amount"])
 
+	def get_item_tax_maps(self):
+		"""item tax rates of each item, each distinct `item_tax_rate` is parsed once"""
+		parsed, item_tax_maps = {}, []
+		for item in self.doc.get("items"):
+			if item.item_tax_rate not in parsed:
+				parsed[item.item_tax_rate] = self._load_item_tax_rate(item.item_tax_rate)
+			item_tax_maps.append(parsed[item.item_tax_rate])
+
+		return item_tax_maps
+
 	def _load_item_tax_rate(self, item_tax_rate):
 		return json.loads(item_tax_rate) if item_tax_rate else {}
 
-	def get_current_tax_fraction(self, tax, item_tax_map):
+	def get_current_tax_fractions(self, tax, tax_rates, tax_fractions, grand_total_fractions):
 		"""
-			Get tax fraction for calculating tax exclusive amount
+			Get tax fraction of each item for calculating tax exclusive amount
 			from tax inclusive amount
 		"""
-		current_tax_fraction = 0
+		current_tax_fractions = [0] * len(tax_rates)
 
 		if cint(tax.included_in_print_rate):
-			tax_rate = self._get_tax_rate(tax, item_tax_map)
-
 			if tax.charge_type == "On Net Total":
-				current_tax_fraction = tax_rate / 100.0
+				current_tax_fractions = [tax_rate / 100.0 for tax_rate in tax_rates]
 
 			elif tax.charge_type == "On Previous Row Amount":
-				current_tax_fraction = (tax_rate / 100.0) * \
-					self.doc.get("taxes")[cint(tax.row_id) - 1].tax_fraction_for_current_item
+				current_tax_fractions = [(tax_rate / 100.0) * d
+					for tax_rate, d in zip(tax_rates, tax_fractions[cint(tax.row_id) - 1])]
 
 			elif tax.charge_type == "On Previous Row Total":
-				current_tax_fraction = (tax_rate / 100.0) * \
-					self.doc.get("taxes")[cint(tax.row_id) - 1].grand_total_fraction_for_current_item
+				current_tax_fractions = [(tax_rate / 100.0) * d
+					for tax_rate, d in zip(tax_rates, grand_total_fractions[cint(tax.row_id) - 1])]
 
 		if getattr(tax, "add_deduct_tax", None):
-			current_tax_fraction *= -1.0 if (tax.add_deduct_tax == "Deduct") else 1.0
-		return current_tax_fraction
+			factor = -1.0 if (tax.add_deduct_tax == "Deduct") else 1.0
+			current_tax_fractions = [d * factor for d in current_tax_fractions]
+		return current_tax_fractions
 
-	def _get_tax_rate(self, tax, item_tax_map):
-		if tax.account_head in item_tax_map:
-			return flt(item_tax_map.get(tax.account_head), self.doc.precision("rate", tax))
-		else:
-			return tax.rate
+	def get_tax_rates(self, tax):
+		"""rate of the tax for each item, from the item tax rates if set for the tax account"""
+		rate_precision = self.get_precision(tax, "rate")
+		return [flt(item_tax_map.get(tax.account_head), rate_precision)
+			if tax.account_head in item_tax_map else tax.rate
+			for item_tax_map in self.item_tax_maps]
 
 	def calculate_net_total(self):
 		self.doc.total_qty = self.doc.total = self.doc.base_total = self.doc.net_total = self.doc.base_net_total = 0.0
@@ -184,58 +220,72 @@ class calculate_taxes_and_totals(object):
 
 	def calculate_taxes(self):
 		self.doc.rounding_adjustment = 0
-		# maintain actual tax rate based on idx
-		actual_tax_dict = dict([[tax.idx, flt(tax.tax_amount, tax.precision("tax_amount"))]
-			for tax in self.doc.get("taxes") if tax.charge_type == "Actual"])
-
-		for n, item in enumerate(self.doc.get("items")):
-			item_tax_map = self._load_item_tax_rate(item.item_tax_rate)
-			for i, tax in enumerate(self.doc.get("taxes")):
-				# tax_amount represents the amount of tax for the current step
-				current_tax_amount = self.get_current_tax_amount(item, tax, item_tax_map)
 
-				# Adjust divisional loss to the last item
-				if tax.charge_type == "Actual":
-					actual_tax_dict[tax.idx] -= current_tax_amount
-					if n == len(self.doc.get("items")) - 1:
-						current_tax_amount += actual_tax_dict[tax.idx]
-
-				# accumulate tax amount into tax.tax_amount
-				if tax.charge_type != "Actual" and \
-					not (self.discount_amount_applied and self.doc.apply_discount_on=="Grand Total"):
-						tax.tax_amount += current_tax_amount
-
-				# store tax_amount for current item as it will be used for
-				# charge type = 'On Previous Row Amount'
-				tax.tax_amount_for_current_item = current_tax_amount
-
-				# set tax after discount
-				tax.tax_amount_after_discount_amount += current_tax_amount
-
-				current_tax_amount = self.get_tax_amount_if_for_valuation_or_deduction(current_tax_amount, tax)
-
-				# note: grand_total_for_current_item contains the contribution of
-				# item's amount, previously applied tax and the current tax on that item
-				if i==0:
-					tax.grand_total_for_current_item = flt(item.net_amount + current_tax_amount)
-				else:
-					tax.grand_total_for_current_item = \
-						flt(self.doc.get("taxes")[i-1].grand_total_for_current_item + current_tax_amount)
-
-				# set precision in the last item iteration
-				if n == len(self.doc.get("items")) - 1:
-					self.round_off_totals(tax)
-					self.set_cumulative_total(i, tax)
-
-					self._set_in_company_currency(tax,
-						["total", "tax_amount", "tax_amount_after_discount_amount"])
-
-					# adjust Discount Amount loss in last tax iteration
-					if i == (len(self.doc.get("taxes")) - 1) and self.discount_amount_applied \
-						and self.doc.discount_amount and self.doc.apply_discount_on == "Grand Total":
-							self.doc.rounding_adjustment = flt(self.doc.grand_total
-								- flt(self.doc.discount_amount) - tax.total,
-								self.doc.precision("rounding_adjustment"))
+		# amounts of each tax for all the items, one column per tax
+		items = self.doc.get("items")
+		taxes = self.doc.get("taxes")
+		net_amounts = [item.net_amount for item in items]
+		item_keys = [item.item_code or item.item_name for item in items]
+		tax_amounts, grand_totals = [], []
+
+		for i, tax in enumerate(taxes):
+			tax_rates = self.get_tax_rates(tax)
+
+			# tax_amount represents the amount of tax for the current step
+			current_tax_amounts = self.get_current_tax_amounts(tax, tax_rates, net_amounts,
+				tax_amounts, grand_totals)
+			self.set_item_wise_tax(tax, item_keys, tax_rates, current_tax_amounts)
+
+			# Adjust divisional loss to the last item
+			if tax.charge_type == "Actual" and items:
+				actual_tax_amount = flt(tax.tax_amount, self.get_precision(tax, "tax_amount"))
+				for current_tax_amount in current_tax_amounts:
+					actual_tax_amount -= current_tax_amount
+				current_tax_amounts[-1] += actual_tax_amount
+
+			# accumulate tax amount into tax.tax_amount, item by item
+			if tax.charge_type != "Actual" and \
+				not (self.discount_amount_applied and self.doc.apply_discount_on=="Grand Total"):
+					tax_amount = tax.tax_amount
+					for current_tax_amount in current_tax_amounts:
+						tax_amount += current_tax_amount
+					tax.tax_amount = tax_amount
+
+			# set tax after discount
+			tax_amount_after_discount_amount = tax.tax_amount_after_discount_amount
+			for current_tax_amount in current_tax_amounts:
+				tax_amount_after_discount_amount += current_tax_amount
+			tax.tax_amount_after_discount_amount = tax_amount_after_discount_amount
+
+			# store tax_amount of the items as it will be used for
+			# charge type = 'On Previous Row Amount'
+			tax_amounts.append(current_tax_amounts)
+
+			# note: grand_total_for_current_item contains the contribution of
+			# item's amount, previously applied tax and the current tax on that item
+			previous_totals = grand_totals[i-1] if i else net_amounts
+			grand_totals.append([flt(total + self.get_tax_amount_if_for_valuation_or_deduction(current_tax_amount, tax))
+				for total, current_tax_amount in zip(previous_totals, current_tax_amounts)])
+
+			if not items:
+				continue
+
+			tax.tax_amount_for_current_item = current_tax_amounts[-1]
+			tax.grand_total_for_current_item = grand_totals[i][-1]
+
+			# set precision after the last item
+			self.round_off_totals(tax)
+			self.set_cumulative_total(i, tax)
+
+			self._set_in_company_currency(tax,
+				["total", "tax_amount", "tax_amount_after_discount_amount"])
+
+			# adjust Discount Amount loss in last tax iteration
+			if i == (len(taxes) - 1) and self.discount_amount_applied \
+				and self.doc.discount_amount and self.doc.apply_discount_on == "Grand Total":
+					self.doc.rounding_adjustment = flt(self.doc.grand_total
+						- flt(self.doc.discount_amount) - tax.total,
+						self.doc.precision("rounding_adjustment"))
 
 	def get_tax_amount_if_for_valuation_or_deduction(self, tax_amount, tax):
 		# if just for valuation, do not add the tax amount in total
@@ -255,38 +305,37 @@ class calculate_taxes_and_totals(object):
 		else:
 			tax.total = flt(self.doc.get("taxes")[row_idx-1].total + tax_amount, tax.precision("total"))
 
-	def get_current_tax_amount(self, item, tax, item_tax_map):
-		tax_rate = self._get_tax_rate(tax, item_tax_map)
-		current_tax_amount = 0.0
-
+	def get_current_tax_amounts(self, tax, tax_rates, net_amounts, tax_amounts, grand_totals):
+		"""amount of the tax for each item"""
 		if tax.charge_type == "Actual":
 			# distribute the tax amount proportionally to each item row
-			actual = flt(tax.tax_amount, tax.precision("tax_amount"))
-			current_tax_amount = item.net_amount*actual / self.doc.net_total if self.doc.net_total else 0.0
+			actual = flt(tax.tax_amount, self.get_precision(tax, "tax_amount"))
+			net_total = self.doc.net_total
+			return [net_amount*actual / net_total if net_total else 0.0 for net_amount in net_amounts]
 
 		elif tax.charge_type == "On Net Total":
-			current_tax_amount = (tax_rate / 100.0) * item.net_amount
+			return [(tax_rate / 100.0) * net_amount for tax_rate, net_amount in zip(tax_rates, net_amounts)]
 		elif tax.charge_type == "On Previous Row Amount":
-			current_tax_amount = (tax_rate / 100.0) * \
-				self.doc.get("taxes")[cint(tax.row_id) - 1].tax_amount_for_current_item
+			return [(tax_rate / 100.0) * d
+				for tax_rate, d in zip(tax_rates, tax_amounts[cint(tax.row_id) - 1])]
 		elif tax.charge_type == "On Previous Row Total":
-			current_tax_amount = (tax_rate / 100.0) * \
-				self.doc.get("taxes")[cint(tax.row_id) - 1].grand_total_for_current_item
+			return [(tax_rate / 100.0) * d
+				for tax_rate, d in zip(tax_rates, grand_totals[cint(tax.row_id) - 1])]
 		elif tax.charge_type == "On Item Quantity":
-			current_tax_amount = tax_rate * item.stock_qty
-
-		self.set_item_wise_tax(item, tax, tax_rate, current_tax_amount)
+			return [tax_rate * item.stock_qty for tax_rate, item in zip(tax_rates, self.doc.get("items"))]
 
-		return current_tax_amount
+		return [0.0] * len(tax_rates)
 
-	def set_item_wise_tax(self, item, tax, tax_rate, current_tax_amount):
+	def set_item_wise_tax(self, tax, item_keys, tax_rates, current_tax_amounts):
 		# store tax breakup for each item
-		key = item.item_code or item.item_name
-		item_wise_tax_amount = current_tax_amount*self.doc.conversion_rate
-		if tax.item_wise_tax_detail.get(key):
-			item_wise_tax_amount += tax.item_wise_tax_detail[key][1]
+		item_wise_tax_detail = tax.item_wise_tax_detail
+		conversion_rate = self.doc.conversion_rate
+		for key, tax_rate, current_tax_amount in zip(item_keys, tax_rates, current_tax_amounts):
+			item_wise_tax_amount = current_tax_amount*conversion_rate
+			if item_wise_tax_detail.get(key):
+				item_wise_tax_amount += item_wise_tax_detail[key][1]
 
-		tax.item_wise_tax_detail[key] = [tax_rate,flt(item_wise_tax_amount)]
+			item_wise_tax_detail[key] = [tax_rate,flt(item_wise_tax_amount)]
 
 	def round_off_totals(self, tax):
 		tax.tax_amount = flt(tax.tax_amount, tax.precision("tax_amount"))
@@ -388,7 +437,8 @@ class calculate_taxes_and_totals(object):
 					distributed_amount = flt(self.doc.discount_amount) * \
 						item.net_amount / total_for_discount_amount
 
-					item.net_amount = flt(item.net_amount - distributed_amount, item.precision("net_amount"))
+					item.net_amount = flt(item.net_amount - distributed_amount,
+						self.get_precision(item, "net_amount"))
 					net_total += item.net_amount
 
 					# discount amount rounding loss adjustment if no taxes
@@ -398,9 +448,10 @@ class calculate_taxes_and_totals(object):
 								self.doc.precision("net_total"))
 
 							item.net_amount = flt(item.net_amount + discount_amount_loss,
-								item.precision("net_amount"))
+								self.get_precision(item, "net_amount"))
 
-					item.net_rate = flt(item.net_amount / item.qty, item.precision("net_rate")) if item.qty else 0
+					item.net_rate = flt(item.net_amount / item.qty,
+						self.get_precision(item, "net_rate")) if item.qty else 0
 
 					self._set_in_company_currency(item, ["net_rate", "net_amount"])
 
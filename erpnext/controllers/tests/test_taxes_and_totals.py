@@ -0,0 +1,226 @@
+# Copyright (c) 2018, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals, print_function
+import time
+import unittest
+import frappe
+from frappe.utils import cint, flt
+from erpnext.controllers.taxes_and_totals import calculate_taxes_and_totals
+
+item_fields = ("rate", "amount", "net_rate", "net_amount", "base_net_rate", "base_net_amount",
+	"discount_percentage", "item_tax_amount")
+
+tax_fields = ("tax_amount", "tax_amount_after_discount_amount", "total", "base_tax_amount",
+	"base_tax_amount_after_discount_amount", "base_total", "item_wise_tax_detail",
+	"tax_amount_for_current_item", "grand_total_for_current_item",
+	"tax_fraction_for_current_item", "grand_total_fraction_for_current_item")
+
+doc_fields = ("total", "net_total", "base_net_total", "total_taxes_and_charges", "grand_total",
+	"base_grand_total", "rounding_adjustment", "rounded_total", "discount_amount",
+	"base_discount_amount", "taxes_and_charges_added", "taxes_and_charges_deducted",
+	"outstanding_amount", "other_charges_calculation")
+
+class TestTaxesAndTotals(unittest.TestCase):
+	def test_parity_with_exclusive_taxes(self):
+		doc = make_document("Sales Invoice", 2, 1000)
+		doc.discount_amount = 1000
+		doc.apply_discount_on = "Grand Total"
+		self.check_parity(doc)
+
+	def test_parity_with_inclusive_taxes(self):
+		doc = make_document("Sales Invoice", 3, 1000)
+		doc.discount_amount = 500
+		doc.apply_discount_on = "Net Total"
+		self.check_parity(doc)
+
+	def test_parity_in_foreign_currency(self):
+		doc = make_document("Sales Invoice", 3, 250)
+		doc.currency = "USD"
+		doc.conversion_rate = 50
+		doc.additional_discount_percentage = 7.5
+		doc.apply_discount_on = "Grand Total"
+		self.check_parity(doc)
+
+	def test_parity_with_deducted_and_valuation_taxes(self):
+		doc = make_document("Purchase Invoice", 0, 1000)
+		doc.discount_amount = 250
+		doc.apply_discount_on = "Grand Total"
+		self.check_parity(doc)
+
+	def check_parity(self, doc):
+		expected = frappe.copy_doc(doc)
+		ReferenceCalculation(expected)
+
+		calculate_taxes_and_totals(doc)
+
+		for fieldname in doc_fields:
+			self.assertEqual(doc.get(fieldname), expected.get(fieldname), fieldname)
+
+		for item, expected_item in zip(doc.get("items"), expected.get("items")):
+			for fieldname in item_fields:
+				self.assertEqual(item.get(fieldname), expected_item.get(fieldname), fieldname)
+
+		for tax, expected_tax in zip(doc.get("taxes"), expected.get("taxes")):
+			for fieldname in tax_fields:
+				self.assertEqual(tax.get(fieldname), expected_tax.get(fieldname), fieldname)
+
+def make_document(doctype, record_idx, item_count):
+	'''Returns an unsaved copy of a test record of `doctype` with `item_count` items,
+	repeating its items with different quantities and rates'''
+	test_records = frappe.get_test_records(doctype)
+	doc = frappe.copy_doc(test_records[record_idx])
+	items = doc.get("items")
+
+	doc.set("items", [])
+	for i in range(item_count):
+		item = items[i % len(items)].as_dict()
+		item.update({
+			"name": None,
+			"idx": None,
+			"qty": i % 7 + 1,
+			"price_list_rate": flt(item.price_list_rate) + (i % 13) * 1.37,
+			"rate": flt(item.rate) + (i % 13) * 1.37,
+			"stock_qty": i % 7 + 1
+		})
+		doc.append("items", item)
+
+	return doc
+
+def benchmark(item_count=1000, doctype="Sales Invoice", record_idx=2):
+	'''Print the time taken to calculate taxes and totals of a document with `item_count`
+	items, compared to the calculation item by item.
+
+	bench execute erpnext.controllers.tests.test_taxes_and_totals.benchmark --args "[10000]"'''
+	doc = make_document(doctype, record_idx, cint(item_count))
+	for calculation in (ReferenceCalculation, calculate_taxes_and_totals):
+		start = time.time()
+		calculation(frappe.copy_doc(doc))
+		print("{0}: {1:.3f}s".format(calculation.__name__, time.time() - start))
+
+class ReferenceCalculation(calculate_taxes_and_totals):
+	'''Taxes calculated item by item and tax by tax, as before the calculation by columns'''
+	def determine_exclusive_rate(self):
+		if not any((cint(tax.included_in_print_rate) for tax in self.doc.get("taxes"))):
+			return
+
+		for item in self.doc.get("items"):
+			item_tax_map = self._load_item_tax_rate(item.item_tax_rate)
+			cumulated_tax_fraction = 0
+			for i, tax in enumerate(self.doc.get("taxes")):
+				tax.tax_fraction_for_current_item = self.get_current_tax_fraction(tax, item_tax_map)
+
+				if i==0:
+					tax.grand_total_fraction_for_current_item = 1 + tax.tax_fraction_for_current_item
+				else:
+					tax.grand_total_fraction_for_current_item = \
+						self.doc.get("taxes")[i-1].grand_total_fraction_for_current_item \
+						+ tax.tax_fraction_for_current_item
+
+				cumulated_tax_fraction += tax.tax_fraction_for_current_item
+
+			if cumulated_tax_fraction and not self.discount_amount_applied and item.qty:
+				item.net_amount = flt(item.amount / (1 + cumulated_tax_fraction))
+				item.net_rate = flt(item.net_amount / item.qty, item.precision("net_rate"))
+				item.discount_percentage = flt(item.discount_percentage,
+					item.precision("discount_percentage"))
+
+				self._set_in_company_currency(item, ["net_rate", "net_amount"])
+
+	def get_current_tax_fraction(self, tax, item_tax_map):
+		current_tax_fraction = 0
+
+		if cint(tax.included_in_print_rate):
+			tax_rate = self._get_tax_rate(tax, item_tax_map)
+
+			if tax.charge_type == "On Net Total":
+				current_tax_fraction = tax_rate / 100.0
+
+			elif tax.charge_type == "On Previous Row Amount":
+				current_tax_fraction = (tax_rate / 100.0) * \
+					self.doc.get("taxes")[cint(tax.row_id) - 1].tax_fraction_for_current_item
+
+			elif tax.charge_type == "On Previous Row Total":
+				current_tax_fraction = (tax_rate / 100.0) * \
+					self.doc.get("taxes")[cint(tax.row_id) - 1].grand_total_fraction_for_current_item
+
+		if getattr(tax, "add_deduct_tax", None):
+			current_tax_fraction *= -1.0 if (tax.add_deduct_tax == "Deduct") else 1.0
+		return current_tax_fraction
+
+	def _get_tax_rate(self, tax, item_tax_map):
+		if tax.account_head in item_tax_map:
+			return flt(item_tax_map.get(tax.account_head), self.doc.precision("rate", tax))
+		else:
+			return tax.rate
+
+	def calculate_taxes(self):
+		self.doc.rounding_adjustment = 0
+		actual_tax_dict = dict([[tax.idx, flt(tax.tax_amount, tax.precision("tax_amount"))]
+			for tax in self.doc.get("taxes") if tax.charge_type == "Actual"])
+
+		for n, item in enumerate(self.doc.get("items")):
+			item_tax_map = self._load_item_tax_rate(item.item_tax_rate)
+			for i, tax in enumerate(self.doc.get("taxes")):
+				current_tax_amount = self.get_current_tax_amount(item, tax, item_tax_map)
+
+				if tax.charge_type == "Actual":
+					actual_tax_dict[tax.idx] -= current_tax_amount
+					if n == len(self.doc.get("items")) - 1:
+						current_tax_amount += actual_tax_dict[tax.idx]
+
+				if tax.charge_type != "Actual" and \
+					not (self.discount_amount_applied and self.doc.apply_discount_on=="Grand Total"):
+						tax.tax_amount += current_tax_amount
+
+				tax.tax_amount_for_current_item = current_tax_amount
+				tax.tax_amount_after_discount_amount += current_tax_amount
+
+				current_tax_amount = self.get_tax_amount_if_for_valuation_or_deduction(current_tax_amount, tax)
+
+				if i==0:
+					tax.grand_total_for_current_item = flt(item.net_amount + current_tax_amount)
+				else:
+					tax.grand_total_for_current_item = \
+						flt(self.doc.get("taxes")[i-1].grand_total_for_current_item + current_tax_amount)
+
+				if n == len(self.doc.get("items")) - 1:
+					self.round_off_totals(tax)
+					self.set_cumulative_total(i, tax)
+
+					self._set_in_company_currency(tax,
+						["total", "tax_amount", "tax_amount_after_discount_amount"])
+
+					if i == (len(self.doc.get("taxes")) - 1) and self.discount_amount_applied \
+						and self.doc.discount_amount and self.doc.apply_discount_on == "Grand Total":
+							self.doc.rounding_adjustment = flt(self.doc.grand_total
+								- flt(self.doc.discount_amount) - tax.total,
+								self.doc.precision("rounding_adjustment"))
+
+	def get_current_tax_amount(self, item, tax, item_tax_map):
+		tax_rate = self._get_tax_rate(tax, item_tax_map)
+		current_tax_amount = 0.0
+
+		if tax.charge_type == "Actual":
+			actual = flt(tax.tax_amount, tax.precision("tax_amount"))
+			current_tax_amount = item.net_amount*actual / self.doc.net_total if self.doc.net_total else 0.0
+
+		elif tax.charge_type == "On Net Total":
+			current_tax_amount = (tax_rate / 100.0) * item.net_amount
+		elif tax.charge_type == "On Previous Row Amount":
+			current_tax_amount = (tax_rate / 100.0) * \
+				self.doc.get("taxes")[cint(tax.row_id) - 1].tax_amount_for_current_item
+		elif tax.charge_type == "On Previous Row Total":
+			current_tax_amount = (tax_rate / 100.0) * \
+				self.doc.get("taxes")[cint(tax.row_id) - 1].grand_total_for_current_item
+		elif tax.charge_type == "On Item Quantity":
+			current_tax_amount = tax_rate * item.stock_qty
+
+		key = item.item_code or item.item_name
+		item_wise_tax_amount = current_tax_amount*self.doc.conversion_rate
+		if tax.item_wise_tax_detail.get(key):
+			item_wise_tax_amount += tax.item_wise_tax_detail[key][1]
+
+		tax.item_wise_tax_detail[key] = [tax_rate,flt(item_wise_tax_amount)]
+
+		return current_tax_amount
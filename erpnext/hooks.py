@@ -232,6 +232,10 @@ doc_events = {
 }
 
 scheduler_events = {
+	"all": [
+		"erpnext.stock.doctype.repost_item_valuation.repost_item_valuation.repost_entries",
+		"erpnext.accounts.doctype.pos_invoice_queue.pos_invoice_queue.process_all_queues"
+	],
 	"hourly": [
 		'erpnext.hr.doctype.daily_work_summary_group.daily_work_summary_group.trigger_emails',
 		"erpnext.accounts.doctype.subscription.subscription.process_all",
@@ -257,7 +261,8 @@ scheduler_events = {
 		"erpnext.projects.doctype.project.project.update_project_sales_billing"
 	],
 	"daily_long": [
-		"erpnext.manufacturing.doctype.bom_update_tool.bom_update_tool.update_latest_price_in_all_boms"
+		"erpnext.manufacturing.doctype.bom_update_tool.bom_update_tool.update_latest_price_in_all_boms",
+		"erpnext.stock.doctype.stock_closing_balance.stock_closing_balance.build_closing_balances"
 	],
 	"monthly": [
 		"erpnext.accounts.deferred_revenue.convert_deferred_revenue_to_income",
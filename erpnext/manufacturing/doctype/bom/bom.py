@@ -11,7 +11,8 @@ from erpnext.stock.get_item_details import get_conversion_factor
 
 import functools
 
-from six import string_types
+from six import string_types, iteritems
+from collections import deque
 
 from operator import itemgetter
 
@@ -371,30 +372,44 @@ class BOM(WebsiteGenerator):
 
 	def update_cost_and_exploded_items(self, bom_list=[]):
 		bom_list = self.traverse_tree(bom_list)
+		exploded_items_cache = {}
 		for bom in bom_list:
 			bom_obj = frappe.get_doc("BOM", bom)
 			bom_obj.check_recursion()
-			bom_obj.update_exploded_items()
+			bom_obj.update_exploded_items(exploded_items_cache)
 
 		return bom_list
 
 	def traverse_tree(self, bom_list=None):
-		def _get_children(bom_no):
-			return [cstr(d[0]) for d in frappe.db.sql("""select bom_no from `tabBOM Item`
-				where parent = %s and ifnull(bom_no, '') != '' and parenttype='BOM'""", bom_no)]
+		def _get_children(bom_nos):
+			children = {}
+			for parent, bom_no in frappe.db.sql("""select parent, bom_no from `tabBOM Item`
+				where parent in %(boms)s and ifnull(bom_no, '') != '' and parenttype='BOM'
+				order by parent, idx""", {"boms": bom_nos}):
+				children.setdefault(parent, []).append(cstr(bom_no))
+			return children
 
-		count = 0
 		if not bom_list:
 			bom_list = []
 
 		if self.name not in bom_list:
 			bom_list.append(self.name)
 
-		while(count < len(bom_list)):
-			for child_bom in _get_children(bom_list[count]):
-				if child_bom not in bom_list:
-					bom_list.append(child_bom)
-			count += 1
+		# children of all the boms of a level in one query
+		visited = set(bom_list)
+		level = list(bom_list)
+		while level:
+			children = _get_children(level)
+			next_level = []
+			for bom_no in level:
+				for child_bom in children.get(bom_no, []):
+					if child_bom not in visited:
+						visited.add(child_bom)
+						next_level.append(child_bom)
+
+			bom_list.extend(next_level)
+			level = next_level
+
 		bom_list.reverse()
 		return bom_list
 
@@ -457,17 +472,31 @@ class BOM(WebsiteGenerator):
 		self.scrap_material_cost = total_sm_cost
 		self.base_scrap_material_cost = base_total_sm_cost
 
-	def update_exploded_items(self):
-		""" Update Flat BOM, following will be correct data"""
-		self.get_exploded_items()
-		self.add_exploded_items()
+	def update_exploded_items(self, exploded_items_cache=None):
+		""" Update Flat BOM, following will be correct data, only if it changed.
+		Returns True if it changed.
+
+		`exploded_items_cache` is {bom_no: exploded items} of the child BOMs, shared
+		by the BOMs updated together, so each child BOM is read once"""
+		self.get_exploded_items(exploded_items_cache)
+
+		changed = self.exploded_items_changed()
+		if changed:
+			self.add_exploded_items()
+
+		if exploded_items_cache is not None and self.docstatus == 1:
+			exploded_items_cache[self.name] = [frappe._dict(d,
+				qty_consumed_per_unit=flt(d.stock_qty) / flt(self.quantity or 1))
+				for d in self.cur_exploded_items.values()]
+
+		return changed
 
-	def get_exploded_items(self):
+	def get_exploded_items(self, exploded_items_cache=None):
 		""" Get all raw materials including items from child bom"""
 		self.cur_exploded_items = {}
 		for d in self.get('items'):
 			if d.bom_no:
-				self.get_child_exploded_items(d.bom_no, d.stock_qty)
+				self.get_child_exploded_items(d.bom_no, d.stock_qty, exploded_items_cache)
 			else:
 				self.add_to_cur_exploded_items(frappe._dict({
 					'item_code'		: d.item_code,
@@ -491,15 +520,21 @@ class BOM(WebsiteGenerator):
 		else:
 			self.cur_exploded_items[args.item_code] = args
 
-	def get_child_exploded_items(self, bom_no, stock_qty):
+	def get_child_exploded_items(self, bom_no, stock_qty, exploded_items_cache=None):
 		""" Add all items from Flat BOM of child BOM"""
-		# Did not use qty_consumed_per_unit in the query, as it leads to rounding loss
-		child_fb_items = frappe.db.sql("""select bom_item.item_code, bom_item.item_name,
-			bom_item.description, bom_item.source_warehouse, bom_item.operation,
-			bom_item.stock_uom, bom_item.stock_qty, bom_item.rate, bom_item.allow_transfer_for_manufacture,
-			bom_item.stock_qty / ifnull(bom.quantity, 1) as qty_consumed_per_unit
-			from `tabBOM Explosion Item` bom_item, tabBOM bom
-			where bom_item.parent = bom.name and bom.name = %s and bom.docstatus = 1""", bom_no, as_dict = 1)
+		if exploded_items_cache is not None and bom_no in exploded_items_cache:
+			child_fb_items = exploded_items_cache[bom_no]
+		else:
+			# Did not use qty_consumed_per_unit in the query, as it leads to rounding loss
+			child_fb_items = frappe.db.sql("""select bom_item.item_code, bom_item.item_name,
+				bom_item.description, bom_item.source_warehouse, bom_item.operation,
+				bom_item.stock_uom, bom_item.stock_qty, bom_item.rate, bom_item.allow_transfer_for_manufacture,
+				bom_item.stock_qty / ifnull(bom.quantity, 1) as qty_consumed_per_unit
+				from `tabBOM Explosion Item` bom_item, tabBOM bom
+				where bom_item.parent = bom.name and bom.name = %s and bom.docstatus = 1""", bom_no, as_dict = 1)
+
+			if exploded_items_cache is not None:
+				exploded_items_cache[bom_no] = child_fb_items
 
 		for d in child_fb_items:
 			self.add_to_cur_exploded_items(frappe._dict({
@@ -514,6 +549,30 @@ class BOM(WebsiteGenerator):
 				'allow_transfer_for_manufacture': d.get('allow_transfer_for_manufacture', 0)
 			}))
 
+	def exploded_items_changed(self):
+		"""Returns True if the exploded items are not the same as the ones in the Flat BOM table"""
+		existing = dict((d.item_code, d) for d in self.get('exploded_items'))
+		if len(existing) != len(self.get('exploded_items')) or set(existing) != set(self.cur_exploded_items):
+			return True
+
+		for item_code, args in iteritems(self.cur_exploded_items):
+			d = existing[item_code]
+			for fieldname in ("item_name", "description", "source_warehouse", "operation", "stock_uom", "image"):
+				if fieldname in args and cstr(d.get(fieldname)) != cstr(args.get(fieldname)):
+					return True
+
+			if cint(d.allow_transfer_for_manufacture) != cint(args.allow_transfer_for_manufacture):
+				return True
+
+			for fieldname, value in (("stock_qty", args.stock_qty), ("rate", args.rate),
+				("amount", flt(args.stock_qty) * flt(args.rate)),
+				("qty_consumed_per_unit", flt(args.stock_qty) / flt(self.quantity))):
+				precision = d.precision(fieldname)
+				if flt(d.get(fieldname), precision) != flt(value, precision):
+					return True
+
+		return False
+
 	def add_exploded_items(self):
 		"Add items to Flat BOM table"
 		frappe.db.sql("""delete from `tabBOM Explosion Item` where parent=%s""", self.name)
@@ -675,26 +734,57 @@ def get_children(doctype, parent=None, is_root=False, **filters):
 
 		return bom_items
 
-def get_boms_in_bottom_up_order(bom_no=None):
-	def _get_parent(bom_no):
-		return frappe.db.sql_list("""select distinct parent from `tabBOM Item`
-			where bom_no = %s and docstatus=1 and parenttype='BOM'""", bom_no)
+def get_bom_graph(include_draft=False):
+	"""Returns {bom: set of child boms} of the submitted BOMs, and the draft BOMs if
+	`include_draft` is set, from one query over the BOM Items"""
+	docstatus = "docstatus < 2" if include_draft else "docstatus=1"
+	graph = dict((bom, set()) for bom in frappe.db.sql_list("""select name from `tabBOM`
+		where {0}""".format(docstatus)))
+
+	for parent, bom_no in frappe.db.sql("""select distinct parent, bom_no from `tabBOM Item`
+		where ifnull(bom_no, '') != '' and {0} and parenttype='BOM'""".format(docstatus)):
+		graph.setdefault(parent, set()).add(bom_no)
+
+	return graph
+
+def get_boms_in_bottom_up_order(bom_no=None, graph=None):
+	"""Returns the submitted BOMs, or `bom_no` and the BOMs using it, with every BOM
+	after all of its child BOMs"""
+	if graph is None:
+		graph = get_bom_graph()
+
+	parents = {}
+	for bom, children in iteritems(graph):
+		for child_bom in children:
+			parents.setdefault(child_bom, set()).add(bom)
 
-	count = 0
-	bom_list = []
 	if bom_no:
-		bom_list.append(bom_no)
+		boms, queue = set([bom_no]), deque([bom_no])
+		while queue:
+			for parent in parents.get(queue.popleft(), []):
+				if parent not in boms:
+					boms.add(parent)
+					queue.append(parent)
 	else:
-		# get all leaf BOMs
-		bom_list = frappe.db.sql_list("""select name from `tabBOM` bom where docstatus=1
-			and not exists(select bom_no from `tabBOM Item`
-				where parent=bom.name and ifnull(bom_no, '')!='')""")
-
-	while(count < len(bom_list)):
-		for child_bom in _get_parent(bom_list[count]):
-			if child_bom not in bom_list:
-				bom_list.append(child_bom)
-		count += 1
+		boms = set(graph)
+
+	# number of child boms not yet in the list
+	pending = dict((bom, len(graph.get(bom, set()) & boms)) for bom in boms)
+
+	queue = deque(sorted([bom for bom in boms if not pending[bom]]))
+	bom_list = []
+	while queue:
+		bom = queue.popleft()
+		bom_list.append(bom)
+		for parent in sorted(parents.get(bom, [])):
+			if parent in pending:
+				pending[parent] -= 1
+				if not pending[parent]:
+					queue.append(parent)
+
+	# boms in a recursion, if any
+	if len(bom_list) < len(boms):
+		bom_list.extend(sorted(boms - set(bom_list)))
 
 	return bom_list
 
@@ -5,7 +5,7 @@
 from __future__ import unicode_literals
 import unittest
 import frappe
-from frappe.utils import cstr
+from frappe.utils import cstr, flt
 from frappe.test_runner import make_test_records
 from erpnext.stock.doctype.stock_reconciliation.test_stock_reconciliation import create_stock_reconciliation
 from erpnext.manufacturing.doctype.bom_update_tool.bom_update_tool import update_cost
@@ -130,5 +130,48 @@ class TestBOM(unittest.TestCase):
 		self.assertEqual(bom.base_raw_material_cost, 27000)
 		self.assertEqual(bom.base_total_cost, 33000)
 
+	def test_boms_in_bottom_up_order(self):
+		from erpnext.manufacturing.doctype.bom.bom import get_bom_graph, get_boms_in_bottom_up_order
+
+		graph = get_bom_graph()
+		bom_list = get_boms_in_bottom_up_order(graph=graph)
+		self.assertEqual(set(bom_list), set(graph))
+
+		position = dict((bom, i) for i, bom in enumerate(bom_list))
+		for bom, children in graph.items():
+			for child_bom in children:
+				if child_bom in position:
+					self.assertTrue(position[child_bom] < position[bom])
+
+	def test_update_cost_same_as_bom_update_cost(self):
+		update_cost()
+
+		for bom in frappe.get_all("BOM", filters={"docstatus": 1}):
+			bom = frappe.get_doc("BOM", bom.name)
+			total_cost, base_total_cost = bom.total_cost, bom.base_total_cost
+
+			bom.update_cost(update_parent=False, from_child_bom=True)
+			self.assertEqual(flt(bom.total_cost, 2), flt(total_cost, 2))
+			self.assertEqual(flt(bom.base_total_cost, 2), flt(base_total_cost, 2))
+
+	def test_exploded_items_updated_only_if_changed(self):
+		bom = frappe.get_doc("BOM", get_default_bom())
+		bom.update_exploded_items()
+		exploded_items = [(d.item_code, d.stock_qty, d.rate) for d in bom.exploded_items]
+
+		# same exploded items from the child boms in the cache
+		exploded_items_cache = {}
+		self.assertFalse(bom.update_exploded_items(exploded_items_cache))
+		self.assertTrue(bom.name in exploded_items_cache)
+		self.assertFalse(bom.update_exploded_items(exploded_items_cache))
+
+		bom.quantity = 2
+		self.assertTrue(bom.update_exploded_items())
+		self.assertEqual(sorted(exploded_items), sorted([(d.item_code, d.stock_qty, d.rate)
+			for d in bom.exploded_items]))
+
+		bom.reload()
+		bom.update_exploded_items()
+
 def get_default_bom(item_code="_Test FG Item 2"):
 	return frappe.db.get_value("BOM", {"item": item_code, "is_active": 1, "is_default": 1})
\ No newline at end of file
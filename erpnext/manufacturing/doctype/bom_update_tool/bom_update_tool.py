@@ -4,10 +4,10 @@
 
 from __future__ import unicode_literals
 import frappe, json
-from frappe.utils import cstr, flt
+from frappe.utils import cstr, flt, now
 from frappe import _
-from six import string_types
-from erpnext.manufacturing.doctype.bom.bom import get_boms_in_bottom_up_order
+from six import string_types, iteritems
+from erpnext.manufacturing.doctype.bom.bom import get_boms_in_bottom_up_order, get_bom_graph
 from frappe.model.document import Document
 
 class BOMUpdateTool(Document):
@@ -15,13 +15,15 @@ class BOMUpdateTool(Document):
 		self.validate_bom()
 		self.update_new_bom()
 		bom_list = self.get_parent_boms(self.new_bom)
-		updated_bom = []
+		exploded_items_cache = {}
 
-		for bom in bom_list:
+		# child boms first, the exploded items and cost of a bom are from its child boms
+		for i, bom in enumerate(bom_list):
 			try:
 				bom_obj = frappe.get_doc("BOM", bom)
 				bom_obj.get_doc_before_save()
-				updated_bom = bom_obj.update_cost_and_exploded_items(updated_bom)
+				bom_obj.check_recursion()
+				bom_obj.update_exploded_items(exploded_items_cache)
 				bom_obj.calculate_cost()
 				bom_obj.update_parent_cost()
 				bom_obj.db_update()
@@ -32,8 +34,11 @@ class BOMUpdateTool(Document):
 				frappe.db.commit()
 			except Exception:
 				frappe.db.rollback()
+				exploded_items_cache.pop(bom, None)
 				frappe.log_error(frappe.get_traceback())
 
+			frappe.publish_progress((i + 1) * 100 / len(bom_list), title=_("Updating BOMs..."))
+
 	def validate_bom(self):
 		if cstr(self.current_bom) == cstr(self.new_bom):
 			frappe.throw(_("Current BOM and New BOM can not be same"))
@@ -51,25 +56,18 @@ class BOMUpdateTool(Document):
 			rate=%s, amount=stock_qty*%s where bom_no = %s and docstatus < 2 and parenttype='BOM'""",
 			(self.new_bom, new_bom_unitcost, new_bom_unitcost, self.current_bom))
 
-	def get_parent_boms(self, bom, bom_list=None):
-		if not bom_list:
-			bom_list = []
-
-		data = frappe.db.sql(""" select distinct parent from `tabBOM Item`
-			where ifnull(bom_no, '') = %s and docstatus < 2 and parenttype='BOM'""", bom)
-
-		for d in data:
-			bom_list.append(d[0])
-			self.get_parent_boms(d[0], bom_list)
-
-		return list(set(bom_list))
+	def get_parent_boms(self, bom):
+		"""Returns the BOMs using `bom`, directly or through other BOMs, after their child BOMs"""
+		graph = get_bom_graph(include_draft=True)
+		return [d for d in get_boms_in_bottom_up_order(bom, graph=graph) if d != bom]
 
 @frappe.whitelist()
 def enqueue_replace_bom(args):
 	if isinstance(args, string_types):
 		args = json.loads(args)
 
-	frappe.enqueue("erpnext.manufacturing.doctype.bom_update_tool.bom_update_tool.replace_bom", args=args, timeout=4000)
+	frappe.enqueue("erpnext.manufacturing.doctype.bom_update_tool.bom_update_tool.replace_bom", args=args,
+		queue="long", timeout=4000)
 	frappe.msgprint(_("Queued for replacing the BOM. It may take a few minutes."))
 
 @frappe.whitelist()
@@ -90,6 +88,238 @@ def replace_bom(args):
 	doc.replace_bom()
 
 def update_cost():
-	bom_list = get_boms_in_bottom_up_order()
-	for bom in bom_list:
-		frappe.get_doc("BOM", bom).update_cost(update_parent=False, from_child_bom=True)
\ No newline at end of file
+	BOMCostUpdate().update()
+
+class BOMCostUpdate(object):
+	"""Update the costs of all submitted BOMs from the latest rates, the same as
+	`BOM.update_cost` for each BOM with child BOMs first, in one pass over the BOMs
+	and rates loaded at once. Only the BOMs with changed costs are written."""
+
+	bom_fields = ("operating_cost", "base_operating_cost", "raw_material_cost", "base_raw_material_cost",
+		"scrap_material_cost", "base_scrap_material_cost", "total_cost", "base_total_cost")
+
+	row_fields = {
+		"BOM Item": ("rate", "base_rate", "amount", "base_amount", "qty_consumed_per_unit"),
+		"BOM Operation": ("hour_rate", "base_hour_rate", "operating_cost", "base_operating_cost"),
+		"BOM Scrap Item": ("base_rate", "amount", "base_amount")
+	}
+
+	def __init__(self):
+		self.graph = get_bom_graph()
+		self.bom_list = get_boms_in_bottom_up_order(graph=self.graph)
+		self.precisions = {}
+		self.valuation_rates = {}
+
+		self.load_boms()
+		self.load_rows()
+		self.load_rates()
+
+	def update(self):
+		changed_boms = set()
+		for bom in self.bom_list:
+			if self.calculate_cost(self.boms[bom]):
+				changed_boms.add(bom)
+
+		self.write_changes(changed_boms)
+		self.update_exploded_items(changed_boms)
+
+	def load_boms(self):
+		# all BOMs, a child BOM in a submitted BOM may not be submitted
+		self.boms = dict((d.name, d) for d in frappe.db.sql("""select name, docstatus, is_active,
+				company, quantity, conversion_rate, rm_cost_as_per, buying_price_list,
+				set_rate_of_sub_assembly_item_based_on_bom, {0}
+			from `tabBOM`""".format(", ".join(self.bom_fields)), as_dict=1))
+
+	def load_rows(self):
+		self.rows = {}
+		for doctype, fields in (("BOM Item", "item_code, bom_no, qty, stock_qty, conversion_factor"),
+			("BOM Operation", "workstation, time_in_mins"), ("BOM Scrap Item", "rate, stock_qty")):
+			self.rows[doctype] = {}
+			for d in frappe.db.sql("""select name, parent, {fields}, {row_fields}
+				from `tab{doctype}` where docstatus=1 and parenttype='BOM'
+				order by parent, idx""".format(doctype=doctype, fields=fields,
+					row_fields=", ".join(self.row_fields[doctype])), as_dict=1):
+				self.rows[doctype].setdefault(d.parent, []).append(d)
+
+	def load_rates(self):
+		bom_items = """select distinct item_code from `tabBOM Item`
+			where docstatus=1 and parenttype='BOM'"""
+
+		self.item_details = dict((d.name, d) for d in frappe.db.sql("""select name,
+				is_customer_provided_item, last_purchase_rate, valuation_rate
+			from `tabItem` where name in ({0})""".format(bom_items), as_dict=1))
+
+		self.bin_values = dict((d[0], d[1:]) for d in frappe.db.sql("""select item_code,
+				sum(actual_qty), sum(stock_value)
+			from `tabBin` where item_code in ({0})
+			group by item_code""".format(bom_items)))
+
+		self.item_prices = {}
+		for price_list, item_code, rate in frappe.db.sql("""select price_list, item_code, price_list_rate
+			from `tabItem Price`
+			where item_code in ({0}) and price_list in (select distinct buying_price_list from `tabBOM`
+				where docstatus=1 and rm_cost_as_per='Price List')
+			order by modified desc""".format(bom_items)):
+			self.item_prices.setdefault((price_list, item_code), rate)
+
+		self.price_list_currency = dict(frappe.db.sql("select name, currency from `tabPrice List`"))
+		self.company_currency = dict(frappe.db.sql("select name, default_currency from `tabCompany`"))
+		self.workstation_rates = dict(frappe.db.sql("select name, hour_rate from `tabWorkstation`"))
+
+	def precision(self, doctype, fieldname):
+		key = (doctype, fieldname)
+		if key not in self.precisions:
+			self.precisions[key] = frappe.new_doc(doctype).precision(fieldname)
+
+		return self.precisions[key]
+
+	def calculate_cost(self, bom):
+		"""Set the latest rates and costs of the BOM and its rows, as `BOM.update_cost`
+		and `BOM.calculate_cost`, returns True if anything changed"""
+		conversion_rate = flt(bom.conversion_rate)
+		previous = self.get_values(bom)
+
+		for d in self.rows["BOM Item"].get(bom.name, []):
+			rate = self.get_rm_rate(bom, d)
+			if rate:
+				d.rate = rate * flt(d.conversion_factor) / conversion_rate
+
+		bom.operating_cost = bom.base_operating_cost = 0
+		for d in self.rows["BOM Operation"].get(bom.name, []):
+			if d.workstation and not d.hour_rate:
+				hour_rate = flt(self.workstation_rates.get(d.workstation))
+				d.hour_rate = hour_rate / conversion_rate if conversion_rate else hour_rate
+
+			if d.hour_rate and d.time_in_mins:
+				d.base_hour_rate = flt(d.hour_rate) * conversion_rate
+				d.operating_cost = flt(d.hour_rate) * flt(d.time_in_mins) / 60.0
+				d.base_operating_cost = flt(d.operating_cost) * conversion_rate
+
+			bom.operating_cost += flt(d.operating_cost)
+			bom.base_operating_cost += flt(d.base_operating_cost)
+
+		bom.raw_material_cost = bom.base_raw_material_cost = 0
+		for d in self.rows["BOM Item"].get(bom.name, []):
+			d.base_rate = flt(d.rate) * conversion_rate
+			d.amount = flt(d.rate, self.precision("BOM Item", "rate")) \
+				* flt(d.qty, self.precision("BOM Item", "qty"))
+			d.base_amount = d.amount * conversion_rate
+			d.qty_consumed_per_unit = flt(d.stock_qty, self.precision("BOM Item", "stock_qty")) \
+				/ flt(bom.quantity, self.precision("BOM", "quantity"))
+
+			bom.raw_material_cost += d.amount
+			bom.base_raw_material_cost += d.base_amount
+
+		bom.scrap_material_cost = bom.base_scrap_material_cost = 0
+		conversion_rate = flt(bom.conversion_rate, self.precision("BOM", "conversion_rate"))
+		for d in self.rows["BOM Scrap Item"].get(bom.name, []):
+			d.base_rate = flt(d.rate, self.precision("BOM Scrap Item", "rate")) * conversion_rate
+			d.amount = flt(d.rate, self.precision("BOM Scrap Item", "rate")) \
+				* flt(d.stock_qty, self.precision("BOM Scrap Item", "stock_qty"))
+			d.base_amount = flt(d.amount, self.precision("BOM Scrap Item", "amount")) * conversion_rate
+
+			bom.scrap_material_cost += d.amount
+			bom.base_scrap_material_cost += d.base_amount
+
+		bom.total_cost = bom.operating_cost + bom.raw_material_cost - bom.scrap_material_cost
+		bom.base_total_cost = bom.base_operating_cost + bom.base_raw_material_cost \
+			- bom.base_scrap_material_cost
+
+		return self.get_values(bom) != previous
+
+	def get_values(self, bom):
+		"""Returns the costs of the BOM and its rows, rounded as they are saved"""
+		values = [flt(bom.get(fieldname), self.precision("BOM", fieldname)) for fieldname in self.bom_fields]
+		for doctype, fields in iteritems(self.row_fields):
+			for d in self.rows[doctype].get(bom.name, []):
+				values.extend([flt(d.get(fieldname), self.precision(doctype, fieldname)) for fieldname in fields])
+
+		return values
+
+	def get_rm_rate(self, bom, d):
+		"""Returns the rate of the raw material as `BOM.get_rm_rate`, from the loaded rates"""
+		item = self.item_details.get(d.item_code) or frappe._dict()
+
+		#Customer Provided parts will have zero rate
+		if item.is_customer_provided_item:
+			return 0.0
+
+		rate = 0
+		if d.bom_no and bom.set_rate_of_sub_assembly_item_based_on_bom:
+			child_bom = self.boms.get(d.bom_no)
+			if child_bom and child_bom.is_active and flt(child_bom.quantity):
+				rate = flt(child_bom.base_total_cost) / flt(child_bom.quantity)
+		elif bom.rm_cost_as_per == 'Valuation Rate':
+			rate = self.get_valuation_rate(d.item_code)
+		elif bom.rm_cost_as_per == 'Last Purchase Rate':
+			rate = item.last_purchase_rate
+		elif bom.rm_cost_as_per == "Price List":
+			if not bom.buying_price_list:
+				frappe.throw(_("Please select Price List"))
+
+			rate = self.item_prices.get((bom.buying_price_list, d.item_code)) or 0.0
+			if self.price_list_currency.get(bom.buying_price_list) != self.company_currency.get(bom.company):
+				rate = flt(rate * flt(bom.conversion_rate))
+
+		return flt(rate)
+
+	def get_valuation_rate(self, item_code):
+		"""Weighted average of valuation rate from all warehouses, as `BOM.get_valuation_rate`"""
+		if item_code not in self.valuation_rates:
+			valuation_rate = 0.0
+			total_qty, total_value = self.bin_values.get(item_code) or (0.0, 0.0)
+			if flt(total_qty):
+				valuation_rate = flt(total_value) / flt(total_qty)
+
+			if valuation_rate <= 0:
+				last_valuation_rate = frappe.db.sql("""select valuation_rate
+					from `tabStock Ledger Entry`
+					where item_code = %s and valuation_rate > 0
+					order by posting_date desc, posting_time desc, name desc limit 1""", item_code)
+
+				valuation_rate = flt(last_valuation_rate[0][0]) if last_valuation_rate else 0
+
+			if not valuation_rate:
+				valuation_rate = (self.item_details.get(item_code) or {}).get("valuation_rate")
+
+			self.valuation_rates[item_code] = valuation_rate
+
+		return self.valuation_rates[item_code]
+
+	def write_changes(self, changed_boms):
+		timestamp, user = now(), frappe.session.user
+		boms = [self.boms[bom] for bom in self.bom_list if bom in changed_boms]
+		for d in boms:
+			d.modified, d.modified_by = timestamp, user
+
+		update_rows("BOM", self.bom_fields + ("modified", "modified_by"), boms)
+
+		for doctype, fields in iteritems(self.row_fields):
+			update_rows(doctype, fields, [d for bom in boms for d in self.rows[doctype].get(bom.name, [])])
+
+	def update_exploded_items(self, changed_boms):
+		"""Update the exploded items of the changed BOMs and of the BOMs using them, as
+		the exploded items of a BOM have the rates of its child BOMs"""
+		updated, exploded_items_cache = set(), {}
+		for bom in self.bom_list:
+			if bom in changed_boms or self.graph.get(bom, set()) & updated:
+				if frappe.get_doc("BOM", bom).update_exploded_items(exploded_items_cache):
+					updated.add(bom)
+
+def update_rows(doctype, fields, rows, chunk_size=500):
+	"""Set `fields` of `rows`, `chunk_size` rows in one query"""
+	for i in range(0, len(rows), chunk_size):
+		chunk = rows[i:i + chunk_size]
+
+		set_values, values = [], []
+		for fieldname in fields:
+			set_values.append("`{0}` = case name {1} end".format(fieldname,
+				" ".join(["when %s then %s"] * len(chunk))))
+			for d in chunk:
+				values.extend([d.name, d.get(fieldname)])
+
+		values.extend([d.name for d in chunk])
+
+		frappe.db.sql("""update `tab{doctype}` set {set_values}
+			where name in ({names})""".format(doctype=doctype, set_values=", ".join(set_values),
+				names=", ".join(["%s"] * len(chunk))), values)
@@ -0,0 +1,8 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+import frappe
+
+def execute():
+	frappe.reload_doc("accounts", "doctype", "gl_entry")
+	frappe.get_doc("DocType", "GL Entry").run_module_method("on_doctype_update")
@@ -0,0 +1,7 @@
+from __future__ import unicode_literals
+import frappe
+from erpnext.accounts.doctype.account_period_balance.account_period_balance import rebuild_account_period_balance
+
+def execute():
+	frappe.reload_doc("accounts", "doctype", "account_period_balance")
+	rebuild_account_period_balance()
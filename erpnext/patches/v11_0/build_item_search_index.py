@@ -0,0 +1,7 @@
+from __future__ import unicode_literals
+import frappe
+from erpnext.stock.doctype.item_search_token.item_search_token import rebuild_item_search_index
+
+def execute():
+	frappe.reload_doc("stock", "doctype", "item_search_token")
+	rebuild_item_search_index()
@@ -0,0 +1,20 @@
+from __future__ import unicode_literals
+import frappe
+
+def execute():
+	# empty offline pos names are not unique values
+	frappe.db.sql("""update `tabSales Invoice` set offline_pos_name = null
+		where offline_pos_name = ''""")
+
+	# invoices created twice from the same offline invoice, the submitted one keeps the name
+	for offline_pos_name in frappe.db.sql_list("""select offline_pos_name from `tabSales Invoice`
+		where offline_pos_name is not null
+		group by offline_pos_name having count(*) > 1"""):
+		duplicates = frappe.db.sql_list("""select name from `tabSales Invoice`
+			where offline_pos_name = %s
+			order by docstatus = 1 desc, creation asc""", offline_pos_name)
+
+		frappe.db.sql("""update `tabSales Invoice` set offline_pos_name = concat(offline_pos_name, '-', name)
+			where name in ({0})""".format(", ".join(["%s"] * len(duplicates[1:]))), tuple(duplicates[1:]))
+
+	frappe.reload_doc("accounts", "doctype", "sales_invoice")
@@ -0,0 +1,23 @@
+from __future__ import unicode_literals
+import frappe
+from erpnext.stock.utils import get_stock_queue, dump_stock_queue, MAX_JSON_STOCK_QUEUE_LENGTH
+
+def execute():
+	# JSON queues are still read, only the long ones are worth converting
+	last_name = ""
+	while True:
+		sl_entries = frappe.db.sql("""select name, stock_queue from `tabStock Ledger Entry`
+			where name > %s and stock_queue like '[[%%' and length(stock_queue) > %s
+			order by name limit 10000""", (last_name, MAX_JSON_STOCK_QUEUE_LENGTH * 8), as_dict=1)
+
+		if not sl_entries:
+			break
+
+		for d in sl_entries:
+			stock_queue = get_stock_queue(d.stock_queue)
+			if len(stock_queue) > MAX_JSON_STOCK_QUEUE_LENGTH:
+				frappe.db.sql("""update `tabStock Ledger Entry` set stock_queue = %s where name = %s""",
+					(dump_stock_queue(stock_queue), d.name))
+
+		last_name = sl_entries[-1].name
+		frappe.db.commit()
@@ -23,6 +23,6 @@ def execute():
 					"item_code": d.item_code, 
 					"warehouse": d.warehouse,
 					"posting_date": year_start_date
-				}, allow_zero_rate=True)
+				}, allow_zero_rate=True, stop_early=False)
 			except:
 				pass
\ No newline at end of file
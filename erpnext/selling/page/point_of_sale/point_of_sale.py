@@ -6,6 +6,7 @@ import frappe, json
 from frappe.utils.nestedset import get_root_of
 from frappe.utils import cint
 from erpnext.accounts.doctype.pos_profile.pos_profile import get_item_groups
+from erpnext.stock.doctype.item_search_token.item_search_token import get_item_search_query
 
 from six import string_types
 
@@ -29,71 +30,53 @@ def get_items(start, page_length, price_list, item_group, search_value="", pos_p
 	batch_no = data.get("batch_no") if data.get("batch_no") else ""
 	barcode = data.get("barcode") if data.get("barcode") else ""
 
-	item_code, condition = get_conditions(item_code, serial_no, batch_no, barcode)
+	item_code, condition, search_join, search_values = get_conditions(item_code, serial_no, batch_no, barcode)
 
 	if pos_profile:
 		condition += get_item_group_condition(pos_profile)
 
 	lft, rgt = frappe.db.get_value('Item Group', item_group, ['lft', 'rgt'])
-	# locate function is used to sort by closest match from the beginning of the value
-
-
-	if display_items_in_stock == 0:
-		res = frappe.db.sql("""select i.name as item_code, i.item_name, i.image as item_image,
-			i.is_stock_item, item_det.price_list_rate, item_det.currency
-			from `tabItem` i LEFT JOIN
-				(select item_code, price_list_rate, currency from
-					`tabItem Price`	where price_list=%(price_list)s) item_det
-			ON
-				(item_det.item_code=i.name or item_det.item_code=i.variant_of)
-			where
-				i.disabled = 0 and i.has_variants = 0 and i.is_sales_item = 1
-				and i.item_group in (select name from `tabItem Group` where lft >= {lft} and rgt <= {rgt})
-				and {condition} limit {start}, {page_length}""".format(
-					start=start,
-					page_length=page_length,
-					lft=lft,
-					rgt=rgt,
-					condition=condition
-			), {
-				'price_list': price_list
-			}, as_dict=1)
-
-		res = {
-		'items': res
-		}
 
-	elif display_items_in_stock == 1:
-		query = """select i.name as item_code, i.item_name, i.image as item_image,
-				i.is_stock_item, item_det.price_list_rate, item_det.currency
-				from `tabItem` i LEFT JOIN
-					(select item_code, price_list_rate, currency from
-						`tabItem Price`	where price_list=%(price_list)s) item_det
-				ON
-					(item_det.item_code=i.name or item_det.item_code=i.variant_of) INNER JOIN"""
+	# price of the variant, else of its template
+	query = """select i.name as item_code, i.item_name, i.image as item_image,
+			i.is_stock_item, ifnull(ip.price_list_rate, ipv.price_list_rate) as price_list_rate,
+			ifnull(ip.currency, ipv.currency) as currency
+		from `tabItem` i {search_join}
+		left join `tabItem Price` ip on ip.item_code = i.name and ip.price_list = %(price_list)s
+		left join `tabItem Price` ipv on ipv.item_code = i.variant_of and ipv.price_list = %(price_list)s
+			and ip.name is null"""
 
+	if display_items_in_stock == 1:
 		if warehouse is not None:
-			query = query +  """ (select item_code,actual_qty from `tabBin` where warehouse=%(warehouse)s and actual_qty > 0 group by item_code) item_se"""
+			query += """ inner join (select item_code, actual_qty from `tabBin` where warehouse=%(warehouse)s
+				and actual_qty > 0) item_se on item_se.item_code = i.name"""
 		else:
-			query = query +  """ (select item_code,sum(actual_qty) as actual_qty from `tabBin` group by item_code) item_se"""
-
-		res = frappe.db.sql(query +  """
-			ON
-				((item_se.item_code=i.name or item_det.item_code=i.variant_of) and item_se.actual_qty>0)
-			where
-				i.disabled = 0 and i.has_variants = 0 and i.is_sales_item = 1
-				and i.item_group in (select name from `tabItem Group` where lft >= {lft} and rgt <= {rgt})
-		        	and {condition} limit {start}, {page_length}""".format
-				(start=start,page_length=page_length,lft=lft, 	rgt=rgt, condition=condition),
-			{
-				'item_code': item_code,
-				'price_list': price_list,
-				'warehouse': warehouse
-			} , as_dict=1)
-
-		res = {
+			query += """ inner join (select item_code, sum(actual_qty) as actual_qty from `tabBin`
+				group by item_code having actual_qty > 0) item_se on item_se.item_code = i.name"""
+
+	res = frappe.db.sql((query + """
+		where
+			i.disabled = 0 and i.has_variants = 0 and i.is_sales_item = 1
+			and i.item_group in (select name from `tabItem Group` where lft >= {lft} and rgt <= {rgt})
+			and {condition}
+		order by {order_by} i.name
+		limit {start}, {page_length}""").format(
+			search_join=search_join,
+			order_by="search.score desc," if search_join else "",
+			start=cint(start),
+			page_length=cint(page_length),
+			lft=lft,
+			rgt=rgt,
+			condition=condition
+		), dict(search_values, **{
+			'item_code': item_code,
+			'price_list': price_list,
+			'warehouse': warehouse
+		}), as_dict=1)
+
+	res = {
 		'items': res
-		}
+	}
 
 	if serial_no:
 		res.update({
@@ -133,12 +116,14 @@ def search_serial_or_batch_or_barcode_number(search_value):
 
 def get_conditions(item_code, serial_no, batch_no, barcode):
 	if serial_no or batch_no or barcode:
-		return frappe.db.escape(item_code), "i.name = %(item_code)s"
+		return item_code, "i.name = %(item_code)s", "", {}
 
-	condition = """(i.name like %(item_code)s
-			or i.item_name like %(item_code)s)"""
+	search_query, search_values = get_item_search_query(item_code)
+	if not search_query:
+		return item_code, "1=1", "", {}
 
-	return frappe.db.escape('%' + item_code + '%'), condition
+	search_join = "inner join ({0}) search on search.item_code = i.name".format(search_query)
+	return item_code, "1=1", search_join, search_values
 
 def get_item_group_condition(pos_profile):
 	cond = "and 1=1"
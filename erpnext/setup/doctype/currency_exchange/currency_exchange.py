@@ -8,6 +8,7 @@ import frappe
 from frappe import _, throw
 from frappe.model.document import Document
 from frappe.utils import get_datetime_str, formatdate, nowdate, cint
+from erpnext.setup.utils import clear_exchange_rate_cache
 
 class CurrencyExchange(Document):
 	def autoname(self):
@@ -23,4 +24,10 @@ class CurrencyExchange(Document):
 			throw(_("From Currency and To Currency cannot be same"))
 
 		if not cint(self.for_buying) and not cint(self.for_selling):
-			throw(_("Currency Exchange must be applicable for Buying or for Selling."))
\ No newline at end of file
+			throw(_("Currency Exchange must be applicable for Buying or for Selling."))
+
+	def on_update(self):
+		clear_exchange_rate_cache()
+
+	def on_trash(self):
+		clear_exchange_rate_cache()
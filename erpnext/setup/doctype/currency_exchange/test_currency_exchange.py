@@ -3,7 +3,7 @@
 from __future__ import unicode_literals
 import frappe, unittest
 from frappe.utils import flt
-from erpnext.setup.utils import get_exchange_rate
+from erpnext.setup.utils import get_exchange_rate, get_exchange_rates
 
 test_records = frappe.get_test_records('Currency Exchange')
 
@@ -101,4 +101,23 @@ class TestCurrencyExchange(unittest.TestCase):
 		# Will fetch from fixer.io
 		self.clear_cache()
 		exchange_rate = get_exchange_rate("USD", "INR", "2016-01-15")
-		self.assertEqual(flt(exchange_rate, 3), 67.79)
\ No newline at end of file
+		self.assertEqual(flt(exchange_rate, 3), 67.79)
+
+	def test_exchange_rates_in_bulk(self):
+		save_new_records(test_records)
+		frappe.db.set_value("Accounts Settings", None, "allow_stale", 1)
+
+		rates = get_exchange_rates([("USD", "INR", "2016-01-01"), ("USD", "INR", "2016-01-15"),
+			("USD", "EUR", "2016-01-20"), ("INR", "USD", "2016-01-01")])
+
+		self.assertEqual(rates[("USD", "INR", "2016-01-01")], 60.0)
+		self.assertEqual(rates[("USD", "INR", "2016-01-15")], 65.1)
+		self.assertEqual(rates[("USD", "EUR", "2016-01-20")], 0.773)
+		self.assertEqual(rates[("INR", "USD", "2016-01-01")], 0.0167)
+
+		# cached rates are invalidated on update
+		frappe.set_value("Currency Exchange", "2016-01-10-USD-INR", "exchange_rate", 66.5)
+		self.assertEqual(get_exchange_rate("USD", "INR", "2016-01-15"), 66.5)
+
+		frappe.set_value("Currency Exchange", "2016-01-10-USD-INR", "exchange_rate", 65.1)
+		self.assertEqual(get_exchange_rate("USD", "INR", "2016-01-15"), 65.1)
@@ -4,9 +4,10 @@
 from __future__ import unicode_literals
 import frappe
 from frappe import _
-from frappe.utils import flt, add_days
-from frappe.utils import get_datetime_str, nowdate
+from frappe.utils import flt, cint, add_days, getdate
+from frappe.utils import nowdate
 from erpnext import get_default_company
+from bisect import bisect_right
 
 def get_root_of(doctype):
 	"""Get root element of a DocType with a tree structure"""
@@ -65,31 +66,11 @@ def get_exchange_rate(from_currency, to_currency, transaction_date=None, args=No
 
 	if not transaction_date:
 		transaction_date = nowdate()
-	currency_settings = frappe.get_doc("Accounts Settings").as_dict()
-	allow_stale_rates = currency_settings.get("allow_stale")
-
-	filters = [
-		["date", "<=", get_datetime_str(transaction_date)],
-		["from_currency", "=", from_currency],
-		["to_currency", "=", to_currency]
-	]
-
-	if args == "for_buying":
-		filters.append(["for_buying", "=", "1"])
-	elif args == "for_selling":
-		filters.append(["for_selling", "=", "1"])
-
-	if not allow_stale_rates:
-		stale_days = currency_settings.get("stale_days")
-		checkpoint_date = add_days(transaction_date, -stale_days)
-		filters.append(["date", ">", get_datetime_str(checkpoint_date)])
-
-	# cksgb 19/09/2016: get last entry in Currency Exchange with from_currency and to_currency.
-	entries = frappe.get_all(
-		"Currency Exchange", fields=["exchange_rate"], filters=filters, order_by="date desc",
-		limit=1)
-	if entries:
-		return flt(entries[0].exchange_rate)
+
+	rate = get_exchange_rate_from_table(from_currency, to_currency, transaction_date, args,
+		get_exchange_rate_settings())
+	if rate is not None:
+		return rate
 
 	try:
 		cache = frappe.cache()
@@ -112,6 +93,104 @@ def get_exchange_rate(from_currency, to_currency, transaction_date=None, args=No
 		frappe.msgprint(_("Unable to find exchange rate for {0} to {1} for key date {2}. Please create a Currency Exchange record manually").format(from_currency, to_currency, transaction_date))
 		return 0.0
 
+def get_exchange_rates(rates_for, args=None):
+	"""Returns a dict of exchange rates for a list of (from_currency, to_currency, transaction_date),
+	loading the Currency Exchange records of all the currency pairs in one query"""
+	pairs = list(set((d[0], d[1]) for d in rates_for
+		if d[0] and d[1] and d[0] != d[1] and (d[0], d[1]) not in get_exchange_rate_tables()))
+
+	if pairs:
+		rates = {}
+		for d in frappe.db.sql("""select from_currency, to_currency, date, exchange_rate, for_buying, for_selling
+			from `tabCurrency Exchange` where (from_currency, to_currency) in ({0})
+			order by date""".format(", ".join(["(%s, %s)"] * len(pairs))),
+			[v for d in pairs for v in d], as_dict=1):
+			rates.setdefault((d.from_currency, d.to_currency), []).append(d)
+
+		for pair in pairs:
+			set_exchange_rate_table(pair, rates.get(pair, []))
+
+	settings = get_exchange_rate_settings()
+
+	out = {}
+	for from_currency, to_currency, transaction_date in rates_for:
+		key = (from_currency, to_currency, transaction_date)
+		if key in out:
+			continue
+
+		out[key] = get_exchange_rate_from_table(from_currency, to_currency,
+			transaction_date or nowdate(), args, settings)
+		if out[key] is None:
+			out[key] = get_exchange_rate(from_currency, to_currency, transaction_date, args)
+
+	return out
+
+def get_exchange_rate_settings():
+	return frappe.db.get_value("Accounts Settings", None, ["allow_stale", "stale_days"], as_dict=1) \
+		or frappe._dict()
+
+def get_exchange_rate_from_table(from_currency, to_currency, transaction_date, args, settings):
+	"""Returns the rate of the latest Currency Exchange on or before the date, within the
+	stale days if stale rates are not allowed, or None"""
+	if not (from_currency and to_currency):
+		return
+	if from_currency == to_currency:
+		return 1
+
+	table = get_exchange_rate_table(from_currency, to_currency)
+	dates, rates = table.get(args if args in ("for_buying", "for_selling") else "all")
+
+	transaction_date = getdate(transaction_date)
+	i = bisect_right(dates, transaction_date) - 1
+	if i < 0:
+		return
+
+	if not settings.allow_stale:
+		checkpoint_date = getdate(add_days(transaction_date, -cint(settings.stale_days)))
+		if dates[i] <= checkpoint_date:
+			return
+
+	return flt(rates[i])
+
+def get_exchange_rate_table(from_currency, to_currency):
+	"""Returns dates and rates of Currency Exchange for the pair, sorted by date, separately
+	for all records, the ones for buying and the ones for selling"""
+	pair = (from_currency, to_currency)
+	tables = get_exchange_rate_tables()
+
+	if pair not in tables:
+		records = frappe.cache().hget("currency_exchange_rates", "{0}:{1}".format(*pair))
+		if records is None:
+			records = frappe.get_all("Currency Exchange",
+				fields=["date", "exchange_rate", "for_buying", "for_selling"],
+				filters={"from_currency": from_currency, "to_currency": to_currency}, order_by="date")
+
+		set_exchange_rate_table(pair, records)
+
+	return tables[pair]
+
+def set_exchange_rate_table(pair, records):
+	frappe.cache().hset("currency_exchange_rates", "{0}:{1}".format(*pair), records)
+
+	table = {}
+	for key, condition in (("all", None), ("for_buying", "for_buying"), ("for_selling", "for_selling")):
+		dates, rates = [], []
+		for d in records:
+			if not condition or cint(d.get(condition)):
+				dates.append(getdate(d.date))
+				rates.append(d.exchange_rate)
+
+		table[key] = (dates, rates)
+
+	get_exchange_rate_tables()[pair] = table
+
+def get_exchange_rate_tables():
+	return frappe.local_cache("currency_exchange_rates", "tables", lambda: {})
+
+def clear_exchange_rate_cache():
+	frappe.cache().delete_value("currency_exchange_rates")
+	get_exchange_rate_tables().clear()
+
 def enable_all_roles_and_domains():
 	""" enable all roles and domain for testing """
 	# add all roles to users
@@ -3,7 +3,7 @@
 
 from __future__ import unicode_literals
 import frappe
-from frappe.utils import flt, nowdate
+from frappe.utils import flt, nowdate, get_datetime
 import frappe.defaults
 from frappe.model.document import Document
 
@@ -31,10 +31,47 @@ class Bin(Document):
 				"warehouse": self.warehouse,
 				"posting_date": args.get("posting_date"),
 				"posting_time": args.get("posting_time"),
+				"voucher_type": args.get("voucher_type"),
 				"voucher_no": args.get("voucher_no")
-			}, allow_negative_stock=allow_negative_stock, via_landed_cost_voucher=via_landed_cost_voucher)
+			}, allow_negative_stock=allow_negative_stock, via_landed_cost_voucher=via_landed_cost_voucher,
+				allow_deferred_repost=True)
+
+	def update_stock_in_bulk(self, args_list, allow_negative_stock=False, via_landed_cost_voucher=False):
+		'''Called from erpnext.stock.utils.update_bin_in_bulk, reposts future entries
+		only once, from the earliest of the given entries'''
+		for args in args_list:
+			self.update_qty(args, update_db=False)
+		self.db_update()
+
+		repost_args = None
+		for args in args_list:
+			if not (args.get("actual_qty") or args.get("voucher_type") == "Stock Reconciliation"):
+				continue
+
+			if not args.get("posting_date"):
+				args["posting_date"] = nowdate()
+
+			if args.get("is_cancelled") == "Yes" and via_landed_cost_voucher:
+				continue
 
-	def update_qty(self, args):
+			if not repost_args or (get_datetime("{0} {1}".format(args.get("posting_date"), args.get("posting_time")))
+				< get_datetime("{0} {1}".format(repost_args.get("posting_date"), repost_args.get("posting_time")))):
+				repost_args = args
+
+		if repost_args:
+			from erpnext.stock.stock_ledger import update_entries_after
+
+			update_entries_after({
+				"item_code": self.item_code,
+				"warehouse": self.warehouse,
+				"posting_date": repost_args.get("posting_date"),
+				"posting_time": repost_args.get("posting_time"),
+				"voucher_type": repost_args.get("voucher_type"),
+				"voucher_no": repost_args.get("voucher_no")
+			}, allow_negative_stock=allow_negative_stock, via_landed_cost_voucher=via_landed_cost_voucher,
+				allow_deferred_repost=True)
+
+	def update_qty(self, args, update_db=True):
 		# update the stock values (for current quantities)
 		if args.get("voucher_type")=="Stock Reconciliation":
 			if args.get('is_cancelled') == 'No':
@@ -48,7 +85,8 @@ class Bin(Document):
 		self.planned_qty = flt(self.planned_qty) + flt(args.get("planned_qty"))
 
 		self.set_projected_qty()
-		self.db_update()
+		if update_db:
+			self.db_update()
 
 	def set_projected_qty(self):
 		self.projected_qty = (flt(self.actual_qty) + flt(self.ordered_qty)
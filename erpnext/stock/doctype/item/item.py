@@ -11,6 +11,8 @@ import copy
 from erpnext.controllers.item_variant import (ItemVariantExistsError,
         copy_attributes_to_variant, get_variant, make_variant_item_code, validate_item_variant_attributes)
 from erpnext.setup.doctype.item_group.item_group import (get_parent_item_groups, invalidate_cache_for)
+from erpnext.stock.doctype.item_search_token.item_search_token import (update_item_search_index,
+	delete_item_search_index)
 from frappe import _, msgprint
 from frappe.utils import (cint, cstr, flt, formatdate, get_timestamp, getdate,
                           now_datetime, random_string, strip)
@@ -142,6 +144,7 @@ class Item(WebsiteGenerator):
 		self.update_variants()
 		self.update_item_price()
 		self.update_template_item()
+		update_item_search_index(self)
 
 	def validate_description(self):
 		'''Clean HTML description if set'''
@@ -565,6 +568,7 @@ class Item(WebsiteGenerator):
 		super(Item, self).on_trash()
 		frappe.db.sql("""delete from tabBin where item_code=%s""", self.name)
 		frappe.db.sql("delete from `tabItem Price` where item_code=%s", self.name)
+		delete_item_search_index(self.name)
 		for variant_of in frappe.get_all("Item", filters={"variant_of": self.name}):
 			frappe.delete_doc("Item", variant_of.name)
 
@@ -589,6 +593,7 @@ class Item(WebsiteGenerator):
 			clear_cache(self.route)
 
 		frappe.db.set_value("Item", new_name, "item_code", new_name)
+		update_item_search_index(frappe.get_doc("Item", new_name))
 
 		if merge:
 			self.set_last_purchase_rate(new_name)
@@ -12,7 +12,7 @@ from erpnext.stock.doctype.item.item import StockExistsForTemplate, InvalidBarco
 from erpnext.stock.doctype.item.item import get_uom_conv_factor
 from frappe.model.rename_doc import rename_doc
 from erpnext.stock.doctype.stock_entry.stock_entry_utils import make_stock_entry
-from erpnext.stock.get_item_details import get_item_details
+from erpnext.stock.get_item_details import get_item_details, get_item_details_batch
 
 from six import iteritems
 
@@ -102,6 +102,35 @@ class TestItem(unittest.TestCase):
 		for key, value in iteritems(to_check):
 			self.assertEqual(value, details.get(key))
 
+	def test_get_item_details_batch(self):
+		make_test_objects("Item Price")
+
+		args = {
+			"company": "_Test Company",
+			"price_list": "_Test Price List",
+			"currency": "_Test Currency",
+			"doctype": "Sales Order",
+			"conversion_rate": 1,
+			"price_list_currency": "_Test Currency",
+			"plc_conversion_rate": 1,
+			"order_type": "Sales",
+			"customer": "_Test Customer",
+			"transaction_date": "2013-01-01"
+		}
+		items = [
+			{"item_code": "_Test Item", "qty": 5, "warehouse": "_Test Warehouse - _TC"},
+			{"item_code": "_Test Item 2", "qty": 1},
+			{"item_code": "_Test Item", "qty": 2, "warehouse": "_Test Warehouse 1 - _TC"},
+			{"item_code": "_Test Item Home Desktop 100", "qty": 1}
+		]
+
+		batch = get_item_details_batch(args, items)
+
+		for item, details in zip(items, batch):
+			row = args.copy()
+			row.update(item)
+			self.assertEqual(details, get_item_details(row))
+
 	def test_item_attribute_change_after_variant(self):
 		frappe.delete_doc_if_exists("Item", "_Test Variant Item-L", force=1)
 
@@ -364,6 +393,52 @@ class TestItem(unittest.TestCase):
 		new_barcode.barcode_type = 'EAN'
 		self.assertRaises(InvalidBarcode, item_doc.save)
 
+	def test_item_search_index(self):
+		from erpnext.controllers.queries import item_query
+
+		def search(txt):
+			return [d[0] for d in item_query('Item', txt, 'name', 0, 20, {})]
+
+		create_item("_Test Search Item LUMIA1020")
+		item_doc = frappe.get_doc("Item", "_Test Search Item LUMIA1020")
+		item_doc.set("barcodes", [{"barcode": "4006381333931"}])
+		item_doc.save()
+
+		for txt in ("lumia", "1020", "search lum", "_Test Search Item LUMIA1020", "4006381"):
+			self.assertTrue("_Test Search Item LUMIA1020" in search(txt))
+
+		self.assertFalse("_Test Search Item LUMIA1020" in search("lumia 2020"))
+
+		# better matches of code and name come first
+		create_item("_Test Search Item Lumia Case")
+		item_doc = frappe.get_doc("Item", "_Test Search Item Lumia Case")
+		item_doc.description = "Case for LUMIA1020"
+		item_doc.save()
+		self.assertEqual(search("lumia1020")[:2], ["_Test Search Item LUMIA1020", "_Test Search Item Lumia Case"])
+
+		# a search field not in the index is matched by prefix
+		frappe.db.set_value("Item", "_Test Search Item Lumia Case", "customer_code", "CUST-ABC-7")
+		self.assertTrue("_Test Search Item Lumia Case" in [d[0] for d in
+			item_query('Item', "CUST-ABC", 'customer_code', 0, 20, {})])
+
+		frappe.delete_doc("Item", "_Test Search Item Lumia Case")
+		self.assertFalse(frappe.db.exists("Item Search Token", {"item_code": "_Test Search Item Lumia Case"}))
+
+	def test_pos_get_items(self):
+		from erpnext.selling.page.point_of_sale.point_of_sale import get_items
+
+		def search(search_value=""):
+			return [d.item_code for d in get_items(0, 1000, "_Test Price List", "All Item Groups",
+				search_value=search_value)["items"]]
+
+		create_item("_Test Search Item POS1020")
+		frappe.db.set_value("Item", "_Test Search Item POS1020", "is_sales_item", 1)
+
+		self.assertTrue("_Test Search Item POS1020" in search())
+		self.assertTrue("_Test Search Item POS1020" in search("pos1020"))
+		self.assertTrue("_Test Search Item POS1020" in search("1020"))
+		self.assertFalse("_Test Search Item POS1020" in search("pos2020"))
+
 def set_item_variant_settings(fields):
 	doc = frappe.get_doc('Item Variant Settings')
 	doc.set('fields', fields)
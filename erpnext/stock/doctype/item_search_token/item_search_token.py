@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import re
+import hashlib
+import frappe
+from frappe.utils import cstr, now, strip_html
+from frappe.model.document import Document
+
+# weight of a match in each field of the item, used to rank the results
+search_fields = (
+	("item_code", 10),
+	("barcode", 10),
+	("item_name", 8),
+	("item_group", 3),
+	("description", 1)
+)
+
+max_description_tokens = 100
+
+class ItemSearchToken(Document):
+	pass
+
+def on_doctype_update():
+	frappe.db.add_index("Item Search Token", ["token", "item_code"])
+
+def get_search_tokens(value):
+	'''Returns the lower case words of the value. Words mixing letters and digits
+	are also split into their parts, so that "LUMIA1020" is found by "1020"'''
+	tokens = []
+	for word in re.split(r'[\W_]+', strip_html(cstr(value)).lower(), flags=re.UNICODE):
+		if not word:
+			continue
+
+		tokens.append(word[:140])
+		parts = re.findall(r'[^\W\d_]+|\d+', word, flags=re.UNICODE)
+		if len(parts) > 1:
+			tokens.extend([d[:140] for d in parts])
+
+	return tokens
+
+def get_item_tokens(item):
+	'''Returns {token: weight} of the item, the weight of the best field if a token
+	is found in more than one'''
+	tokens = {}
+	for fieldname, weight in search_fields:
+		if fieldname == "barcode":
+			values = [d.barcode for d in item.get("barcodes") or []]
+		else:
+			values = [item.get(fieldname)]
+
+		for value in values:
+			field_tokens = get_search_tokens(value)
+			if fieldname == "description":
+				field_tokens = field_tokens[:max_description_tokens]
+
+			for token in field_tokens:
+				tokens[token] = max(tokens.get(token, 0), weight)
+
+	return tokens
+
+def update_item_search_index(item):
+	'''Replace the search tokens of the item, called on update of the Item'''
+	delete_item_search_index(item.name)
+	insert_tokens([(item.name, token, weight) for token, weight in get_item_tokens(item).items()])
+
+def delete_item_search_index(item_code):
+	frappe.db.sql("delete from `tabItem Search Token` where item_code=%s", item_code)
+
+def rebuild_item_search_index(page_length=1000):
+	'''Rebuild the search tokens of all items'''
+	frappe.db.sql("delete from `tabItem Search Token`")
+
+	start = 0
+	while True:
+		items = frappe.db.sql("""select name, item_code, item_name, item_group, description
+			from `tabItem` order by name limit %s, %s""", (start, page_length), as_dict=1)
+		if not items:
+			break
+
+		barcodes = {}
+		for d in frappe.db.sql("""select parent, barcode from `tabItem Barcode`
+			where parenttype='Item' and parent in ({0})""".format(", ".join(["%s"] * len(items))),
+			tuple([d.name for d in items]), as_dict=1):
+			barcodes.setdefault(d.parent, []).append(d)
+
+		rows = []
+		for item in items:
+			item.barcodes = barcodes.get(item.name, [])
+			rows.extend([(item.name, token, weight) for token, weight in get_item_tokens(item).items()])
+
+		insert_tokens(rows)
+		start += page_length
+
+def insert_tokens(rows, chunk_size=500):
+	timestamp = now()
+	for i in range(0, len(rows), chunk_size):
+		values = []
+		for item_code, token, weight in rows[i:i + chunk_size]:
+			name = hashlib.md5("{0}|{1}".format(item_code, token).encode("utf-8")).hexdigest()
+			values.extend([name, timestamp, timestamp, frappe.session.user, frappe.session.user,
+				item_code, token, weight])
+
+		frappe.db.sql("""insert into `tabItem Search Token`
+			(name, creation, modified, modified_by, owner, docstatus, item_code, token, weight)
+			values {0}""".format(", ".join(["(%s, %s, %s, %s, %s, 0, %s, %s, %s)"] * (len(values) // 8))),
+			values)
+
+def get_item_search_query(txt):
+	'''Returns a query of the items matching all the words of `txt` by prefix, with
+	their `score` to order by, and its values. Returns None if there are no words to search.
+
+	Prefix matches use the index on token, unlike a `like '%txt%'` scan of the items.'''
+	words = list(dict.fromkeys(get_search_tokens(txt)))
+	if not words:
+		return None, {}
+
+	values, exact, match_any, match_all = {}, [], [], []
+	for i, word in enumerate(words):
+		values["search_word_{0}".format(i)] = word
+		values["search_prefix_{0}".format(i)] = word + "%"
+		exact.append("%(search_word_{0})s".format(i))
+		match_any.append("ist.token like %(search_prefix_{0})s".format(i))
+		match_all.append("sum(ist.token like %(search_prefix_{0})s) > 0".format(i))
+
+	query = """select ist.item_code, sum(ist.weight * if(ist.token in ({exact}), 2, 1)) as score
+		from `tabItem Search Token` ist
+		where {match_any}
+		group by ist.item_code
+		having {match_all}""".format(exact=", ".join(exact), match_any=" or ".join(match_any),
+			match_all=" and ".join(match_all))
+
+	return query, values
@@ -0,0 +1,18 @@
+// Copyright (c) 2018, Frappe Technologies Pvt. Ltd. and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on('Repost Item Valuation', {
+	refresh: function(frm) {
+		if (frm.doc.status == "Failed") {
+			frm.add_custom_button(__("Queue Again"), function() {
+				frappe.call({
+					method: "erpnext.stock.doctype.repost_item_valuation.repost_item_valuation.requeue",
+					args: {name: frm.doc.name},
+					callback: function() {
+						frm.reload_doc();
+					}
+				});
+			});
+		}
+	}
+});
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe, erpnext
+from frappe import _
+from frappe.utils import cint, get_link_to_form
+from frappe.model.document import Document
+from erpnext.utilities.lock import acquire_lock, extend_lock, release_lock
+from collections import OrderedDict
+
+# failed requests are queued again until they have failed this many times
+max_retries = 3
+
+# the lock of the worker expires if it is not extended after a request within this time
+repost_lock_expiry = 3600
+
+# GL Entries of future vouchers are reposted in parallel jobs of this many vouchers
+gl_repost_chunk_size = 100
+
+class RepostItemValuation(Document):
+	def validate(self):
+		if not self.company:
+			self.company = frappe.db.get_value("Warehouse", self.warehouse, "company")
+
+	def repost(self, merged_requests=None, gl_chunk_size=None):
+		'''Repost valuation of the item and warehouse from the posting time and
+		the GL Entries of the stock vouchers after it. Safe to run again if
+		interrupted, as reposting only recomputes from the ledger.
+
+		All the later entries are reposted, without stopping early, as the later
+		requests merged into this one are not reposted on their own. They are marked
+		Skipped once this request is completed, and stay Queued if it fails, which
+		queues it again up to `max_retries` times. Returns True if completed.
+
+		GL Entries of more than `gl_chunk_size` vouchers are reposted in parallel
+		background jobs, after the Stock Ledger is committed'''
+		from erpnext.stock.stock_ledger import update_entries_after
+		from erpnext.controllers.stock_controller import update_gl_entries_after
+
+		self.db_set("status", "In Progress")
+		frappe.db.commit()
+
+		try:
+			update_entries_after({
+				"item_code": self.item_code,
+				"warehouse": self.warehouse,
+				"posting_date": self.posting_date,
+				"posting_time": self.posting_time
+			}, allow_negative_stock=self.allow_negative_stock, via_landed_cost_voucher=self.via_landed_cost_voucher,
+				stop_early=False)
+
+			if cint(erpnext.is_perpetual_inventory_enabled(self.company)):
+				if gl_chunk_size:
+					frappe.db.commit()
+
+				update_gl_entries_after(self.posting_date, self.posting_time, [self.warehouse], [self.item_code],
+					chunk_size=gl_chunk_size)
+
+			self.db_set("status", "Completed")
+			if merged_requests:
+				frappe.db.sql("""update `tabRepost Item Valuation` set status = 'Skipped'
+					where name in ({0}) and status in ('Queued', 'In Progress')""".format(", ".join(["%s"] * len(merged_requests))),
+					tuple(merged_requests))
+			frappe.db.commit()
+			return True
+		except Exception:
+			frappe.db.rollback()
+			self.db_set("error_log", frappe.get_traceback())
+			self.db_set("retry_count", cint(self.retry_count) + 1)
+			self.db_set("status", "Queued" if self.retry_count < max_retries else "Failed")
+			frappe.db.commit()
+			return False
+
+	def requeue(self):
+		'''Queue a Failed request again, after the cause of the failure is fixed'''
+		if self.status != "Failed":
+			frappe.throw(_("Only Failed requests can be queued again"))
+
+		self.db_set("retry_count", 0)
+		self.db_set("status", "Queued")
+
+def is_reposting_deferred():
+	return cint(frappe.db.get_single_value("Stock Settings", "defer_backdated_reposting"))
+
+def create_repost_item_valuation_entry(args):
+	'''Queue reposting of future stock ledger and GL entries for an item and warehouse,
+	once per voucher, item and warehouse'''
+	args = frappe._dict(args)
+	existing = frappe.db.get_value("Repost Item Valuation", {
+		"voucher_type": args.voucher_type,
+		"voucher_no": args.voucher_no,
+		"item_code": args.item_code,
+		"warehouse": args.warehouse,
+		"status": "Queued"
+	})
+	if existing:
+		return frappe.get_doc("Repost Item Valuation", existing)
+
+	repost_entry = frappe.new_doc("Repost Item Valuation")
+	repost_entry.update({
+		"item_code": args.item_code,
+		"warehouse": args.warehouse,
+		"posting_date": args.posting_date,
+		"posting_time": args.posting_time,
+		"voucher_type": args.voucher_type,
+		"voucher_no": args.voucher_no,
+		"allow_negative_stock": cint(args.allow_negative_stock),
+		"via_landed_cost_voucher": cint(args.via_landed_cost_voucher)
+	})
+	repost_entry.flags.ignore_permissions = True
+	repost_entry.insert()
+	return repost_entry
+
+def merge_repost_entries():
+	'''Returns the earliest pending request of each item and warehouse in order of
+	posting time, with the later requests of the same item and warehouse merged into
+	it, as a list of (name, merged names).
+
+	Requests left In Progress by an interrupted run are picked up again.'''
+	pending = OrderedDict()
+	for d in frappe.db.sql("""select name, item_code, warehouse
+		from `tabRepost Item Valuation`
+		where status in ('Queued', 'In Progress')
+		order by timestamp(posting_date, posting_time) asc, creation asc""", as_dict=1):
+		pending.setdefault((d.item_code, d.warehouse), []).append(d.name)
+
+	return [(names[0], names[1:]) for names in pending.values()]
+
+def repost_entries(gl_chunk_size=gl_repost_chunk_size):
+	'''Process queued reposting requests, called by the scheduler. The lock is extended
+	after each request, and the run stops if it has been lost to another worker'''
+	lock = "repost_item_valuation_running"
+	token = acquire_lock(lock, repost_lock_expiry)
+	if not token:
+		return
+
+	try:
+		pending = merge_repost_entries()
+		for i, (name, merged_requests) in enumerate(pending):
+			if not frappe.get_doc("Repost Item Valuation", name).repost(merged_requests, gl_chunk_size):
+				notify_failed_repost(name)
+
+			frappe.publish_progress((i + 1) * 100 / len(pending), title=_("Reposting Item Valuation..."),
+				doctype="Repost Item Valuation", docname=name)
+
+			if not extend_lock(lock, token, repost_lock_expiry):
+				break
+	finally:
+		release_lock(lock, token)
+
+def notify_failed_repost(name):
+	'''Email the Stock Managers about a request that has failed `max_retries` times'''
+	repost_entry = frappe.db.get_value("Repost Item Valuation", name,
+		["status", "item_code", "warehouse"], as_dict=1)
+	if repost_entry.status != "Failed":
+		return
+
+	email_list = frappe.db.sql_list("""select distinct r.parent
+		from `tabHas Role` r, tabUser p
+		where p.name = r.parent and p.enabled = 1 and p.docstatus < 2
+		and r.role = 'Stock Manager'
+		and p.name not in ('Administrator', 'All', 'Guest')""")
+
+	if email_list:
+		frappe.sendmail(recipients=email_list,
+			subject=_("Reposting of Item {0} in Warehouse {1} has failed").format(
+				repost_entry.item_code, repost_entry.warehouse),
+			message=_("Valuation and accounting entries of the item are not updated after {0}. Queue it again after fixing the error.")
+				.format(get_link_to_form("Repost Item Valuation", name)))
+
+@frappe.whitelist()
+def requeue(name):
+	frappe.has_permission("Repost Item Valuation", "write", throw=True)
+	frappe.get_doc("Repost Item Valuation", name).requeue()
@@ -0,0 +1,13 @@
+frappe.listview_settings['Repost Item Valuation'] = {
+	add_fields: ["status"],
+	get_indicator: function(doc) {
+		var colors = {
+			"Queued": "orange",
+			"In Progress": "blue",
+			"Completed": "green",
+			"Skipped": "darkgrey",
+			"Failed": "red"
+		};
+		return [__(doc.status), colors[doc.status], "status,=," + doc.status];
+	}
+};
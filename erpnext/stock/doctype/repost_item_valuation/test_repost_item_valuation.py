@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import frappe
+import unittest
+from erpnext.stock.doctype.item.test_item import create_item
+from erpnext.stock.doctype.stock_entry.stock_entry_utils import make_stock_entry
+from erpnext.stock.doctype.stock_reconciliation.test_stock_reconciliation import create_stock_reconciliation
+from erpnext.stock.doctype.repost_item_valuation.repost_item_valuation import repost_entries, max_retries
+
+class TestRepostItemValuation(unittest.TestCase):
+	def setUp(self):
+		frappe.db.set_value("Stock Settings", None, "defer_backdated_reposting", 1)
+
+	def tearDown(self):
+		frappe.db.set_value("Stock Settings", None, "defer_backdated_reposting", 0)
+
+	def test_deferred_repost(self):
+		item_code = "_Test Item For Deferred Repost"
+		warehouse = "_Test Warehouse - _TC"
+		create_item(item_code)
+
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=100,
+			posting_date="2013-02-01", posting_time="01:00")
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=200,
+			posting_date="2013-02-05", posting_time="01:00")
+
+		# two backdated receipts, only the earliest request is processed
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=400,
+			posting_date="2013-02-03", posting_time="01:00")
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=400,
+			posting_date="2013-02-02", posting_time="01:00")
+
+		requests = frappe.get_all("Repost Item Valuation", filters={"item_code": item_code,
+			"status": "Queued"}, fields=["name", "posting_date"], order_by="posting_date")
+		self.assertEqual(len(requests), 2)
+
+		# future entry is not valued yet
+		self.assertEqual(get_last_stock_value(item_code, warehouse), 3000)
+
+		repost_entries()
+
+		self.assertEqual(frappe.db.get_value("Repost Item Valuation", requests[0].name, "status"), "Completed")
+		self.assertEqual(frappe.db.get_value("Repost Item Valuation", requests[1].name, "status"), "Skipped")
+		self.assertEqual(get_last_stock_value(item_code, warehouse), 11000)
+		self.assertEqual(frappe.db.get_value("Bin", {"item_code": item_code, "warehouse": warehouse},
+			"stock_value"), 11000)
+
+	def test_merged_repost_after_stock_reconciliation(self):
+		item_code = "_Test Item For Merged Repost"
+		warehouse = "_Test Warehouse - _TC"
+		create_item(item_code)
+
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=100,
+			posting_date="2013-02-01", posting_time="01:00")
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=200,
+			posting_date="2013-02-10", posting_time="01:00")
+		create_stock_reconciliation(item_code=item_code, warehouse=warehouse, qty=20, rate=150,
+			posting_date="2013-02-03", posting_time="01:00")
+		repost_entries()
+
+		# the reconciliation is between the two backdated receipts, the request of
+		# the later one is merged into the earlier one
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=400,
+			posting_date="2013-02-05", posting_time="01:00")
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=400,
+			posting_date="2013-02-02", posting_time="01:00")
+		repost_entries()
+
+		self.assertEqual(get_last_stock_value(item_code, warehouse), 9000)
+
+	def test_one_request_per_voucher(self):
+		item_code = "_Test Item For Deferred Repost"
+		warehouse = "_Test Warehouse - _TC"
+		create_item(item_code)
+
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=100,
+			posting_date="2013-03-05", posting_time="01:00")
+
+		stock_entry = make_stock_entry(item_code=item_code, target=warehouse, qty=5, basic_rate=100,
+			posting_date="2013-03-01", posting_time="01:00", do_not_save=True)
+		stock_entry.append("items", frappe.copy_doc(stock_entry.items[0]))
+		stock_entry.insert()
+		stock_entry.submit()
+
+		self.assertEqual(len(frappe.get_all("Repost Item Valuation",
+			filters={"voucher_no": stock_entry.name, "status": "Queued"})), 1)
+
+		repost_entries()
+
+	def test_merged_requests_kept_if_earliest_fails(self):
+		item_code = "_Test Item For Failed Repost"
+		warehouse = "_Test Warehouse - _TC"
+		create_item(item_code)
+		frappe.db.set_value("Stock Settings", None, "allow_negative_stock", 0)
+
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=100,
+			posting_date="2013-04-01", posting_time="01:00")
+		make_stock_entry(item_code=item_code, source=warehouse, qty=10,
+			posting_date="2013-04-05", posting_time="01:00")
+
+		# the backdated issue makes the later issue negative, which fails while reposting
+		make_stock_entry(item_code=item_code, source=warehouse, qty=5,
+			posting_date="2013-04-03", posting_time="01:00")
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=100,
+			posting_date="2013-04-06", posting_time="01:00")
+
+		earliest, merged = [d.name for d in frappe.get_all("Repost Item Valuation",
+			filters={"item_code": item_code, "status": "Queued"}, order_by="posting_date")]
+
+		repost_entries()
+		self.assertEqual(frappe.db.get_value("Repost Item Valuation", earliest, ["status", "retry_count"]),
+			("Queued", 1))
+		self.assertEqual(frappe.db.get_value("Repost Item Valuation", merged, "status"), "Queued")
+
+		for i in range(max_retries - 1):
+			repost_entries()
+
+		self.assertEqual(frappe.db.get_value("Repost Item Valuation", earliest, "status"), "Failed")
+		self.assertTrue(frappe.db.get_value("Repost Item Valuation", earliest, "error_log"))
+		self.assertEqual(frappe.db.get_value("Repost Item Valuation", merged, "status"), "Queued")
+
+		# the failed request is queued again by the user
+		frappe.get_doc("Repost Item Valuation", earliest).requeue()
+		self.assertEqual(frappe.db.get_value("Repost Item Valuation", earliest, ["status", "retry_count"]),
+			("Queued", 0))
+
+		# after a backdated receipt fixes the stock, the requests are merged into its request
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=100,
+			posting_date="2013-04-02", posting_time="01:00")
+		repost_entries()
+
+		self.assertEqual(frappe.db.get_value("Repost Item Valuation", earliest, "status"), "Skipped")
+		self.assertEqual(frappe.db.get_value("Repost Item Valuation", merged, "status"), "Skipped")
+		self.assertEqual(get_last_stock_value(item_code, warehouse), 1500)
+
+	def test_gl_repost_in_chunks(self):
+		from erpnext import set_perpetual_inventory
+		from erpnext.accounts.doctype.account.test_account import get_inventory_account
+
+		item_code = "_Test Item For Chunked GL Repost"
+		warehouse = "_Test Warehouse - _TC"
+		company = frappe.db.get_value("Warehouse", warehouse, "company")
+		create_item(item_code)
+		set_perpetual_inventory(1, company)
+
+		try:
+			make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=100,
+				posting_date="2013-05-01", posting_time="01:00", expense_account="Stock Adjustment - _TC")
+			issues = [make_stock_entry(item_code=item_code, source=warehouse, qty=5,
+				posting_date=posting_date, posting_time="01:00", expense_account="Stock Adjustment - _TC")
+				for posting_date in ("2013-05-02", "2013-05-03")]
+
+			# the backdated receipt is consumed first by both issues, reposted in one job each
+			make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=400,
+				posting_date="2013-04-30", posting_time="01:00", expense_account="Stock Adjustment - _TC")
+			repost_entries(gl_chunk_size=1)
+
+			stock_in_hand_account = get_inventory_account(company, warehouse)
+			for issue in issues:
+				self.assertEqual(frappe.db.sql("""select sum(credit) from `tabGL Entry`
+					where voucher_type='Stock Entry' and voucher_no=%s and account=%s""",
+					(issue.name, stock_in_hand_account))[0][0], 2000)
+		finally:
+			set_perpetual_inventory(0, company)
+
+def get_last_stock_value(item_code, warehouse):
+	return frappe.db.sql("""select stock_value from `tabStock Ledger Entry`
+		where item_code=%s and warehouse=%s
+		order by timestamp(posting_date, posting_time) desc, name desc limit 1""", (item_code, warehouse))[0][0]
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import hashlib
+import frappe
+from frappe.utils import flt, getdate, nowdate, now, add_days, add_months, get_first_day, get_last_day
+from frappe.model.document import Document
+
+class StockClosingBalance(Document):
+	pass
+
+def on_doctype_update():
+	frappe.db.add_index("Stock Closing Balance", ["item_code", "warehouse", "period_end_date"])
+
+def get_closing_balance_date():
+	'''Returns the end date of the last month for which closing balances are built'''
+	upto = frappe.db.get_default("stock_closing_balance_upto")
+	return getdate(upto) if upto else None
+
+def get_snapshot_date(from_date):
+	'''Returns the latest period end date before `from_date` with closing balances, if any'''
+	upto = get_closing_balance_date()
+	if not (upto and from_date):
+		return None
+
+	return min(upto, get_last_day(add_months(from_date, -1)))
+
+def get_closing_balances(date, conditions="", values=None):
+	'''Returns the balance of each item and warehouse as on `date` (a period end date),
+	from the latest closing balance of that item and warehouse up to `date`.
+
+	`conditions` are applied on the closing balances with the alias `cb`'''
+	values = dict(values or {})
+	values["snapshot_date"] = date
+
+	return frappe.db.sql("""
+		select
+			cb.item_code, cb.warehouse, cb.company, cb.period_end_date,
+			cb.bal_qty, cb.bal_val, cb.valuation_rate
+		from `tabStock Closing Balance` cb, (
+			select cb.item_code, cb.warehouse, max(cb.period_end_date) as period_end_date
+			from `tabStock Closing Balance` cb
+			where cb.period_end_date <= %(snapshot_date)s {conditions}
+			group by cb.item_code, cb.warehouse
+		) latest
+		where cb.item_code = latest.item_code and cb.warehouse = latest.warehouse
+			and cb.period_end_date = latest.period_end_date""".format(conditions=conditions),
+		values, as_dict=1)
+
+def build_closing_balances():
+	'''Add the closing balances of the months ended since the last run, one month
+	at a time, called by the scheduler'''
+	last_period_end = get_last_day(add_months(nowdate(), -1))
+
+	upto = get_closing_balance_date()
+	if upto:
+		from_date = add_days(upto, 1)
+	else:
+		first_posting_date = frappe.db.sql("""select min(posting_date)
+			from `tabStock Ledger Entry`""")[0][0]
+		if not first_posting_date:
+			return
+		from_date = get_first_day(first_posting_date)
+
+	while getdate(from_date) <= last_period_end:
+		period_end = get_last_day(from_date)
+		update_closing_balances(from_date, period_end)
+
+		frappe.db.set_default("stock_closing_balance_upto", period_end)
+		frappe.db.commit()
+
+		from_date = add_days(period_end, 1)
+
+def update_closing_balances_after(item_code, warehouse, posting_date):
+	'''Rebuild the closing balances of the item and warehouse from the month of
+	`posting_date`, called after its stock ledger is reposted from that date'''
+	upto = get_closing_balance_date()
+	if not upto or not posting_date or getdate(posting_date) > upto:
+		return
+
+	update_closing_balances(get_first_day(posting_date), upto, item_code, warehouse)
+
+def update_closing_balances(from_date, to_date, item_code=None, warehouse=None, chunk_size=100):
+	'''(Re)build the closing balances of the months from `from_date` (a period start date)
+	to `to_date` (a period end date), starting from the balances of the previous months.
+
+	The balances are folded from the Stock Ledger Entries in the same way as the
+	Stock Balance report, so the report can continue from them.'''
+	conditions, values = "", {"from_date": from_date, "to_date": to_date}
+	if item_code:
+		conditions += " and {0}.item_code = %(item_code)s"
+		values["item_code"] = item_code
+	if warehouse:
+		conditions += " and {0}.warehouse = %(warehouse)s"
+		values["warehouse"] = warehouse
+
+	frappe.db.sql("""delete from `tabStock Closing Balance`
+		where period_end_date between %(from_date)s and %(to_date)s {0}""".format(
+			conditions.format("`tabStock Closing Balance`")), values)
+
+	items = frappe.db.sql_list("""select distinct sle.item_code
+		from `tabStock Ledger Entry` sle
+		where sle.posting_date between %(from_date)s and %(to_date)s
+			and ifnull(sle.is_cancelled, 'No') = 'No' {0}""".format(conditions.format("sle")), values)
+
+	for i in range(0, len(items), chunk_size):
+		item_values = dict(values)
+		item_values["items"] = items[i:i + chunk_size]
+		item_condition = " and {0}.item_code in %(items)s"
+
+		balances = {}
+		for d in get_closing_balances(add_days(from_date, -1),
+				(conditions + item_condition).format("cb"), item_values):
+			balances[(d.item_code, d.warehouse)] = d
+
+		sle_entries = frappe.db.sql("""
+			select
+				sle.item_code, sle.warehouse, sle.company, sle.posting_date, sle.voucher_type,
+				sle.actual_qty, sle.qty_after_transaction, sle.valuation_rate, sle.stock_value_difference
+			from `tabStock Ledger Entry` sle
+			where sle.posting_date between %(from_date)s and %(to_date)s
+				and ifnull(sle.is_cancelled, 'No') = 'No' {0}
+			order by sle.item_code, sle.warehouse, sle.posting_date, sle.posting_time, sle.name""".format(
+				(conditions + item_condition).format("sle")), item_values, as_dict=1)
+
+		insert_closing_balances(get_period_closing_balances(sle_entries, balances))
+
+def get_period_closing_balances(sle_entries, balances):
+	'''Returns the balance of each item and warehouse at the end of every month it has
+	entries in, from `sle_entries` ordered by item, warehouse and posting time'''
+	closing_balances = []
+	current, period_end = None, None
+	for sle in sle_entries:
+		key = (sle.item_code, sle.warehouse)
+		sle_period_end = get_last_day(sle.posting_date)
+		if current and (current.key != key or period_end != sle_period_end):
+			closing_balances.append(frappe._dict(current, period_end_date=period_end))
+
+		if not current or current.key != key:
+			opening = balances.get(key) or {}
+			current = frappe._dict({
+				"key": key,
+				"item_code": sle.item_code,
+				"warehouse": sle.warehouse,
+				"bal_qty": flt(opening.get("bal_qty")),
+				"bal_val": flt(opening.get("bal_val")),
+				"valuation_rate": flt(opening.get("valuation_rate"))
+			})
+
+		if sle.voucher_type == "Stock Reconciliation":
+			current.bal_qty = flt(sle.qty_after_transaction)
+		else:
+			current.bal_qty += flt(sle.actual_qty)
+
+		current.bal_val += flt(sle.stock_value_difference)
+		current.valuation_rate = sle.valuation_rate
+		current.company = sle.company
+		period_end = sle_period_end
+
+	if current:
+		closing_balances.append(frappe._dict(current, period_end_date=period_end))
+
+	return closing_balances
+
+def insert_closing_balances(closing_balances, chunk_size=500):
+	timestamp = now()
+	for i in range(0, len(closing_balances), chunk_size):
+		values = []
+		for d in closing_balances[i:i + chunk_size]:
+			name = hashlib.md5("{0}|{1}|{2}".format(d.item_code, d.warehouse, d.period_end_date)
+				.encode("utf-8")).hexdigest()
+			values.extend([name, timestamp, timestamp, frappe.session.user, frappe.session.user,
+				d.item_code, d.warehouse, d.company, d.period_end_date, d.bal_qty, d.bal_val, d.valuation_rate])
+
+		frappe.db.sql("""insert into `tabStock Closing Balance`
+			(name, creation, modified, modified_by, owner, docstatus, item_code, warehouse, company,
+			period_end_date, bal_qty, bal_val, valuation_rate)
+			values {0}""".format(", ".join(["(%s, %s, %s, %s, %s, 0, %s, %s, %s, %s, %s, %s, %s)"]
+				* (len(values) // 12))), values)
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import frappe
+import unittest
+from erpnext.stock.doctype.stock_entry.stock_entry_utils import make_stock_entry
+from erpnext.stock.doctype.stock_closing_balance.stock_closing_balance import (build_closing_balances,
+	get_closing_balance_date)
+from erpnext.stock.report.stock_balance.stock_balance import execute
+
+class TestStockClosingBalance(unittest.TestCase):
+	def tearDown(self):
+		frappe.defaults.clear_default("stock_closing_balance_upto")
+
+	def test_stock_balance_from_closing_balance(self):
+		for posting_date, qty in (("2013-01-10", 10), ("2013-02-10", 5), ("2013-03-05", -3)):
+			make_stock_entry(item_code="_Test Item", qty=abs(qty), rate=100 + qty, posting_date=posting_date,
+				to_warehouse="_Test Warehouse - _TC" if qty > 0 else None,
+				from_warehouse="_Test Warehouse - _TC" if qty < 0 else None)
+
+		frappe.defaults.clear_default("stock_closing_balance_upto")
+		build_closing_balances()
+		self.assertTrue(get_closing_balance_date())
+		self.check_report()
+
+		# backdated entry, balances of the later months are rebuilt
+		make_stock_entry(item_code="_Test Item", qty=2, rate=150, posting_date="2013-01-20",
+			to_warehouse="_Test Warehouse - _TC")
+		self.check_report()
+
+	def check_report(self):
+		for from_date, to_date in (("2013-01-15", "2013-01-31"), ("2013-03-01", "2013-03-31"),
+			("2013-03-10", "2013-04-30")):
+			filters = frappe._dict(from_date=from_date, to_date=to_date,
+				item_code="_Test Item", warehouse="_Test Warehouse - _TC")
+
+			result = execute(filters)[1]
+
+			# same as the report from the stock ledger entries alone
+			upto = get_closing_balance_date()
+			frappe.defaults.clear_default("stock_closing_balance_upto")
+			expected = execute(filters)[1]
+			frappe.db.set_default("stock_closing_balance_upto", upto)
+
+			self.assertEqual(result, expected)
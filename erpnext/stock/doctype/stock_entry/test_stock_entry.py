@@ -1,10 +1,10 @@
 # Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
 # License: GNU General Public License v3. See license.txt
 
-from __future__ import unicode_literals
+from __future__ import unicode_literals, print_function
 import frappe, unittest
 import frappe.defaults
-from frappe.utils import flt, nowdate, nowtime
+from frappe.utils import cint, flt, nowdate, nowtime
 from erpnext.stock.doctype.serial_no.serial_no import *
 from erpnext.stock.doctype.purchase_receipt.test_purchase_receipt \
 	import set_perpetual_inventory
@@ -726,6 +726,112 @@ class TestStockEntry(unittest.TestCase):
 		self.assertEqual(se.get("items")[0].allow_zero_valuation_rate, 1)
 		self.assertEqual(se.get("items")[0].amount, 0)
 
+	def test_backdated_entry_repost(self):
+		item_code = "_Test Item For Backdated Repost"
+		warehouse = "_Test Warehouse - _TC"
+		create_item(item_code)
+
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=100,
+			posting_date="2013-01-01", posting_time="01:00")
+		make_stock_entry(item_code=item_code, source=warehouse, qty=5,
+			posting_date="2013-01-03", posting_time="01:00")
+		create_stock_reconciliation(item_code=item_code, warehouse=warehouse, qty=20, rate=150,
+			posting_date="2013-01-05", posting_time="01:00")
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=300,
+			posting_date="2013-01-07", posting_time="01:00")
+
+		# backdated receipt changes the issue, but not the entries after the reconciliation
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=400,
+			posting_date="2013-01-02", posting_time="01:00")
+
+		sl_entries = frappe.db.sql("""select qty_after_transaction, valuation_rate, stock_value
+			from `tabStock Ledger Entry` where item_code=%s and warehouse=%s
+			order by timestamp(posting_date, posting_time), name""", (item_code, warehouse), as_dict=1)
+
+		self.assertEqual([[d.qty_after_transaction, d.valuation_rate, d.stock_value] for d in sl_entries],
+			[[10, 100, 1000], [20, 250, 5000], [15, 300, 4500], [20, 150, 3000], [30, 200, 6000]])
+		self.assertEqual(frappe.db.get_value("Bin", {"item_code": item_code, "warehouse": warehouse},
+			["actual_qty", "stock_value"]), (30, 6000))
+
+	def test_backdated_entry_gl_repost(self):
+		company = frappe.db.get_value('Warehouse', '_Test Warehouse - _TC', 'company')
+		set_perpetual_inventory(1, company)
+
+		item_code = "_Test Item For Backdated GL Repost"
+		warehouse = "_Test Warehouse - _TC"
+		create_item(item_code)
+
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=100,
+			posting_date="2013-03-02", posting_time="01:00", expense_account="Stock Adjustment - _TC")
+		mi = make_stock_entry(item_code=item_code, source=warehouse, qty=5,
+			posting_date="2013-03-03", posting_time="01:00", expense_account="Stock Adjustment - _TC")
+
+		stock_in_hand_account = get_inventory_account(mi.company, warehouse)
+		self.check_gl_entries("Stock Entry", mi.name,
+			sorted([[stock_in_hand_account, 0.0, 500.0], ["Stock Adjustment - _TC", 500.0, 0.0]]))
+
+		# backdated receipt is consumed first by the issue
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=400,
+			posting_date="2013-03-01", posting_time="01:00", expense_account="Stock Adjustment - _TC")
+
+		self.check_gl_entries("Stock Entry", mi.name,
+			sorted([[stock_in_hand_account, 0.0, 2000.0], ["Stock Adjustment - _TC", 2000.0, 0.0]]))
+
+	def test_bulk_stock_ledger_posting(self):
+		# ledger posted in bulk is the same as the one posted entry by entry
+		ledgers = {}
+		for bulk in (0, 1):
+			frappe.db.set_value("Stock Settings", None, "bulk_stock_ledger_posting", bulk)
+			se = make_stock_entry_with_lines(500)
+			se.submit()
+			ledgers[bulk] = get_ledger(se)
+			se.cancel()
+
+		frappe.db.set_value("Stock Settings", None, "bulk_stock_ledger_posting", 0)
+
+		self.assertEqual(len(ledgers[0]), 500)
+		self.assertEqual(ledgers[0], ledgers[1])
+
+def make_stock_entry_with_lines(line_count):
+	se = make_stock_entry(item_code="_Test Item", target="_Test Warehouse - _TC",
+		qty=1, basic_rate=100, do_not_save=True)
+	for i in range(line_count - 1):
+		se.append("items", {
+			"item_code": "_Test Item 2" if i % 2 else "_Test Item",
+			"t_warehouse": "_Test Warehouse 1 - _TC" if i % 3 else "_Test Warehouse - _TC",
+			"qty": 1 + i % 5,
+			"basic_rate": 100 + i % 7,
+			"conversion_factor": 1.0,
+			"expense_account": "Stock Adjustment - _TC",
+			"cost_center": "_Test Cost Center - _TC"
+		})
+	se.insert()
+	return se
+
+def get_ledger(se):
+	return [[d.item_code, d.warehouse, d.actual_qty, d.qty_after_transaction,
+		d.valuation_rate, d.stock_value, d.stock_value_difference, d.stock_queue]
+		for d in frappe.db.sql("""select sle.* from `tabStock Ledger Entry` sle,
+			`tabStock Entry Detail` sed where sle.voucher_detail_no = sed.name
+			and sle.voucher_type='Stock Entry' and sle.voucher_no=%s
+			order by sed.idx""", se.name, as_dict=1)]
+
+def benchmark(line_count=500):
+	'''Print the time taken to submit a Stock Entry with `line_count` lines, with the
+	Stock Ledger posted entry by entry and in bulk. Changes are rolled back.
+
+	bench execute erpnext.stock.doctype.stock_entry.test_stock_entry.benchmark --args "[2000]"'''
+	import time
+
+	try:
+		for bulk in (0, 1):
+			frappe.db.set_value("Stock Settings", None, "bulk_stock_ledger_posting", bulk)
+			se = make_stock_entry_with_lines(cint(line_count))
+			start = time.time()
+			se.submit()
+			print("{0}: {1:.3f}s".format("bulk" if bulk else "entry by entry", time.time() - start))
+	finally:
+		frappe.db.rollback()
 
 def make_serialized_item(item_code=None, serial_no=None, target_warehouse=None):
 	se = frappe.copy_doc(test_records[0])
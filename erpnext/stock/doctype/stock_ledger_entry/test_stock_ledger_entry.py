@@ -4,9 +4,58 @@
 from __future__ import unicode_literals
 
 import frappe
-import unittest
+import unittest, json
+from frappe.utils import nowdate, nowtime
+from erpnext.stock.utils import get_stock_queue, dump_stock_queue, get_fifo_rate, \
+	MAX_JSON_STOCK_QUEUE_LENGTH, PACKED_STOCK_QUEUE_PREFIX
+from erpnext.stock.stock_ledger import make_sl_entries
+from erpnext.stock.doctype.item.test_item import create_item
 
 # test_records = frappe.get_test_records('Stock Ledger Entry')
 
 class TestStockLedgerEntry(unittest.TestCase):
-	pass
+	def test_stock_queue_storage(self):
+		short_queue = [[10, 100], [5, 120.5]]
+		self.assertEqual(dump_stock_queue(short_queue), json.dumps(short_queue))
+		self.assertEqual(list(get_stock_queue(dump_stock_queue(short_queue))), short_queue)
+
+		long_queue = [[i + 1.0, 100 + i * 0.25] for i in range(MAX_JSON_STOCK_QUEUE_LENGTH + 50)]
+		packed_queue = dump_stock_queue(long_queue)
+		self.assertTrue(packed_queue.startswith(PACKED_STOCK_QUEUE_PREFIX))
+		self.assertEqual(list(get_stock_queue(packed_queue)), long_queue)
+
+		# outgoing rate of 3 units consumes the first two layers
+		self.assertEqual(get_fifo_rate(get_stock_queue(packed_queue), -3), (1 * 100 + 2 * 100.25) / 3.0)
+
+	def test_batch_balance_checked_per_entry_in_bulk(self):
+		item_code = "_Test Batch Item For Bulk Ledger"
+		create_item(item_code)
+		frappe.db.set_value("Item", item_code, "has_batch_no", 1)
+		if not frappe.db.exists("Batch", "_Test Bulk Ledger Batch"):
+			frappe.get_doc({"doctype": "Batch", "batch_id": "_Test Bulk Ledger Batch",
+				"item": item_code}).insert()
+
+		def get_sl_entry(actual_qty):
+			return frappe._dict({
+				"item_code": item_code,
+				"warehouse": "_Test Warehouse - _TC",
+				"posting_date": nowdate(),
+				"posting_time": nowtime(),
+				"voucher_type": "Stock Entry",
+				"voucher_no": "_Test Bulk Ledger Entry",
+				"voucher_detail_no": "_Test Bulk Ledger Entry Detail",
+				"actual_qty": actual_qty,
+				"incoming_rate": 100 if actual_qty > 0 else 0,
+				"stock_uom": "_Test UOM",
+				"batch_no": "_Test Bulk Ledger Batch",
+				"company": "_Test Company",
+				"is_cancelled": "No"
+			})
+
+		# the batch goes negative before it recovers, which is not allowed in bulk either
+		for bulk in (True, False):
+			self.assertRaises(frappe.ValidationError, make_sl_entries,
+				[get_sl_entry(-5), get_sl_entry(5)], bulk=bulk)
+
+			frappe.db.sql("""delete from `tabStock Ledger Entry`
+				where voucher_no='_Test Bulk Ledger Entry'""")
@@ -122,6 +122,6 @@ def set_valuation_method(item_code, valuation_method):
 			update_entries_after({
 				"item_code": item_code,
 				"warehouse": warehouse.name
-			}, allow_negative_stock=1)
+			}, allow_negative_stock=1, stop_early=False)
 
 test_dependencies = ["Item", "Warehouse"]
@@ -4,8 +4,8 @@
 from __future__ import unicode_literals
 import frappe
 from frappe import _, throw
-from frappe.utils import flt, cint, add_days, cstr, add_months
-import json
+from frappe.utils import flt, cint, add_days, cstr, add_months, getdate
+import json, copy
 from erpnext.accounts.doctype.pricing_rule.pricing_rule import get_pricing_rule_for_item, set_transaction_type
 from erpnext.setup.utils import get_exchange_rate
 from frappe.model.meta import get_field_precision
@@ -81,6 +81,89 @@ def get_item_details(args):
 
 	return out
 
+@frappe.whitelist()
+def get_item_details_batch(args, items):
+	"""Returns the details of each row in `items`, same as `get_item_details` for the
+	row. `args` are the values of the parent document (see `get_item_details`) and each
+	row has its own item_code, qty, uom, warehouse, doctype, name etc.
+
+	Item Prices and Bins of all the rows are loaded together"""
+	if isinstance(args, string_types):
+		args = json.loads(args)
+	if isinstance(items, string_types):
+		items = json.loads(items)
+
+	rows = []
+	for item in items:
+		row = frappe._dict(copy.deepcopy(args))
+		row.update(item)
+		rows.append(process_args(row))
+
+	frappe.flags.item_details_cache = get_item_details_cache(rows)
+	try:
+		return [get_item_details(row) for row in rows]
+	finally:
+		frappe.flags.item_details_cache = None
+
+def get_item_details_cache(rows):
+	"""Load Item Prices of the price lists and Bins of the probable warehouses of the rows,
+	used by `get_item_price` and `get_bin_details` instead of a query per row"""
+	from frappe.defaults import get_user_default_as_list
+
+	cache = frappe._dict(item_prices={}, item_price_names={}, bins={}, bin_keys=set())
+
+	item_codes, price_lists, warehouses = set(), set(), set(get_user_default_as_list('Warehouse'))
+	for row in rows:
+		if not (row.item_code and frappe.db.exists("Item", row.item_code, cache=True)):
+			continue
+
+		item = frappe.get_cached_doc("Item", row.item_code)
+		item_codes.add(item.name)
+		if item.variant_of:
+			item_codes.add(item.variant_of)
+		if row.price_list:
+			price_lists.add(row.price_list)
+
+		warehouses.add(row.warehouse)
+		warehouses.add(get_item_defaults(item.name, row.company).get("default_warehouse"))
+		warehouses.add(get_item_group_defaults(item.name, row.company).get("default_warehouse"))
+
+	warehouses = [d for d in warehouses if d]
+	if not item_codes:
+		return cache
+
+	if price_lists:
+		for d in frappe.db.sql("""select name, item_code, price_list, price_list_rate, uom, customer,
+				supplier, min_qty, valid_from, valid_upto, packing_unit
+			from `tabItem Price` where item_code in ({0}) and price_list in ({1})""".format(
+				", ".join(["%s"] * len(item_codes)), ", ".join(["%s"] * len(price_lists))),
+			list(item_codes) + list(price_lists), as_dict=1):
+			cache.item_prices.setdefault((d.item_code, d.price_list), []).append(d)
+			cache.item_price_names[d.name] = d
+
+		for item_code in item_codes:
+			for price_list in price_lists:
+				cache.item_prices.setdefault((item_code, price_list), [])
+
+	if warehouses:
+		for d in frappe.db.sql("""select item_code, warehouse, projected_qty, actual_qty, reserved_qty,
+				valuation_rate
+			from `tabBin` where item_code in ({0}) and warehouse in ({1})""".format(
+				", ".join(["%s"] * len(item_codes)), ", ".join(["%s"] * len(warehouses))),
+			list(item_codes) + warehouses, as_dict=1):
+			cache.bins[(d.item_code, d.warehouse)] = d
+
+		cache.bin_keys = set((item_code, warehouse) for item_code in item_codes for warehouse in warehouses)
+
+	return cache
+
+def get_cached_bin(item_code, warehouse, fields, default):
+	"""Returns the fields of the Bin from `frappe.flags.item_details_cache`, or None if not loaded"""
+	cache = frappe.flags.item_details_cache
+	if cache and (item_code, warehouse) in cache.bin_keys:
+		bin_details = cache.bins.get((item_code, warehouse))
+		return frappe._dict((f, bin_details.get(f)) for f in fields) if bin_details else default
+
 def update_stock(args, out):
 	if (args.get("doctype") == "Delivery Note" or
 		(args.get("doctype") == "Sales Invoice" and args.get('update_stock'))) \
@@ -433,6 +516,10 @@ def get_item_price(args, item_code):
 	if args.get("supplier"):
 		conditions = "where supplier=%(supplier)s"
 
+	cache = frappe.flags.item_details_cache
+	if cache and (item_code, args.get("price_list")) in cache.item_prices:
+		return filter_item_prices(cache.item_prices[(item_code, args.get("price_list"))], args)
+
 	conditions += """ and item_code=%(item_code)s
 		and price_list=%(price_list)s
 		and ifnull(uom, '') in ('', %(uom)s)"""
@@ -448,6 +535,34 @@ def get_item_price(args, item_code):
 		from `tabItem Price` {conditions}
 		order by uom desc, min_qty desc """.format(conditions=conditions), args)
 
+def filter_item_prices(item_prices, args):
+	"""Same as the query in `get_item_price`, on the loaded Item Prices of the item and price list"""
+	out = []
+	for d in item_prices:
+		if args.get("supplier"):
+			if d.supplier != args.get("supplier"): continue
+		elif args.get("customer"):
+			if d.customer != args.get("customer"): continue
+		elif d.customer or d.supplier:
+			continue
+
+		if d.uom and d.uom != args.get("uom"):
+			continue
+
+		if args.get("min_qty") and flt(d.min_qty) > flt(args.get("min_qty")):
+			continue
+
+		if args.get("transaction_date") and not (getdate(d.valid_from or "2000-01-01")
+			<= getdate(args.get("transaction_date")) <= getdate(d.valid_upto or "2500-12-31")):
+			continue
+
+		out.append(d)
+
+	out.sort(key=lambda d: (d.uom is not None, cstr(d.uom), d.min_qty is not None, flt(d.min_qty)),
+		reverse=True)
+
+	return tuple((d.name, d.price_list_rate, d.uom) for d in out)
+
 def get_price_list_rate_for(args, item_code):
 	"""
 		Return Price Rate based on min_qty of each Item Price Rate.\
@@ -507,7 +622,12 @@ def check_packing_list(price_list_rate_name, desired_qty, item_code):
 		:param qty: Derised Qt
 	"""
 
-	item_price = frappe.get_doc("Item Price", price_list_rate_name)
+	cache = frappe.flags.item_details_cache
+	if cache and price_list_rate_name in cache.item_price_names:
+		item_price = cache.item_price_names[price_list_rate_name]
+	else:
+		item_price = frappe.get_doc("Item Price", price_list_rate_name)
+
 	if desired_qty and item_price.packing_unit:
 		packing_increment = desired_qty % item_price.packing_unit
 
@@ -660,6 +780,12 @@ def get_projected_qty(item_code, warehouse):
 
 @frappe.whitelist()
 def get_bin_details(item_code, warehouse):
+	fields = ["projected_qty", "actual_qty", "reserved_qty"]
+	default = {"projected_qty": 0, "actual_qty": 0, "reserved_qty": 0}
+	bin_details = get_cached_bin(item_code, warehouse, fields, default)
+	if bin_details is not None:
+		return bin_details
+
 	return frappe.db.get_value("Bin", {"item_code": item_code, "warehouse": warehouse},
 		["projected_qty", "actual_qty", "reserved_qty"], as_dict=True, cache=True) \
 			or {"projected_qty": 0, "actual_qty": 0, "reserved_qty": 0}
@@ -830,7 +956,8 @@ def get_valuation_rate(item_code, company, warehouse=None):
 		if not warehouse:
 			warehouse = item.get("default_warehouse") or item_group.get("default_warehouse")
 
-		return frappe.db.get_value("Bin", {"item_code": item_code, "warehouse": warehouse},
+		return get_cached_bin(item_code, warehouse, ["valuation_rate"], {"valuation_rate": 0}) \
+			or frappe.db.get_value("Bin", {"item_code": item_code, "warehouse": warehouse},
 			["valuation_rate"], as_dict=True) or {"valuation_rate": 0}
 
 	elif not item.get("is_stock_item"):
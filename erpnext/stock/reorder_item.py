@@ -6,6 +6,11 @@ import erpnext
 from frappe.utils import flt, nowdate, add_days, cint
 from frappe import _
 
+item_fields = """name, variant_of, item_name, description, item_group, brand, stock_uom,
+	purchase_uom, lead_time_days,
+	(select ucd.conversion_factor from `tabUOM Conversion Detail` ucd
+		where ucd.parent=item.name and ucd.uom=item.purchase_uom limit 1) as purchase_conversion_factor"""
+
 def reorder_item():
 	""" Reorder item if stock reaches reorder level"""
 	# if initial setup not completed, return
@@ -15,29 +20,30 @@ def reorder_item():
 	if cint(frappe.db.get_value('Stock Settings', None, 'auto_indent')):
 		return _reorder_item()
 
-def _reorder_item():
+def _reorder_item(chunk_size=1000):
 	material_requests = {"Purchase": {}, "Transfer": {}, "Material Issue": {}, "Manufacture": {}}
 	warehouse_company = frappe._dict(frappe.db.sql("""select name, company from `tabWarehouse`
 		where disabled=0"""))
 	default_company = (erpnext.get_default_company() or
 		frappe.db.sql("""select name from tabCompany limit 1""")[0][0])
 
-	items_to_consider = frappe.db.sql_list("""select name from `tabItem` item
+	items_to_consider = frappe.db.sql("""select {fields}
+		from `tabItem` item
 		where is_stock_item=1 and has_variants=0
 			and disabled=0
 			and (end_of_life is null or end_of_life='0000-00-00' or end_of_life > %(today)s)
 			and (exists (select name from `tabItem Reorder` ir where ir.parent=item.name)
 				or (variant_of is not null and variant_of != ''
 				and exists (select name from `tabItem Reorder` ir where ir.parent=item.variant_of))
-			)""",
-		{"today": nowdate()})
+			)
+		order by name""".format(fields=item_fields),
+		{"today": nowdate()}, as_dict=1)
 
 	if not items_to_consider:
 		return
 
-	item_warehouse_projected_qty = get_item_warehouse_projected_qty(items_to_consider)
-
-	def add_to_material_request(item_code, warehouse, reorder_level, reorder_qty, material_request_type, warehouse_group=None):
+	def add_to_material_request(item, warehouse, reorder_level, reorder_qty, material_request_type,
+		item_warehouse_projected_qty, warehouse_group=None):
 		if warehouse not in warehouse_company:
 			# a disabled warehouse
 			return
@@ -46,10 +52,7 @@ def _reorder_item():
 		reorder_qty = flt(reorder_qty)
 
 		# projected_qty will be 0 if Bin does not exist
-		if warehouse_group:
-			projected_qty = flt(item_warehouse_projected_qty.get(item_code, {}).get(warehouse_group))
-		else:
-			projected_qty = flt(item_warehouse_projected_qty.get(item_code, {}).get(warehouse))
+		projected_qty = flt(item_warehouse_projected_qty.get(item.name, {}).get(warehouse_group or warehouse))
 
 		if (reorder_level or reorder_qty) and projected_qty < reorder_level:
 			deficiency = reorder_level - projected_qty
@@ -59,52 +62,79 @@ def _reorder_item():
 			company = warehouse_company.get(warehouse) or default_company
 
 			material_requests[material_request_type].setdefault(company, []).append({
-				"item_code": item_code,
+				"item_code": item.name,
 				"warehouse": warehouse,
-				"reorder_qty": reorder_qty
+				"reorder_qty": reorder_qty,
+				"item": item
 			})
 
-	for item_code in items_to_consider:
-		item = frappe.get_doc("Item", item_code)
+	for i in range(0, len(items_to_consider), chunk_size):
+		items = items_to_consider[i:i + chunk_size]
+		reorder_levels = get_reorder_levels(items)
+		item_warehouse_projected_qty = get_item_warehouse_projected_qty([d.name for d in items],
+			set([d.warehouse_group or d.warehouse for rows in reorder_levels.values() for d in rows
+				if d.warehouse_group or d.warehouse]))
 
-		if item.variant_of and not item.get("reorder_levels"):
-			item.update_template_tables()
-
-		if item.get("reorder_levels"):
-			for d in item.get("reorder_levels"):
-				add_to_material_request(item_code, d.warehouse, d.warehouse_reorder_level,
-					d.warehouse_reorder_qty, d.material_request_type, warehouse_group=d.warehouse_group)
+		for item in items:
+			for d in reorder_levels.get(item.name) or []:
+				add_to_material_request(item, d.warehouse, d.warehouse_reorder_level,
+					d.warehouse_reorder_qty, d.material_request_type, item_warehouse_projected_qty,
+					warehouse_group=d.warehouse_group)
 
 	if material_requests:
 		return create_material_request(material_requests)
 
-def get_item_warehouse_projected_qty(items_to_consider):
+def get_item_details(item_codes):
+	if not item_codes:
+		return {}
+
+	return dict((d.name, d) for d in frappe.db.sql("""select {fields}
+		from `tabItem` item where name in ({names})""".format(fields=item_fields,
+			names=", ".join(["%s"] * len(item_codes))), item_codes, as_dict=1))
+
+def get_reorder_levels(items):
+	"""Returns the reorder levels of each item, variants without reorder levels
+	get the ones of their template, without the warehouse group"""
+	templates = list(set([d.variant_of for d in items if d.variant_of]))
+
+	reorder_levels = {}
+	for d in frappe.db.sql("""select parent, warehouse_group, warehouse, warehouse_reorder_level,
+			warehouse_reorder_qty, material_request_type
+		from `tabItem Reorder`
+		where parenttype='Item' and parent in ({0})
+		order by parent, idx""".format(", ".join(["%s"] * (len(items) + len(templates)))),
+		[d.name for d in items] + templates, as_dict=1):
+		reorder_levels.setdefault(d.parent, []).append(d)
+
+	for item in items:
+		if item.variant_of and not reorder_levels.get(item.name):
+			reorder_levels[item.name] = [frappe._dict(d, warehouse_group=None)
+				for d in reorder_levels.get(item.variant_of) or []]
+
+	return reorder_levels
+
+def get_item_warehouse_projected_qty(items_to_consider, warehouses):
+	"""Returns the projected qty of the items in each of the `warehouses`, the sum
+	of the warehouses under it for a group warehouse"""
 	item_warehouse_projected_qty = {}
-
-	for item_code, warehouse, projected_qty in frappe.db.sql("""select item_code, warehouse, projected_qty
-		from tabBin where item_code in ({0})
-			and (warehouse != "" and warehouse is not null)"""\
-		.format(", ".join(["%s"] * len(items_to_consider))), items_to_consider):
-
-		if item_code not in item_warehouse_projected_qty:
-			item_warehouse_projected_qty.setdefault(item_code, {})
-
-		if warehouse not in item_warehouse_projected_qty.get(item_code):
-			item_warehouse_projected_qty[item_code][warehouse] = flt(projected_qty)
-
-		warehouse_doc = frappe.get_doc("Warehouse", warehouse)
-
-		while warehouse_doc.parent_warehouse:
-			if not item_warehouse_projected_qty.get(item_code, {}).get(warehouse_doc.parent_warehouse):
-				item_warehouse_projected_qty.setdefault(item_code, {})[warehouse_doc.parent_warehouse] = flt(projected_qty)
-			else:
-				item_warehouse_projected_qty[item_code][warehouse_doc.parent_warehouse] += flt(projected_qty)
-			warehouse_doc = frappe.get_doc("Warehouse", warehouse_doc.parent_warehouse)
+	if not (items_to_consider and warehouses):
+		return item_warehouse_projected_qty
+
+	warehouses = list(warehouses)
+	for item_code, warehouse, projected_qty in frappe.db.sql("""
+		select bin.item_code, parent_wh.name, sum(bin.projected_qty)
+		from tabBin bin, `tabWarehouse` wh, `tabWarehouse` parent_wh
+		where bin.item_code in ({0}) and parent_wh.name in ({1})
+			and wh.name = bin.warehouse and wh.lft >= parent_wh.lft and wh.rgt <= parent_wh.rgt
+		group by bin.item_code, parent_wh.name""".format(", ".join(["%s"] * len(items_to_consider)),
+			", ".join(["%s"] * len(warehouses))), items_to_consider + warehouses):
+		item_warehouse_projected_qty.setdefault(item_code, {})[warehouse] = flt(projected_qty)
 
 	return item_warehouse_projected_qty
 
-def create_material_request(material_requests):
-	"""	Create indent on reaching reorder level	"""
+def create_material_request(material_requests, max_items_per_request=500):
+	"""	Create indent on reaching reorder level, one per request type and company
+	for every `max_items_per_request` items	"""
 	mr_list = []
 	exceptions_list = []
 
@@ -115,54 +145,55 @@ def create_material_request(material_requests):
 		else:
 			exceptions_list.append(frappe.get_traceback())
 
+	item_details = get_item_details([d.get("item_code") for request_type in material_requests
+		for items in material_requests[request_type].values() for d in items if not d.get("item")])
+
 	for request_type in material_requests:
 		for company in material_requests[request_type]:
-			try:
-				items = material_requests[request_type][company]
-				if not items:
-					continue
-
-				mr = frappe.new_doc("Material Request")
-				mr.update({
-					"company": company,
-					"transaction_date": nowdate(),
-					"material_request_type": "Material Transfer" if request_type=="Transfer" else request_type
-				})
-
-				for d in items:
-					d = frappe._dict(d)
-					item = frappe.get_doc("Item", d.item_code)
-					uom = item.stock_uom
-					conversion_factor = 1.0
-
-					if request_type == 'Purchase':
-						uom = item.purchase_uom or item.stock_uom
-						if uom != item.stock_uom:
-							conversion_factor = frappe.db.get_value("UOM Conversion Detail", 
-								{'parent': item.name, 'uom': uom}, 'conversion_factor') or 1.0
-
-					mr.append("items", {
-						"doctype": "Material Request Item",
-						"item_code": d.item_code,
-						"schedule_date": add_days(nowdate(),cint(item.lead_time_days)),
-						"qty": d.reorder_qty / conversion_factor,
-						"uom": uom,
-						"stock_uom": item.stock_uom,
-						"warehouse": d.warehouse,
-						"item_name": item.item_name,
-						"description": item.description,
-						"item_group": item.item_group,
-						"brand": item.brand,
+			items = material_requests[request_type][company]
+
+			for i in range(0, len(items), max_items_per_request):
+				try:
+					mr = frappe.new_doc("Material Request")
+					mr.update({
+						"company": company,
+						"transaction_date": nowdate(),
+						"material_request_type": "Material Transfer" if request_type=="Transfer" else request_type
 					})
 
-				schedule_dates = [d.schedule_date for d in mr.items]
-				mr.schedule_date = max(schedule_dates or [nowdate()])
-				mr.insert()
-				mr.submit()
-				mr_list.append(mr)
-
-			except:
-				_log_exception()
+					for d in items[i:i + max_items_per_request]:
+						d = frappe._dict(d)
+						item = d.item or item_details[d.item_code]
+						uom = item.stock_uom
+						conversion_factor = 1.0
+
+						if request_type == 'Purchase':
+							uom = item.purchase_uom or item.stock_uom
+							if uom != item.stock_uom:
+								conversion_factor = item.purchase_conversion_factor or 1.0
+
+						mr.append("items", {
+							"doctype": "Material Request Item",
+							"item_code": d.item_code,
+							"schedule_date": add_days(nowdate(),cint(item.lead_time_days)),
+							"qty": d.reorder_qty / conversion_factor,
+							"uom": uom,
+							"stock_uom": item.stock_uom,
+							"warehouse": d.warehouse,
+							"item_name": item.item_name,
+							"description": item.description,
+							"item_group": item.item_group,
+							"brand": item.brand,
+						})
+
+					schedule_dates = [d.schedule_date for d in mr.items]
+					mr.schedule_date = max(schedule_dates or [nowdate()])
+					mr.insert()
+					mr.submit()
+					mr_list.append(mr)
+
+				except:
+					_log_exception()
 
 	if mr_list:
 		if getattr(frappe.local, "reorder_email_notify", None) is None:
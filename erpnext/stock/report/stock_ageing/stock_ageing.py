@@ -4,16 +4,19 @@
 from __future__ import unicode_literals
 import frappe
 from frappe import _
-from frappe.utils import date_diff, flt
+from frappe.utils import date_diff, flt, cint
+from collections import deque
 from six import iteritems
 
 def execute(filters=None):
+	filters = frappe._dict(filters or {})
+	by_warehouse = cint(filters.get("show_warehouse_wise_stock"))
 
-	columns = get_columns()
-	item_details = get_fifo_queue(filters)
+	columns = get_columns(filters)
+	item_details = get_fifo_queue(filters, by_warehouse)
 	to_date = filters["to_date"]
 	data = []
-	for item, item_dict in iteritems(item_details):
+	for key, item_dict in sorted(iteritems(item_details)):
 		fifo_queue = item_dict["fifo_queue"]
 		details = item_dict["details"]
 		if not fifo_queue: continue
@@ -22,8 +25,15 @@ def execute(filters=None):
 		earliest_age = date_diff(to_date, fifo_queue[0][1])
 		latest_age = date_diff(to_date, fifo_queue[-1][1])
 
-		data.append([item, details.item_name, details.description, details.item_group,
-			details.brand, average_age, earliest_age, latest_age, details.stock_uom])
+		row = [details.name, details.item_name, details.description, details.item_group, details.brand]
+		if by_warehouse:
+			row.append(details.warehouse)
+
+		row += [average_age, earliest_age, latest_age]
+		row += get_range_age(filters, fifo_queue, to_date)
+		row.append(details.stock_uom)
+
+		data.append(row)
 
 	return columns, data
 
@@ -36,54 +46,102 @@ def get_average_age(fifo_queue, to_date):
 
 	return (age_qty / total_qty) if total_qty else 0.0
 
-def get_columns():
-	return [_("Item Code") + ":Link/Item:100", _("Item Name") + "::100", _("Description") + "::200",
-		_("Item Group") + ":Link/Item Group:100", _("Brand") + ":Link/Brand:100", _("Average Age") + ":Float:100",
-		_("Earliest") + ":Int:80", _("Latest") + ":Int:80", _("UOM") + ":Link/UOM:100"]
+def get_range_age(filters, fifo_queue, to_date):
+	'''Returns the qty of the queue in each of the ageing ranges'''
+	ranges = [cint(filters.get("range1")) or 30, cint(filters.get("range2")) or 60,
+		cint(filters.get("range3")) or 90]
+	range_qty = [0.0, 0.0, 0.0, 0.0]
+
+	for batch in fifo_queue:
+		age = date_diff(to_date, batch[1])
+		index = len(ranges)
+		for i, days in enumerate(ranges):
+			if age <= days:
+				index = i
+				break
+
+		range_qty[index] += flt(batch[0])
+
+	return range_qty
+
+def get_columns(filters=None):
+	filters = filters or {}
+	range1 = cint(filters.get("range1")) or 30
+	range2 = cint(filters.get("range2")) or 60
+	range3 = cint(filters.get("range3")) or 90
+
+	columns = [_("Item Code") + ":Link/Item:100", _("Item Name") + "::100", _("Description") + "::200",
+		_("Item Group") + ":Link/Item Group:100", _("Brand") + ":Link/Brand:100"]
+
+	if cint(filters.get("show_warehouse_wise_stock")):
+		columns.append(_("Warehouse") + ":Link/Warehouse:100")
+
+	columns += [_("Average Age") + ":Float:100", _("Earliest") + ":Int:80", _("Latest") + ":Int:80",
+		"0-{0}".format(range1) + ":Float:90", "{0}-{1}".format(range1 + 1, range2) + ":Float:90",
+		"{0}-{1}".format(range2 + 1, range3) + ":Float:90", "{0}-{1}".format(range3 + 1, _("Above")) + ":Float:90",
+		_("UOM") + ":Link/UOM:100"]
+
+	return columns
 
-def get_fifo_queue(filters):
+def get_fifo_queue(filters, by_warehouse=False):
+	'''Returns the FIFO queue of [qty, posting_date] of each item, or of each
+	(item, warehouse) if `by_warehouse` is set, as on `to_date`'''
 	item_details = {}
 	for d in get_stock_ledger_entries(filters):
-		item_details.setdefault(d.name, {"details": d, "fifo_queue": []})
-		fifo_queue = item_details[d.name]["fifo_queue"]
+		key = (d.name, d.warehouse) if by_warehouse else d.name
+		item_details.setdefault(key, {"details": d, "fifo_queue": deque(), "qty_after_transaction": {}})
+		fifo_queue = item_details[key]["fifo_queue"]
+		qty_after_transaction = item_details[key]["qty_after_transaction"]
 
 		if d.voucher_type == "Stock Reconciliation":
-			d.actual_qty = flt(d.qty_after_transaction) - flt(item_details[d.name].get("qty_after_transaction", 0))
+			# qty after transaction is of the warehouse of the entry
+			d.actual_qty = flt(d.qty_after_transaction) - flt(qty_after_transaction.get(d.warehouse, 0))
 
 		if d.actual_qty > 0:
 			fifo_queue.append([d.actual_qty, d.posting_date])
 		else:
 			qty_to_pop = abs(d.actual_qty)
-			while qty_to_pop:
-				batch = fifo_queue[0] if fifo_queue else [0, None]
-				if 0 < batch[0] <= qty_to_pop:
-					# if batch qty > 0
+			while qty_to_pop and fifo_queue:
+				batch = fifo_queue[0]
+				if batch[0] <= qty_to_pop:
 					# not enough or exactly same qty in current batch, clear batch
 					qty_to_pop -= batch[0]
-					fifo_queue.pop(0)
+					fifo_queue.popleft()
 				else:
 					# all from current batch
 					batch[0] -= qty_to_pop
 					qty_to_pop = 0
 
-		item_details[d.name]["qty_after_transaction"] = d.qty_after_transaction
+		qty_after_transaction[d.warehouse] = d.qty_after_transaction
 
 	return item_details
 
-def get_stock_ledger_entries(filters):
-	return frappe.db.sql("""select
-			item.name, item.item_name, item_group, brand, description, item.stock_uom,
-			actual_qty, posting_date, voucher_type, qty_after_transaction
-		from `tabStock Ledger Entry` sle,
-			(select name, item_name, description, stock_uom, brand, item_group
-				from `tabItem` {item_conditions}) item
-		where item_code = item.name and
-			company = %(company)s and
-			posting_date <= %(to_date)s
-			{sle_conditions}
-			order by posting_date, posting_time, sle.name"""\
-		.format(item_conditions=get_item_conditions(filters),
-			sle_conditions=get_sle_conditions(filters)), filters, as_dict=True)
+def get_stock_ledger_entries(filters, chunk_size=500):
+	'''Yields the stock ledger entries of the items, in chunks of `chunk_size` items
+	in the order of item code, so that the entries of the company are not loaded at once'''
+	items = frappe.db.sql_list("""select name from `tabItem` {item_conditions} order by name"""
+		.format(item_conditions=get_item_conditions(filters)), filters)
+
+	for i in range(0, len(items), chunk_size):
+		values = dict(filters)
+		values["items"] = items[i:i + chunk_size]
+
+		item_details = dict((d.name, d) for d in frappe.db.sql("""select name, item_name,
+				description, stock_uom, brand, item_group
+			from `tabItem` where name in %(items)s""", values, as_dict=True))
+
+		for sle in frappe.db.sql("""select
+				item_code, warehouse, actual_qty, posting_date, voucher_type, qty_after_transaction
+			from `tabStock Ledger Entry` sle
+			where item_code in %(items)s and
+				company = %(company)s and
+				posting_date <= %(to_date)s
+				{sle_conditions}
+			order by item_code, posting_date, posting_time, sle.name"""
+			.format(sle_conditions=get_sle_conditions(filters)), values, as_dict=True):
+
+			sle.update(item_details[sle.item_code])
+			yield sle
 
 def get_item_conditions(filters):
 	conditions = []
@@ -7,25 +7,30 @@ from frappe import _
 from frappe.utils import flt, cint, getdate, now
 from erpnext.stock.utils import update_included_uom_in_report
 from erpnext.stock.report.stock_ledger.stock_ledger import get_item_group_condition
+from erpnext.stock.doctype.stock_closing_balance.stock_closing_balance import get_snapshot_date, get_closing_balances
 
 from six import iteritems
 
 def execute(filters=None):
 	if not filters: filters = {}
 
-	validate_filters(filters)
+	# continue from the closing balances of the last month before from date
+	snapshot_date = get_snapshot_date(filters.get("from_date"))
+	validate_filters(filters, snapshot_date)
 
 	include_uom = filters.get("include_uom")
 	columns = get_columns()
 	items = get_items(filters)
-	sle = get_stock_ledger_entries(filters, items)
+
+	opening_balances = get_opening_balances(filters, items, snapshot_date) if snapshot_date else []
+	sle = get_stock_ledger_entries(filters, items, snapshot_date)
 
 	# if no stock ledger entry found return
-	if not sle:
+	if not (sle or opening_balances):
 		return columns, []
 
-	iwb_map = get_item_warehouse_map(filters, sle)
-	item_map = get_item_details(items, sle, filters)
+	iwb_map = get_item_warehouse_map(filters, sle, opening_balances)
+	item_map = get_item_details(items or list(set([d[1] for d in iwb_map])), sle, filters)
 	item_reorder_detail_map = get_item_reorder_details(item_map.keys())
 
 	data = []
@@ -105,23 +110,37 @@ def get_conditions(filters):
 	else:
 		frappe.throw(_("'To Date' is required"))
 
+	conditions += get_warehouse_condition(filters, "sle")
+
+	return conditions
+
+def get_warehouse_condition(filters, alias):
 	if filters.get("warehouse"):
 		warehouse_details = frappe.db.get_value("Warehouse",
 			filters.get("warehouse"), ["lft", "rgt"], as_dict=1)
 		if warehouse_details:
-			conditions += " and exists (select name from `tabWarehouse` wh \
-				where wh.lft >= %s and wh.rgt <= %s and sle.warehouse = wh.name)"%(warehouse_details.lft,
-				warehouse_details.rgt)
+			return " and exists (select name from `tabWarehouse` wh \
+				where wh.lft >= %s and wh.rgt <= %s and %s.warehouse = wh.name)"%(warehouse_details.lft,
+				warehouse_details.rgt, alias)
 
-	return conditions
+	return ""
 
-def get_stock_ledger_entries(filters, items):
+def get_opening_balances(filters, items, snapshot_date):
+	conditions = get_warehouse_condition(filters, "cb")
+	if items:
+		conditions += " and cb.item_code in %(items)s"
+
+	return get_closing_balances(snapshot_date, conditions, {"items": items})
+
+def get_stock_ledger_entries(filters, items, snapshot_date=None):
 	item_conditions_sql = ''
 	if items:
 		item_conditions_sql = ' and sle.item_code in ({})'\
 			.format(', '.join([frappe.db.escape(i, percent=False) for i in items]))
 
 	conditions = get_conditions(filters)
+	if snapshot_date:
+		conditions += " and sle.posting_date > %s" % frappe.db.escape(str(snapshot_date))
 
 	return frappe.db.sql("""
 		select
@@ -133,11 +152,20 @@ def get_stock_ledger_entries(filters, items):
 		order by sle.posting_date, sle.posting_time, sle.name""" %
 		(item_conditions_sql, conditions), as_dict=1)
 
-def get_item_warehouse_map(filters, sle):
+def get_item_warehouse_map(filters, sle, opening_balances=None):
 	iwb_map = {}
 	from_date = getdate(filters.get("from_date"))
 	to_date = getdate(filters.get("to_date"))
 
+	for d in opening_balances or []:
+		iwb_map[(d.company, d.item_code, d.warehouse)] = frappe._dict({
+			"opening_qty": flt(d.bal_qty), "opening_val": flt(d.bal_val),
+			"in_qty": 0.0, "in_val": 0.0,
+			"out_qty": 0.0, "out_val": 0.0,
+			"bal_qty": flt(d.bal_qty), "bal_val": flt(d.bal_val),
+			"val_rate": flt(d.valuation_rate)
+		})
+
 	for d in sle:
 		key = (d.company, d.item_code, d.warehouse)
 		if key not in iwb_map:
@@ -179,11 +207,11 @@ def get_item_warehouse_map(filters, sle):
 	return iwb_map
 
 def filter_items_with_no_transactions(iwb_map):
+	float_precision = cint(frappe.db.get_default("float_precision")) or 3
 	for (company, item, warehouse) in sorted(iwb_map):
 		qty_dict = iwb_map[(company, item, warehouse)]
 
 		no_transactions = True
-		float_precision = cint(frappe.db.get_default("float_precision")) or 3
 		for key, val in iteritems(qty_dict):
 			val = flt(val, float_precision)
 			qty_dict[key] = val
@@ -249,9 +277,11 @@ def get_item_reorder_details(items):
 
 	return dict((d.parent + d.warehouse, d) for d in item_reorder_details)
 
-def validate_filters(filters):
+def validate_filters(filters, snapshot_date=None):
 	if not (filters.get("item_code") or filters.get("warehouse")):
-		sle_count = flt(frappe.db.sql("""select count(name) from `tabStock Ledger Entry`""")[0][0])
+		# only the entries after the closing balances are read
+		sle_count = flt(frappe.db.sql("""select count(name) from `tabStock Ledger Entry`
+			where posting_date > %s""", snapshot_date or "1900-01-01")[0][0])
 		if sle_count > 500000:
 			frappe.throw(_("Please set filter based on Item or Warehouse"))
 
@@ -52,7 +52,7 @@ def repost_stock(item_code, warehouse, allow_zero_rate=False, only_actual=False,
 
 def repost_actual_qty(item_code, warehouse, allow_zero_rate=False):
 	try:
-		update_entries_after({ "item_code": item_code, "warehouse": warehouse }, allow_zero_rate)
+		update_entries_after({ "item_code": item_code, "warehouse": warehouse }, allow_zero_rate, stop_early=False)
 	except:
 		pass
 
@@ -210,7 +210,7 @@ def set_stock_balance_as_per_serial_no(item_code=None, posting_date=None, postin
 			"warehouse": d[1],
 			"posting_date": posting_date,
 			"posting_time": posting_time
-		})
+		}, stop_early=False)
 
 def reset_serial_no_status_and_warehouse(serial_nos=None):
 	if not serial_nos:
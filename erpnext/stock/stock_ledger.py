@@ -4,9 +4,10 @@ from __future__ import unicode_literals
 
 import frappe, erpnext
 from frappe import _
-from frappe.utils import cint, flt, cstr, now
-from erpnext.stock.utils import get_valuation_method
-import json
+from frappe.utils import cint, flt, cstr, now, get_datetime
+from erpnext.stock.utils import get_valuation_method, get_stock_queue, dump_stock_queue
+from erpnext.stock.doctype.stock_closing_balance.stock_closing_balance import update_closing_balances_after
+from collections import OrderedDict, deque
 
 from six import iteritems
 
@@ -16,7 +17,8 @@ class NegativeStockError(frappe.ValidationError): pass
 _exceptions = frappe.local('stockledger_exceptions')
 # _exceptions = []
 
-def make_sl_entries(sl_entries, is_amended=None, allow_negative_stock=False, via_landed_cost_voucher=False):
+def make_sl_entries(sl_entries, is_amended=None, allow_negative_stock=False, via_landed_cost_voucher=False,
+		bulk=False):
 	if sl_entries:
 		from erpnext.stock.utils import update_bin
 
@@ -24,24 +26,67 @@ def make_sl_entries(sl_entries, is_amended=None, allow_negative_stock=False, via
 		if cancel:
 			set_as_cancel(sl_entries[0].get('voucher_no'), sl_entries[0].get('voucher_type'))
 
-		for sle in sl_entries:
-			sle_id = None
-			if sle.get('is_cancelled') == 'Yes':
-				sle['actual_qty'] = -flt(sle['actual_qty'])
+		if bulk:
+			make_sl_entries_in_bulk(sl_entries, is_amended, allow_negative_stock, via_landed_cost_voucher)
+		else:
+			for sle in sl_entries:
+				sle_id = None
+				if sle.get('is_cancelled') == 'Yes':
+					sle['actual_qty'] = -flt(sle['actual_qty'])
 
-			if sle.get("actual_qty") or sle.get("voucher_type")=="Stock Reconciliation":
-				sle_id = make_entry(sle, allow_negative_stock, via_landed_cost_voucher)
+				if sle.get("actual_qty") or sle.get("voucher_type")=="Stock Reconciliation":
+					sle_id = make_entry(sle, allow_negative_stock, via_landed_cost_voucher)
 
-			args = sle.copy()
-			args.update({
-				"sle_id": sle_id,
-				"is_amended": is_amended
-			})
-			update_bin(args, allow_negative_stock, via_landed_cost_voucher)
+				args = sle.copy()
+				args.update({
+					"sle_id": sle_id,
+					"is_amended": is_amended
+				})
+				update_bin(args, allow_negative_stock, via_landed_cost_voucher)
 
 		if cancel:
 			delete_cancelled_entry(sl_entries[0].get('voucher_type'), sl_entries[0].get('voucher_no'))
 
+def make_sl_entries_in_bulk(sl_entries, is_amended=None, allow_negative_stock=False, via_landed_cost_voucher=False):
+	"""Insert all Stock Ledger Entries of a voucher with multi-row inserts and
+	update each (item_code, warehouse) Bin once, reposting future entries from the
+	earliest entry of that key instead of once per row.
+
+	Entries go through the same steps as `insert` and `submit`, and batch balances
+	are checked after each entry in order, before any entry is inserted"""
+	from erpnext.stock.utils import update_bin_in_bulk
+	from erpnext.utilities.bulk_insert import bulk_insert
+
+	sle_docs = []
+	entries_by_key = OrderedDict()
+	for sle in sl_entries:
+		sle_id = None
+		if sle.get('is_cancelled') == 'Yes':
+			sle['actual_qty'] = -flt(sle['actual_qty'])
+
+		if sle.get("actual_qty") or sle.get("voucher_type")=="Stock Reconciliation":
+			sle_doc = get_validated_entry(sle, allow_negative_stock, via_landed_cost_voucher)
+			sle_docs.append(sle_doc)
+			sle_id = sle_doc.name
+
+		args = sle.copy()
+		args.update({
+			"sle_id": sle_id,
+			"is_amended": is_amended
+		})
+		entries_by_key.setdefault((sle.get("item_code"), sle.get("warehouse")), []).append(args)
+
+	validate_batch_balances(sle_docs)
+
+	bulk_insert(sle_docs)
+	for sle_doc in sle_docs:
+		sle_doc.run_method("after_insert")
+		sle_doc.run_method("on_update")
+		sle_doc.run_method("on_submit")
+
+	for args_list in entries_by_key.values():
+		update_bin_in_bulk(args_list, allow_negative_stock, via_landed_cost_voucher)
+
 def set_as_cancel(voucher_type, voucher_no):
 	frappe.db.sql("""update `tabStock Ledger Entry` set is_cancelled='Yes',
 		modified=%s, modified_by=%s
@@ -58,6 +103,49 @@ def make_entry(args, allow_negative_stock=False, via_landed_cost_voucher=False):
 	sle.submit()
 	return sle.name
 
+def get_validated_entry(args, allow_negative_stock=False, via_landed_cost_voucher=False):
+	"""Return a named and validated Stock Ledger Entry, ready to be inserted as submitted.
+	Runs the steps of `insert` and `submit` that come before the database insert"""
+	from frappe.model.naming import set_new_name
+
+	args.update({"doctype": "Stock Ledger Entry"})
+	sle = frappe.get_doc(args)
+	sle.flags.ignore_permissions = 1
+	sle.allow_negative_stock = allow_negative_stock
+	sle.via_landed_cost_voucher = via_landed_cost_voucher
+	sle._action = "submit"
+	sle._set_defaults()
+	sle.set_user_and_timestamp()
+	sle.docstatus = 1
+	sle.run_method("before_insert")
+	sle._validate_links()
+	set_new_name(sle)
+	sle.run_method("validate")
+	sle.run_method("before_submit")
+	sle._validate()
+	return sle
+
+def validate_batch_balances(sle_docs):
+	"""Check the batch balance after each entry in order, as `actual_amt_check` does
+	for entries inserted one by one, so that a balance that goes negative and then
+	recovers within the voucher is not allowed"""
+	balances = {}
+	for sle in sle_docs:
+		if not sle.batch_no or sle.get("allow_negative_stock"):
+			continue
+
+		key = (sle.warehouse, sle.item_code, sle.batch_no)
+		if key not in balances:
+			balances[key] = flt(frappe.db.sql("""select sum(actual_qty)
+				from `tabStock Ledger Entry`
+				where warehouse=%s and item_code=%s and batch_no=%s""", key)[0][0])
+
+		balances[key] += flt(sle.actual_qty)
+		sle.flags.batch_balance_checked = True
+		if balances[key] < 0:
+			frappe.throw(_("Stock balance in Batch {0} will become negative {1} for Item {2} at Warehouse {3}")
+				.format(sle.batch_no, balances[key], sle.item_code, sle.warehouse))
+
 def delete_cancelled_entry(voucher_type, voucher_no):
 	frappe.db.sql("""delete from `tabStock Ledger Entry`
 		where voucher_type=%s and voucher_no=%s""", (voucher_type, voucher_no))
@@ -75,12 +163,26 @@ class update_entries_after(object):
 				"posting_date": "2012-12-12",
 				"posting_time": "12:00"
 			}
+
+		Every Stock Ledger Entry stores the running qty, value and FIFO queue, so
+		each one is a checkpoint: reposting starts from the last entry before the
+		time-bucket and, if `stop_early` is set, stops as soon as the recomputed
+		running state matches the one stored in a later entry.
+
+		If `allow_deferred_repost` is set and reposting of backdated transactions
+		is deferred in Stock Settings, only the entries of the current time-bucket
+		are processed and a Repost Item Valuation request is queued for the rest.
 	"""
-	def __init__(self, args, allow_zero_rate=False, allow_negative_stock=None, via_landed_cost_voucher=False, verbose=1):
+	def __init__(self, args, allow_zero_rate=False, allow_negative_stock=None, via_landed_cost_voucher=False,
+			verbose=1, stop_early=True, allow_deferred_repost=False):
 		from frappe.model.meta import get_field_precision
+		from erpnext.stock.doctype.repost_item_valuation.repost_item_valuation import is_reposting_deferred
 
 		self.exceptions = []
 		self.verbose = verbose
+		self.stop_early = stop_early
+		self.defer_repost = allow_deferred_repost and is_reposting_deferred()
+		self.repost_deferred = False
 		self.allow_zero_rate = allow_zero_rate
 		self.allow_negative_stock = allow_negative_stock
 		self.via_landed_cost_voucher = via_landed_cost_voucher
@@ -103,23 +205,101 @@ class update_entries_after(object):
 			currency=frappe.get_cached_value('Company',  self.company,  "default_currency"))
 
 		self.prev_stock_value = self.previous_sle.stock_value or 0.0
-		self.stock_queue = json.loads(self.previous_sle.stock_queue or "[]")
+		self.stock_queue = get_stock_queue(self.previous_sle.stock_queue)
 		self.valuation_method = get_valuation_method(self.item_code)
 		self.stock_value_difference = 0.0
+		self.page_length = 1000
 		self.build()
 
 	def build(self):
+		self.repost_from = get_datetime("{0} {1}".format(self.args.get("posting_date") or "1900-01-01",
+			self.args.get("posting_time") or "00:00"))
+		self.entries_to_update = []
+
 		# includes current entry!
-		entries_to_fix = self.get_sle_after_datetime()
+		last_sle, stopped_early = None, False
+		while not stopped_early:
+			entries_to_fix = self.get_sle_after_datetime(last_sle)
+
+			for sle in entries_to_fix:
+				if self.defer_repost and sle.timestamp > self.repost_from:
+					self.repost_deferred = stopped_early = True
+					break
+
+				if self.process_sle(sle):
+					stopped_early = True
+					break
 
-		for sle in entries_to_fix:
-			self.process_sle(sle)
+			self.update_entries()
+
+			if len(entries_to_fix) < self.page_length:
+				break
+
+			last_sle = entries_to_fix[-1]
 
 		if self.exceptions:
 			self.raise_exceptions()
 
+		update_closing_balances_after(self.item_code, self.warehouse, self.args.get("posting_date"))
+
+		if self.repost_deferred:
+			# balance in the Bin is updated when the queued request is processed
+			self.queue_repost()
+			return
+
+		if stopped_early:
+			# later entries are unchanged, the last one has the current balance
+			self.set_balance_from_last_sle()
+
 		self.update_bin()
 
+	def queue_repost(self):
+		from erpnext.stock.doctype.repost_item_valuation.repost_item_valuation \
+			import create_repost_item_valuation_entry
+
+		create_repost_item_valuation_entry({
+			"item_code": self.item_code,
+			"warehouse": self.warehouse,
+			"posting_date": self.args.get("posting_date"),
+			"posting_time": self.args.get("posting_time"),
+			"voucher_type": self.args.get("voucher_type"),
+			"voucher_no": self.args.get("voucher_no"),
+			"allow_negative_stock": self.allow_negative_stock,
+			"via_landed_cost_voucher": self.via_landed_cost_voucher
+		})
+
+	def set_balance_from_last_sle(self):
+		last_sle = frappe.db.sql("""select qty_after_transaction, valuation_rate, stock_value
+			from `tabStock Ledger Entry`
+			where item_code = %s and warehouse = %s and ifnull(is_cancelled, 'No')='No'
+			order by timestamp(posting_date, posting_time) desc, name desc
+			limit 1""", (self.item_code, self.warehouse), as_dict=1)[0]
+
+		for key in ("qty_after_transaction", "valuation_rate", "stock_value"):
+			setattr(self, key, flt(last_sle.get(key)))
+
+	def update_entries(self):
+		"""write back the recomputed balances with one update statement"""
+		if not self.entries_to_update:
+			return
+
+		fields = ("qty_after_transaction", "valuation_rate", "stock_value", "stock_queue",
+			"stock_value_difference")
+
+		values, set_fields = [], []
+		for field in fields:
+			set_fields.append("`{0}` = case name {1} end".format(field,
+				" ".join(["when %s then %s"] * len(self.entries_to_update))))
+			for sle in self.entries_to_update:
+				values.extend([sle.name, sle.get(field)])
+
+		values.extend([sle.name for sle in self.entries_to_update])
+
+		frappe.db.sql("""update `tabStock Ledger Entry` set {0} where name in ({1})""".format(
+			", ".join(set_fields), ", ".join(["%s"] * len(self.entries_to_update))), values)
+
+		self.entries_to_update = []
+
 	def update_bin(self):
 		# update bin
 		bin_name = frappe.db.get_value("Bin", {
@@ -147,6 +327,8 @@ class update_entries_after(object):
 		bin_doc.save(ignore_permissions=True)
 
 	def process_sle(self, sle):
+		"""Recompute the running balance at `sle`, returns True if it is the same
+		as the stored one and the entries after it need not be reposted"""
 		if (sle.serial_no and not self.via_landed_cost_voucher) or not cint(self.allow_negative_stock):
 			# validate negative stock for serialized items, fifo valuation
 			# or when negative stock is not allowed for moving average
@@ -163,7 +345,7 @@ class update_entries_after(object):
 				# assert
 				self.valuation_rate = sle.valuation_rate
 				self.qty_after_transaction = sle.qty_after_transaction
-				self.stock_queue = [[self.qty_after_transaction, self.valuation_rate]]
+				self.stock_queue = deque([[self.qty_after_transaction, self.valuation_rate]])
 				self.stock_value = flt(self.qty_after_transaction) * flt(self.valuation_rate)
 			else:
 				if self.valuation_method == "Moving Average":
@@ -185,14 +367,38 @@ class update_entries_after(object):
 
 		self.prev_stock_value = self.stock_value
 
+		if self.is_balance_unchanged(sle, stock_value_difference):
+			return self.stop_early and sle.timestamp > self.repost_from
+
 		# update current sle
 		sle.qty_after_transaction = self.qty_after_transaction
 		sle.valuation_rate = self.valuation_rate
 		sle.stock_value = self.stock_value
-		sle.stock_queue = json.dumps(self.stock_queue)
+		sle.stock_queue = dump_stock_queue(self.stock_queue)
 		sle.stock_value_difference = stock_value_difference
-		sle.doctype="Stock Ledger Entry"
-		frappe.get_doc(sle).db_update()
+		self.entries_to_update.append(sle)
+
+	def is_balance_unchanged(self, sle, stock_value_difference):
+		"""check if the running balance matches the one stored in the entry,
+		upto the precision of the database columns"""
+		for key, value in (("qty_after_transaction", self.qty_after_transaction),
+			("valuation_rate", self.valuation_rate), ("stock_value", self.stock_value),
+			("stock_value_difference", stock_value_difference)):
+			if sle.get(key) is None or flt(sle.get(key), 6) != flt(value, 6):
+				return False
+
+		if not sle.stock_queue:
+			return False
+
+		stored_queue = get_stock_queue(sle.stock_queue)
+		if len(stored_queue) != len(self.stock_queue):
+			return False
+
+		for stored_batch, batch in zip(stored_queue, self.stock_queue):
+			if flt(stored_batch[0], 6) != flt(batch[0], 6) or flt(stored_batch[1], 6) != flt(batch[1], 6):
+				return False
+
+		return True
 
 	def validate_negative_stock(self, sle):
 		"""
@@ -327,7 +533,7 @@ class update_entries_after(object):
 					if index == None:
 						new_stock_value = sum((d[0]*d[1] for d in self.stock_queue)) - qty_to_pop*outgoing_rate
 						new_stock_qty = sum((d[0] for d in self.stock_queue)) - qty_to_pop
-						self.stock_queue = [[new_stock_qty, new_stock_value/new_stock_qty if new_stock_qty > 0 else outgoing_rate]]
+						self.stock_queue = deque([[new_stock_qty, new_stock_value/new_stock_qty if new_stock_qty > 0 else outgoing_rate]])
 						break
 				else:
 					index = 0
@@ -337,7 +543,10 @@ class update_entries_after(object):
 				if qty_to_pop >= batch[0]:
 					# consume current batch
 					qty_to_pop = qty_to_pop - batch[0]
-					self.stock_queue.pop(index)
+					if index == 0:
+						self.stock_queue.popleft()
+					else:
+						del self.stock_queue[index]
 					if not self.stock_queue and qty_to_pop:
 						# stock finished, qty still remains to be withdrawn
 						# negative stock, keep in as a negative batch
@@ -367,11 +576,27 @@ class update_entries_after(object):
 		"""get previous stock ledger entry before current time-bucket"""
 		return get_stock_ledger_entries(self.args, "<", "desc", "limit 1", for_update=False)
 
-	def get_sle_after_datetime(self):
-		"""get Stock Ledger Entries after a particular datetime, for reposting"""
-		return get_stock_ledger_entries(self.previous_sle or frappe._dict({
-				"item_code": self.args.get("item_code"), "warehouse": self.args.get("warehouse") }),
-			">", "asc", for_update=True)
+	def get_sle_after_datetime(self, last_sle=None):
+		"""get Stock Ledger Entries after a particular datetime, for reposting,
+		one page at a time continuing after `last_sle`"""
+		if not last_sle:
+			return get_stock_ledger_entries(self.previous_sle or frappe._dict({
+					"item_code": self.args.get("item_code"), "warehouse": self.args.get("warehouse") }),
+				">", "asc", "limit {0}".format(self.page_length), for_update=True)
+
+		return frappe.db.sql("""select *, timestamp(posting_date, posting_time) as "timestamp"
+			from `tabStock Ledger Entry`
+			where item_code = %(item_code)s and warehouse = %(warehouse)s
+			and ifnull(is_cancelled, 'No')='No'
+			and (timestamp(posting_date, posting_time) > %(timestamp)s
+				or (timestamp(posting_date, posting_time) = %(timestamp)s and name > %(name)s))
+			order by timestamp(posting_date, posting_time) asc, name asc
+			limit {0} for update""".format(self.page_length), {
+				"item_code": self.item_code,
+				"warehouse": self.warehouse,
+				"timestamp": last_sle.timestamp,
+				"name": last_sle.name
+			}, as_dict=1)
 
 	def raise_exceptions(self):
 		deficiency = min(e["diff"] for e in self.exceptions)
@@ -4,13 +4,18 @@
 from __future__ import unicode_literals
 import frappe, erpnext
 from frappe import _
-import json
+import json, array, base64, zlib
+from collections import deque
 from frappe.utils import flt, cstr, nowdate, nowtime
 
-from six import string_types
+from six import string_types, PY2
 
 class InvalidWarehouseCompany(frappe.ValidationError): pass
 
+# FIFO queues with more layers than this are stored packed instead of as JSON
+MAX_JSON_STOCK_QUEUE_LENGTH = 100
+PACKED_STOCK_QUEUE_PREFIX = "fifo:"
+
 def get_stock_value_from_bin(warehouse=None, item_code=None):
 	values = {}
 	conditions = ""
@@ -148,6 +153,17 @@ def update_bin(args, allow_negative_stock=False, via_landed_cost_voucher=False):
 	else:
 		frappe.msgprint(_("Item {0} ignored since it is not a stock item").format(args.get("item_code")))
 
+def update_bin_in_bulk(args_list, allow_negative_stock=False, via_landed_cost_voucher=False):
+	"""Update the Bin for a list of entries of the same item and warehouse"""
+	args = args_list[0]
+	is_stock_item = frappe.db.get_value('Item', args.get("item_code"), 'is_stock_item')
+	if is_stock_item:
+		bin = get_bin(args.get("item_code"), args.get("warehouse"))
+		bin.update_stock_in_bulk(args_list, allow_negative_stock, via_landed_cost_voucher)
+		return bin
+	else:
+		frappe.msgprint(_("Item {0} ignored since it is not a stock item").format(args.get("item_code")))
+
 @frappe.whitelist()
 def get_incoming_rate(args, raise_error_if_no_rate=True):
 	"""Get Incoming Rate based on valuation method"""
@@ -163,7 +179,7 @@ def get_incoming_rate(args, raise_error_if_no_rate=True):
 		previous_sle = get_previous_sle(args)
 		if valuation_method == 'FIFO':
 			if previous_sle:
-				previous_stock_queue = json.loads(previous_sle.get('stock_queue', '[]') or '[]')
+				previous_stock_queue = get_stock_queue(previous_sle.get('stock_queue'))
 				in_rate = get_fifo_rate(previous_stock_queue, args.get("qty") or 0) if previous_stock_queue else 0
 		elif valuation_method == 'Moving Average':
 			in_rate = previous_sle.get('valuation_rate') or 0
@@ -192,6 +208,29 @@ def get_valuation_method(item_code):
 		val_method = frappe.db.get_value("Stock Settings", None, "valuation_method") or "FIFO"
 	return val_method
 
+def get_stock_queue(stock_queue):
+	"""Return the FIFO queue of a Stock Ledger Entry as a deque of [qty, rate],
+	from either its JSON or its packed form"""
+	if not stock_queue:
+		return deque()
+
+	if not stock_queue.startswith(PACKED_STOCK_QUEUE_PREFIX):
+		return deque(json.loads(stock_queue))
+
+	values = iter(array.array(str("d"),
+		zlib.decompress(base64.b64decode(stock_queue[len(PACKED_STOCK_QUEUE_PREFIX):]))))
+	return deque([list(batch) for batch in zip(values, values)])
+
+def dump_stock_queue(stock_queue):
+	"""Serialize a FIFO queue for a Stock Ledger Entry. Long queues are stored as a
+	compressed array of doubles, which is smaller and much faster to encode than JSON"""
+	if len(stock_queue) <= MAX_JSON_STOCK_QUEUE_LENGTH:
+		return json.dumps(list(stock_queue))
+
+	values = array.array(str("d"), [flt(value) for batch in stock_queue for value in batch])
+	values = values.tostring() if PY2 else values.tobytes()
+	return PACKED_STOCK_QUEUE_PREFIX + base64.b64encode(zlib.compress(values, 1)).decode()
+
 def get_fifo_rate(previous_stock_queue, qty):
 	"""get FIFO (average) Rate from Queue"""
 	if qty >= 0:
@@ -208,7 +247,7 @@ def get_fifo_rate(previous_stock_queue, qty):
 				available_qty_for_outgoing += flt(batch[0])
 				outgoing_cost += flt(batch[0]) * flt(batch[1])
 				qty_to_pop -= batch[0]
-				previous_stock_queue.pop(0)
+				previous_stock_queue.popleft()
 			else:
 				# all from current batch
 				available_qty_for_outgoing += flt(qty_to_pop)
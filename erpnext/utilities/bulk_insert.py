@@ -0,0 +1,38 @@
+# Copyright (c) 2018, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import now
+
+def bulk_insert(docs, chunk_size=500):
+	'''Insert already validated documents of the same DocType using multi-row
+	`insert` statements, instead of one `db_insert` per document.
+
+	Names must be set before calling this; child tables are not inserted.'''
+	if not docs:
+		return
+
+	doctype = docs[0].doctype
+	timestamp = now()
+
+	columns = None
+	for i in range(0, len(docs), chunk_size):
+		values = []
+		for doc in docs[i:i + chunk_size]:
+			if not doc.creation:
+				doc.creation = doc.modified = timestamp
+			if not doc.owner:
+				doc.owner = doc.modified_by = frappe.session.user
+
+			d = doc.get_valid_dict(convert_dates_to_str=True)
+			if not columns:
+				columns = list(d)
+
+			values.append([d.get(c) for c in columns])
+
+		frappe.db.sql("""insert into `tab{doctype}` ({columns}) values {values}""".format(
+			doctype=doctype,
+			columns=", ".join(["`{0}`".format(c) for c in columns]),
+			values=", ".join(["({0})".format(", ".join(["%s"] * len(columns)))] * len(values))
+		), [v for row in values for v in row])
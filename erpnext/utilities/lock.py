@@ -0,0 +1,37 @@
+# Copyright (c) 2018, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe
+
+# the lock is only changed by the worker holding it, checked by its token in one command
+extend_script = """if redis.call("get", KEYS[1]) == ARGV[1] then
+	return redis.call("expire", KEYS[1], ARGV[2])
+end
+return 0"""
+
+release_script = """if redis.call("get", KEYS[1]) == ARGV[1] then
+	return redis.call("del", KEYS[1])
+end
+return 0"""
+
+def acquire_lock(key, expires_in_sec=3600):
+	'''Set `key` in the cache only if it is not set, in one atomic command, so that
+	only one worker gets the lock. Returns the token of the worker holding the lock,
+	or None if the lock is held by another worker'''
+	cache = frappe.cache()
+	token = frappe.generate_hash(length=20)
+	if cache.set(cache.make_key(key), token, ex=expires_in_sec, nx=True):
+		return token
+
+def extend_lock(key, token, expires_in_sec=3600):
+	'''Reset the expiry of the lock if it is still held with `token`. Returns False if
+	the lock has expired or is held by another worker'''
+	cache = frappe.cache()
+	return bool(cache.eval(extend_script, 1, cache.make_key(key), token, expires_in_sec))
+
+def release_lock(key, token):
+	'''Delete the lock only if it is still held with `token`, so that a worker whose
+	lock has expired does not release the lock of another worker'''
+	cache = frappe.cache()
+	cache.eval(release_script, 1, cache.make_key(key), token)